@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the asyncio reader (overlapping reads and decoding) on a throttled file system
+
+.. module:: async read benchmark
+
+run from the package directory:
+
+    python benchmarks/bench_async.py [--records 64] [--chunk-size 4] [--latency 0.02]
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class ThrottledOpener:
+    '''
+    Stand-in of a high latency (network) file system: every read sleeps latency seconds before it
+    returns. The opener counts the bytes read and the open files, and can fail the reads at a byte
+    offset (fail_at) to test the error handling.
+    '''
+
+    def __init__(self, latency=0.02, fail_at=None):
+
+        self.latency = latency
+        self.fail_at = fail_at
+        self.bytes_read = 0
+        self.open_files = 0
+        self.max_open_files = 0
+        self._lock = threading.Lock()
+
+
+    def __call__(self, file_name, mode='rb'):
+
+        with self._lock:
+            self.open_files += 1
+            self.max_open_files = max(self.max_open_files, self.open_files)
+
+        return ThrottledFile_(self, open(file_name, mode))
+
+
+    def read(self, f, size, read):
+
+        offset = f.tell()
+        time.sleep(self.delay(offset))
+
+        if self.fail_at is not None and offset <= self.fail_at < offset + max(size, 1):
+            raise OSError('throttled read failed at byte ' + str(self.fail_at))
+
+        n = read()
+        with self._lock:
+            self.bytes_read += n if isinstance(n, int) else len(n)
+
+        return n
+
+
+    def delay(self, offset):
+        return self.latency
+
+
+    def close(self):
+
+        with self._lock:
+            self.open_files -= 1
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class ThrottledFile_:
+    '''
+    File object of a ThrottledOpener (read, readinto, seek and tell)
+    '''
+
+    def __init__(self, opener, f):
+
+        self.opener = opener
+        self.f = f
+
+
+    def read(self, size=-1):
+        return self.opener.read(self.f, size, lambda: self.f.read(size))
+
+
+    def readinto(self, buffer):
+        return self.opener.read(self.f, len(buffer), lambda: self.f.readinto(buffer))
+
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.f.seek(offset, whence)
+
+
+    def tell(self):
+        return self.f.tell()
+
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+            self.opener.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def serial_read(file_name, records, chunk_size, opener):
+    '''
+    Reference: the chunks are read and decoded one after the other
+    '''
+
+    from pyoad import read_header
+    from pyoad.input.shru_file import read_chunk_
+    from pyoad.input.help_functions_in import decode_records_
+
+    Header = read_header(file_name)
+    blocks = []
+    for r in range(0, len(records), chunk_size):
+        chunk = read_chunk_(file_name, Header, records[r:r + chunk_size], opener)
+        blocks.append(decode_records_(chunk, chunk.records, '24bit', 170, 20))
+
+    return blocks
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='asyncio reader benchmark on a throttled synthetic SHRU file')
+    parser.add_argument('--records', type=int, default=64)
+    parser.add_argument('--npts', type=int, default=4096)
+    parser.add_argument('--chunk-size', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per read')
+    parser.add_argument('--io-threads', type=int, default=8)
+    args = parser.parse_args()
+
+    from pyoad import write_synthetic, aread_data
+
+    with tempfile.TemporaryDirectory(prefix='pyoad_bench_') as tmp_dir:
+
+        file_name = os.path.join(tmp_dir, '01010000.D01')
+        write_synthetic(file_name, args.records, npts=args.npts)
+        records = list(range(args.records))
+
+        # imports and caches outside the timings
+        serial_read(file_name, records[:1], 1, None)
+        asyncio.run(aread_data(file_name, records[:1], chunk_size=1))
+
+        print('%d records x %d samples, chunks of %d records, %.0f ms per read' % 
+              (args.records, args.npts, args.chunk_size, args.latency*1e3))
+
+        t0 = time.perf_counter()
+        serial_read(file_name, records, args.chunk_size, ThrottledOpener(args.latency))
+        t_serial = time.perf_counter() - t0
+        print('    serial reads + decode : %8.3f s' % t_serial)
+
+        t0 = time.perf_counter()
+        asyncio.run(aread_data(file_name, records, chunk_size=args.chunk_size, io_threads=args.io_threads, 
+                               opener=ThrottledOpener(args.latency)))
+        t_async = time.perf_counter() - t0
+        print('    aread_data            : %8.3f s  (%.1f x)' % (t_async, t_serial/t_async))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the per record waveform decoders
+
+.. module:: decoder benchmark
+
+run from the package directory:
+
+    python benchmarks/bench_decode.py
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import timeit
+import numpy as np
+
+from pyoad.input.help_functions_in import decode_24bit_, decode_16bit_
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_24bit_loop(data_binary, chan_num, sensitivity_, gain_):
+    '''
+    Reference per sample decoder (the original implementation of read_waveforms_24bit_)
+    '''
+
+    byte_step = 3
+    pos_step = chan_num*byte_step
+
+    scaling = (2.5/(2**23)/gain_)
+    sensitivity = np.zeros(chan_num, dtype=np.float32)
+    sensitivity[:] = 10**(sensitivity_/20)
+    mPa_2_Pa = 1e-3
+
+    channel = [[] for _ in range(chan_num)]
+
+    for loc in range(0, len(data_binary), pos_step):
+
+        for c in range(0,chan_num):
+
+            d = bytearray(data_binary[loc:loc+byte_step])
+            dpoint = int.from_bytes(d, byteorder='big', signed=True) * scaling * sensitivity[c] * mPa_2_Pa
+            channel[c].append(dpoint)
+            loc+=byte_step
+
+    channels = np.zeros([chan_num, len(channel[0])], dtype=np.float32)
+
+    for c in range(0,chan_num):
+
+        channels[c] = np.asarray(channel[c], dtype=np.float32)
+
+    return channels
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_16bit_loop(data_binary, chan_num, sensitivity_, gain_):
+    '''
+    Reference per sample decoder (the original implementation of read_waveforms_16bit_)
+    '''
+
+    byte_step = 2
+    pos_step = chan_num*byte_step
+
+    scaling = (2.5/8192/gain_)
+    sensitivity = np.zeros(chan_num, dtype=np.float32)
+    sensitivity[:] = 10**(sensitivity_/20)
+    mPa_2_Pa = 1e-3
+
+    channel = [[] for _ in range(chan_num)]
+
+    for loc in range(0, len(data_binary), pos_step):
+
+        for c in range(0,chan_num):
+
+            d = bytearray(data_binary[loc:loc+byte_step])
+            dpoint = int.from_bytes(d, byteorder='big', signed=True)
+            channel[c].append(dpoint)
+            loc+=byte_step
+
+    channels = np.zeros([chan_num, len(channel[0])], dtype=np.float32)
+
+    for c in range(0,chan_num):
+
+        channels[c] = np.asarray(channel[c], dtype=np.float32)
+
+        channels[c] = channels[c]/4
+        mantissa = np.floor(channels[c])
+        gain = 4*(channels[c] - mantissa)
+        gain = 2**(3*gain)
+        channels[c] = (channels[c]/gain) * scaling * sensitivity[c] * mPa_2_Pa
+
+    return channels
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def random_record_(chan_num, npts, byte_step, seed=0):
+    '''
+    Random big-endian interleaved record data section
+    '''
+
+    rng = np.random.default_rng(seed)
+    words = rng.integers(-2**(8*byte_step-1), 2**(8*byte_step-1), size=npts*chan_num).astype('>i4')
+
+    return words.view(np.uint8).reshape(-1, 4)[:, 4-byte_step:].tobytes()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def bench_decoder(bit, chan_num=4, npts=16384, repeat=5):
+    '''
+    Times a single record with the loop and the vectorized decoders
+    '''
+
+    byte_step, decode_loop, decode = {'24bit': (3, decode_24bit_loop, decode_24bit_),
+                                      '16bit': (2, decode_16bit_loop, decode_16bit_)}[bit]
+
+    data_binary = random_record_(chan_num, npts, byte_step)
+
+    ref = decode_loop(data_binary, chan_num, 170, 20)
+    new = decode(data_binary, chan_num, 170, 20)
+    # the calibration is one precomputed factor per channel, so the loop and the vectorized
+    # decoders agree to the float32 rounding (not bit for bit)
+    error = np.max(np.abs(new - ref))/np.max(np.abs(ref))
+
+    t_loop = min(timeit.repeat(lambda: decode_loop(data_binary, chan_num, 170, 20), number=1, repeat=repeat))
+    t_vec = min(timeit.repeat(lambda: decode(data_binary, chan_num, 170, 20), number=10, repeat=repeat))/10
+
+    print('%s record, %d channels x %d samples' % (bit, chan_num, npts))
+    print('    loop       : %10.3f ms/record' % (t_loop*1e3))
+    print('    vectorized : %10.3f ms/record' % (t_vec*1e3))
+    print('    speedup    : %10.1f x   (max relative difference: %.2g)' % (t_loop/t_vec, error))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+if __name__ == '__main__':
+
+    bench_decoder('24bit')
+    bench_decoder('16bit')
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the pyoad import time
+
+.. module:: import time benchmark
+
+run from the package directory:
+
+    python benchmarks/bench_import.py [--max-seconds 0.5]
+
+Every measurement imports pyoad in a fresh interpreter. The run fails (exit code 1) if one of the
+heavy dependencies is loaded by 'import pyoad' or if the import is slower than --max-seconds.
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import sys
+import argparse
+import subprocess
+import numpy as np
+
+
+# dependencies that must only be loaded by the features that use them
+heavy_modules = ['matplotlib', 'pandas', 'obspy', 'xarray', 'tqdm', 'scipy', 'zarr', 'netCDF4']
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def import_time(module='pyoad', repeat=10):
+    '''
+    Imports a module in fresh interpreters
+
+    parameters
+    ----------
+    module: module to import. Default is pyoad
+    repeat: number of interpreters. Default is 10
+
+    Returns
+    -------
+    list of import times [s] and the heavy modules loaded by the import
+    '''
+
+    code = ('import sys, time; t0 = time.perf_counter(); import %s; t = time.perf_counter() - t0; '
+            'print(t); print(" ".join(m for m in %r if m in sys.modules))' % (module, heavy_modules))
+
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        t, loaded = (out.splitlines() + [''])[:2]
+        times.append(float(t))
+
+    return times, loaded.split()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='pyoad import time benchmark')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max-seconds', type=float, default=None, help='fail if the median import time is larger')
+    args = parser.parse_args()
+
+    numpy_times, _ = import_time('numpy', args.repeat)
+    times, loaded = import_time('pyoad', args.repeat)
+
+    print('import numpy : %8.1f ms (median of %d)' % (np.median(numpy_times)*1e3, args.repeat))
+    print('import pyoad : %8.1f ms (median of %d, numpy included)' % (np.median(times)*1e3, args.repeat))
+    print('heavy modules loaded by import pyoad:', ', '.join(loaded) or 'none')
+
+    failed = bool(loaded) or (args.max_seconds is not None and np.median(times) > args.max_seconds)
+    sys.exit(int(failed))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the streaming spectrogram against reading Streams and running scipy afterwards
+
+.. module:: spectrogram benchmark
+
+run from the package directory:
+
+    python benchmarks/bench_spectral.py [--files 8] [--records 128] [--nperseg 4096] [--workers 4]
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def stream_spectrogram(files, nperseg, overlap):
+    '''
+    Reference: read_data of every file (merged traces) and scipy.signal.spectrogram per trace
+    '''
+
+    from scipy.signal import spectrogram
+    from pyoad import read_data, ShruFile
+
+    spectra = []
+    for file_name in files:
+
+        with ShruFile(file_name) as shru:
+            records = range(len(shru))
+
+        Header, Waveforms = read_data(file_name, records, merge=True)
+        for tr in Waveforms:
+            spectra.append(spectrogram(tr.data, tr.stats.sampling_rate, nperseg=nperseg,
+                                       noverlap=int(nperseg*overlap))[2])
+
+    return spectra
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def measure(run):
+    '''
+    Returns the time and the peak traced memory of run
+    '''
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return seconds, peak
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='streaming spectrogram benchmark on synthetic SHRU files')
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--records', type=int, default=128)
+    parser.add_argument('--npts', type=int, default=4096)
+    parser.add_argument('--nperseg', type=int, default=4096)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    import io
+    import contextlib
+    from scipy import signal, fft  # imported once, outside the timings
+    from pyoad import write_synthetic, spectrogram, Metrics
+
+    tmp_dir = tempfile.mkdtemp(prefix='pyoad_bench_')
+    record_seconds = args.npts/2000
+
+    try:
+        files = []
+        for i in range(args.files):
+            file_name = os.path.join(tmp_dir, '0101%04d.D01' % i)
+            starttime = np.datetime64('2021-01-01T00:00:00') + np.timedelta64(int(i*args.records*record_seconds*1e6), 'us')
+            write_synthetic(file_name, args.records, npts=args.npts, starttime=str(starttime), seed=i)
+            files.append(file_name)
+
+        print('%d files x %d records x %d samples, nperseg %d' % (args.files, args.records, args.npts, args.nperseg))
+        print('%-32s %10s %16s' % ('method', 'time [s]', 'peak mem [MB]'))
+
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            reference = measure(lambda: stream_spectrogram(files, args.nperseg, 0.5))
+        print('%-32s %10.2f %16.1f' % ('read_data + scipy spectrogram', reference[0], reference[1]/1e6))
+
+        for workers in sorted({1, args.workers}):
+            out = os.path.join(tmp_dir, 'spectra%d.zarr' % workers)
+            result = measure(lambda: spectrogram(files, out=out, nperseg=args.nperseg, workers=workers,
+                                                 metrics=Metrics()))
+            print('%-32s %10.2f %16.1f' % ('spectrogram (workers=%d)' % workers, result[0], result[1]/1e6))
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
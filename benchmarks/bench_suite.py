@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite on synthetic SHRU files
+
+.. module:: benchmark suite
+
+run from the package directory:
+
+    python benchmarks/bench_suite.py [--bit 24bit] [--records 128] [--npts 4096] [--json results.json]
+
+Every benchmark runs in a fresh process (so the peak RSS is its own) and reports the best time,
+samples/s and the peak RSS. The stages are: header parse, record headers, per-record decode,
+full-file read, Stream assembly and MiniSEED write.
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import sys
+import json
+import shutil
+import timeit
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def bench_header_parse(file_name, bit, tmp_dir):
+    '''
+    read_header (first 1024 bytes)
+    '''
+
+    from pyoad import read_header
+
+    return lambda: read_header(file_name), 0
+
+
+def bench_record_headers(file_name, bit, tmp_dir):
+    '''
+    read_record_headers (all the record headers in one pass)
+    '''
+
+    from pyoad import read_record_headers
+
+    return lambda: read_record_headers(file_name), 0
+
+
+def bench_record_decode(file_name, bit, tmp_dir):
+    '''
+    decoder of a single record
+    '''
+
+    from pyoad import ShruFile
+    from pyoad.input.help_functions_in import decoder_
+
+    shru = ShruFile(file_name)
+    record = bytes(shru.record(0))
+    decode_ = decoder_(bit)
+
+    return lambda: decode_(record, shru.chan_num, 170, 20), shru.chan_num*shru.npts
+
+
+def bench_file_read(file_name, bit, tmp_dir):
+    '''
+    read_data of all the records (decode, demean and Stream)
+    '''
+
+    from pyoad import read_data, ShruFile
+
+    with ShruFile(file_name) as shru:
+        records, samples = range(len(shru)), len(shru)*shru.chan_num*shru.npts
+
+    return lambda: read_data(file_name, records, bit), samples
+
+
+def bench_stream_assembly(file_name, bit, tmp_dir):
+    '''
+    Stream assembly of decoded records (traces per record and merged traces)
+    '''
+
+    from obspy import Stream
+    from pyoad import ShruFile
+    from pyoad.input.help_functions_in import decode_records_, assemble_traces_
+
+    with ShruFile(file_name) as shru:
+        records = list(range(len(shru)))
+        data = decode_records_(shru, records, bit, 170, 20)
+        starttimes = shru.starttimes(records)
+        header_df = shru.header
+
+    def run():
+        Stream(traces=assemble_traces_(data, records, header_df, False, starttimes))
+        Stream(traces=assemble_traces_(data, records, header_df, True, starttimes))
+
+    return run, 2*data.size
+
+
+def bench_mseed_write(file_name, bit, tmp_dir):
+    '''
+    save2mseed of a full file (one file per channel and day)
+    '''
+
+    from pyoad import read_data, save2mseed, ShruFile
+
+    with ShruFile(file_name) as shru:
+        records = range(len(shru))
+    Header, Waveforms = read_data(file_name, records, bit)
+    out = os.path.join(tmp_dir, 'mseed')
+
+    def run():
+        shutil.rmtree(out, ignore_errors=True)
+        save2mseed(Waveforms, out, group='day')
+
+    return run, sum(tr.stats.npts for tr in Waveforms)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+benchmarks = [bench_header_parse, bench_record_headers, bench_record_decode, bench_file_read,
+              bench_stream_assembly, bench_mseed_write]
+
+
+def run_benchmark(name, file_name, bit, tmp_dir, repeat):
+    '''
+    Runs a benchmark (in a worker process) and returns its best time, samples/s and peak RSS
+    '''
+
+    import io
+    import contextlib
+
+    # the progress bars and prints of the readers are not part of the output
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        run, samples = globals()[name](file_name, bit, tmp_dir)
+        run()
+        seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*(1 if sys.platform == 'darwin' else 1024)
+
+    return {'benchmark': name[len('bench_'):],
+            'seconds': seconds,
+            'samples/s': samples/seconds if samples else None,
+            'peak_rss_MB': peak_rss/1024**2}
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='pyoad benchmark suite on a synthetic SHRU file')
+    parser.add_argument('--bit', default='24bit', choices=['24bit', '16bit', 'pseudo24bit'])
+    parser.add_argument('--records', type=int, default=128)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--npts', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--select', nargs='+', default=None, help='run only these benchmarks (e.g. file_read)')
+    parser.add_argument('--json', default=None, help='write the results to a json file')
+    args = parser.parse_args()
+
+    from pyoad import write_synthetic
+
+    tmp_dir = tempfile.mkdtemp(prefix='pyoad_bench_')
+    file_name = os.path.join(tmp_dir, '01010000.D01')
+    size = write_synthetic(file_name, args.records, args.channels, args.npts, bit=args.bit)
+
+    print('%s file, %d records x %d channels x %d samples (%.1f MB)' %
+          (args.bit, args.records, args.channels, args.npts, size/1e6))
+    print('%-18s %12s %14s %14s' % ('benchmark', 'time [ms]', 'samples/s', 'peak RSS [MB]'))
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+
+    try:
+        for bench in benchmarks:
+
+            name = bench.__name__
+            if args.select and name[len('bench_'):] not in args.select:
+                continue
+
+            with context.Pool(1) as pool:
+                result = pool.apply(run_benchmark, (name, file_name, args.bit, tmp_dir, args.repeat))
+
+            results.append(result)
+            rate = '%14.3g' % result['samples/s'] if result['samples/s'] else '%14s' % '-'
+            print('%-18s %12.3f %s %14.1f' % (result['benchmark'], result['seconds']*1e3, rate, result['peak_rss_MB']))
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'bit': args.bit, 'records': args.records, 'channels': args.channels, 'npts': args.npts,
+                       'numpy': np.__version__, 'results': results}, f, indent=2)
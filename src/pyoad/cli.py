@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: command line interface
+
+usage:
+    python -m pyoad ingest <path> --out ./Results/ --workers 8
+    python -m pyoad convert <path> --out archive.zarr --format zarr
+    python -m pyoad extract <path> --records 0:16 --out ./Results/
+    python -m pyoad spectrogram <path> --out psd.zarr --nperseg 8192 --interval 60
+    python -m pyoad info <file>
+
+installed as the 'pyoad' command (pyproject [project.scripts])
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+from .pyoad import (read_data, iter_directory, read_time_window, save2mseed, save2xarray, scan_headers, convert,
+                    list_files, read_header, read_record_headers, spectrogram, Metrics)
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def ingest_(args):
+    '''
+    Reads a SHRU deployment directory in parallel and saves it to mseed
+    '''
+
+    t0 = time.perf_counter()
+    num_files = len(list_files(args.path, args.pattern))
+    done = set()
+    written = set()
+    metrics = metrics_(args)
+
+    for file_name, Header, Waveforms in iter_directory(args.path, args.pattern, None, args.bit, args.sensitivity, 
+                                                       args.gain, args.merge, args.workers, args.records_per_task, 
+                                                       args.errors):
+        # hour and day files are appended to once they are written in this run (reruns overwrite them)
+        save2mseed(Waveforms, args.out, group_(args.group), args.encoding, append=written, metrics=metrics)
+        done.add(file_name)
+        if metrics is not None:
+            metrics.event('file', file_name=file_name, traces=len(Waveforms), seconds=time.perf_counter() - t0)
+            continue
+        log_('[%d/%d] %s - %d traces (%.1f s)' % (len(done), num_files, file_name, len(Waveforms), time.perf_counter() - t0))
+
+    if metrics is not None:
+        metrics.event('summary', files=len(done), **metrics.summary())
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def scan_(args):
+    '''
+    Scans the headers of SHRU files and writes an index file
+    '''
+
+    index = scan_headers(args.path, args.pattern, args.records, args.workers, args.index, args.errors)
+
+    print(len(index['file_name'].unique()), 'files,', len(index), 'rows ->', args.index)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def convert_(args):
+    '''
+    Converts SHRU files to a mseed or zarr archive with the streaming pipeline
+    '''
+
+    metrics = metrics_(args)
+
+    convert(args.path, args.out, args.format, args.bit, args.sensitivity, args.gain, args.chunk_size, args.pattern, 
+            args.io_threads, args.workers, args.queue_size, group_(args.group), args.encoding, args.manifest, 
+            args.watch, args.poll_interval, metrics, args.units, args.decimate, args.errors)
+
+    if metrics is not None:
+        metrics.event('summary', **metrics.summary())
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def extract_(args):
+    '''
+    Extracts records (or a time window) of SHRU files to mseed, zarr or netcdf
+    '''
+
+    if args.starttime is not None:
+
+        if args.format != 'mseed':
+            raise SystemExit('pyoad extract: time windows are written to mseed only')
+
+        if args.decimate is not None:
+            raise SystemExit('pyoad extract: time windows can not be decimated, use --records')
+
+        index = args.index or scan_headers(args.path, args.pattern, workers=args.workers, errors=args.errors)
+        Waveforms = read_time_window(index, args.starttime, args.endtime, args.channels, args.bit, args.sensitivity, 
+                                     args.gain, args.units)
+        save2mseed(Waveforms, args.out, group_(args.group), args.encoding)
+        log_('%s - %s: %d traces' % (args.starttime, args.endtime, len(Waveforms)))
+        return
+
+    output = 'stream' if args.format == 'mseed' else 'xarray'
+    files = list_files(args.path, args.pattern)
+    written = set()
+
+    if args.format == 'netcdf' and len(files) > 1:
+        raise SystemExit('pyoad extract: a netcdf file holds one input file, use --format zarr for %d files' % len(files))
+
+    for i, file_name in enumerate(files):
+
+        records = records_(args.records, file_name)
+        Header, Waveforms = read_data(file_name, records, args.bit, args.sensitivity, args.gain, args.merge, output, 
+                                      units=args.units, decimate=args.decimate)
+
+        if output == 'stream':
+            save2mseed(Waveforms, args.out, group_(args.group), args.encoding, append=written)
+        else:
+            save2xarray(Waveforms, args.out, args.format, append=i > 0)
+
+        log_('%s - records %d:%d' % (file_name, records[0], records[-1] + 1))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def spectrogram_(args):
+    '''
+    Computes the spectrogram (or interval PSDs) of SHRU files into a zarr store
+    '''
+
+    metrics = metrics_(args)
+
+    Spectra = spectrogram(args.path, args.pattern, args.out, args.nperseg, args.overlap, args.window, args.interval, 
+                          args.starttime, args.endtime, args.bit, args.sensitivity, args.gain, args.chunk_size, 
+                          args.workers, metrics)
+
+    log_('%s: %d spectra x %d channels x %d frequencies' % (args.out, Spectra.sizes['time'], Spectra.sizes['channel'], 
+                                                           Spectra.sizes['frequency']))
+
+    if metrics is not None:
+        metrics.event('summary', **metrics.summary())
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def info_(args):
+    '''
+    Prints the header (and optionally the record headers) of SHRU files
+    '''
+
+    for file_name in list_files(args.path, args.pattern):
+
+        print(file_name)
+        print(read_header(file_name).to_string(header=False))
+
+        if args.records:
+            print(read_record_headers(file_name).to_string())
+
+        print()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def records_(records, file_name):
+    '''
+    Help function that turns a 'start:stop' string into a list of records (default all records of the file)
+    '''
+
+    if records is None:
+        header_df = read_header(file_name)
+        num_records = os.path.getsize(file_name)//int(header_df.loc['reclen'].values[0])
+        return list(range(num_records))
+
+    start, _, stop = records.partition(':')
+
+    return list(range(int(start or 0), int(stop))) if stop else [int(start)]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def group_(group):
+    '''
+    Help function that maps the --group option to the save2mseed group ('record' -> None)
+    '''
+
+    return None if group == 'record' else group
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def metrics_(args):
+    '''
+    Help function that returns a Metrics object logging JSON lines to stderr for --json-log (default None)
+    '''
+
+    if not args.json_log:
+        return None
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('pyoad')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    return Metrics(log=True)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def log_(message):
+    '''
+    Help function that prints a progress line with a time stamp (flushed, for cron/SLURM logs)
+    '''
+
+    print(time.strftime('%Y-%m-%dT%H:%M:%S'), message, flush=True)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def main(argv=None):
+    '''
+    pyoad command line entry point
+    '''
+
+    parser = argparse.ArgumentParser(prog='pyoad', description='Read SHRU .D binary data files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help='read a deployment directory in parallel and save it to mseed')
+    ingest.add_argument('path', help='directory, glob pattern or file')
+    ingest.add_argument('--pattern', default='*.D*', help="glob pattern of the files in the directory (default '*.D*')")
+    ingest.add_argument('--out', default='./Results/', help='output directory (default ./Results/)')
+    ingest.add_argument('--bit', default='24bit', choices=['24bit', '16bit', 'pseudo24bit', 'auto'])
+    ingest.add_argument('--sensitivity', type=float, default=170)
+    ingest.add_argument('--gain', type=float, default=20)
+    ingest.add_argument('--merge', action='store_true', help='merge contiguous records into a single trace per channel')
+    ingest.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    ingest.add_argument('--group', default='record', choices=['record', 'hour', 'day'], 
+                        help='mseed file length (default record). hour and day files are appended to')
+    ingest.add_argument('--encoding', default=None, help='mseed encoding (default FLOAT32)')
+    ingest.add_argument('--json-log', action='store_true', help='log JSON events and timers to stderr instead of the progress')
+    ingest.add_argument('--records-per-task', type=int, default=None, help='split large files into tasks of this many records')
+    ingest.add_argument('--errors', default='warn', choices=['raise', 'warn', 'ignore'], 
+                        help='policy for files that can not be read (default warn)')
+    ingest.set_defaults(func=ingest_)
+
+    scan = subparsers.add_parser('scan', help='read only the headers of SHRU files and write an index file')
+    scan.add_argument('path', help='directory, glob pattern or file')
+    scan.add_argument('--pattern', default='*.D*', help="glob pattern of the files in the directory (default '*.D*')")
+    scan.add_argument('--index', default='index.sqlite', help='index file, .sqlite/.db or .parquet (default index.sqlite)')
+    scan.add_argument('--records', action='store_true', help='index every record header (one row per record)')
+    scan.add_argument('--workers', type=int, default=None, help='number of threads')
+    scan.add_argument('--errors', default='warn', choices=['raise', 'warn', 'ignore'], 
+                      help='policy for files that can not be read (default warn)')
+    scan.set_defaults(func=scan_)
+
+    conv = subparsers.add_parser('convert', help='convert SHRU files to a mseed or zarr archive with bounded memory')
+    conv.add_argument('path', help='directory, glob pattern or file')
+    conv.add_argument('--pattern', default='*.D*', help="glob pattern of the files in the directory (default '*.D*')")
+    conv.add_argument('--out', default='./Results/', help='output directory (mseed) or zarr store (default ./Results/)')
+    conv.add_argument('--format', default='mseed', choices=['mseed', 'zarr'])
+    conv.add_argument('--bit', default='24bit', choices=['24bit', '16bit', 'pseudo24bit', 'auto'])
+    conv.add_argument('--sensitivity', type=float, default=170)
+    conv.add_argument('--gain', type=float, default=20)
+    conv.add_argument('--chunk-size', type=int, default=16, help='records decoded and written at once (default 16)')
+    conv.add_argument('--io-threads', type=int, default=2, help='number of reading threads (default 2)')
+    conv.add_argument('--workers', type=int, default=None, help='number of decoding threads (default: all cores)')
+    conv.add_argument('--queue-size', type=int, default=4, help='chunks waiting between the stages (default 4)')
+    conv.add_argument('--group', default='day', choices=['day', 'hour', 'record'], help='mseed file length (default day)')
+    conv.add_argument('--encoding', default=None, help='mseed encoding (default FLOAT32, STEIM2 for --units counts)')
+    conv.add_argument('--units', default='Pa', choices=['Pa', 'counts'], help='Pa (float32) or raw int32 counts with the calib factor')
+    conv.add_argument('--decimate', type=int, default=None, help='decimation factor (anti-alias FIR, state kept across records)')
+    conv.add_argument('--manifest', default=None, help='manifest file (SQLite) to skip converted files and resume partial ones')
+    conv.add_argument('--watch', action='store_true', help='keep polling the inputs for new files and records (needs --manifest)')
+    conv.add_argument('--poll-interval', type=float, default=60, help='seconds between polls in watch mode (default 60)')
+    conv.add_argument('--errors', default='warn', choices=['raise', 'warn', 'ignore'], 
+                      help='policy for files whose header can not be read (default warn)')
+    conv.add_argument('--json-log', action='store_true', help='log JSON events and timers to stderr instead of the summary')
+    conv.set_defaults(func=convert_)
+
+    extract = subparsers.add_parser('extract', help='extract records or a time window to mseed, zarr or netcdf')
+    extract.add_argument('path', help='directory, glob pattern or file')
+    extract.add_argument('--pattern', default='*.D*', help="glob pattern of the files in the directory (default '*.D*')")
+    extract.add_argument('--out', default='./Results/', help='output directory (mseed), zarr store or netcdf file')
+    extract.add_argument('--format', default='mseed', choices=['mseed', 'zarr', 'netcdf'])
+    extract.add_argument('--records', default=None, help="records of every file, 'start:stop' or a single record (default all)")
+    extract.add_argument('--starttime', default=None, help='start of a time window (instead of --records)')
+    extract.add_argument('--endtime', default=None, help='end of the time window')
+    extract.add_argument('--index', default=None, help='index file for the time window (default: scan the headers)')
+    extract.add_argument('--channels', type=int, nargs='+', default=None, help='channels of the time window (default all)')
+    extract.add_argument('--bit', default='24bit', choices=['24bit', '16bit', 'pseudo24bit', 'auto'])
+    extract.add_argument('--sensitivity', type=float, default=170)
+    extract.add_argument('--gain', type=float, default=20)
+    extract.add_argument('--merge', action='store_true', help='merge contiguous records into a single trace per channel')
+    extract.add_argument('--group', default='record', choices=['record', 'hour', 'day'], 
+                         help='mseed file length (default record). hour and day files are appended to')
+    extract.add_argument('--encoding', default=None, help='mseed encoding (default FLOAT32, STEIM2 for --units counts)')
+    extract.add_argument('--units', default='Pa', choices=['Pa', 'counts'], help='Pa (float32) or raw int32 counts with the calib factor')
+    extract.add_argument('--decimate', type=int, default=None, help='decimation factor (anti-alias FIR, state kept across records)')
+    extract.add_argument('--workers', type=int, default=None, help='number of threads of the header scan')
+    extract.add_argument('--errors', default='warn', choices=['raise', 'warn', 'ignore'], 
+                         help='policy for files that can not be scanned (default warn)')
+    extract.set_defaults(func=extract_)
+
+    spec = subparsers.add_parser('spectrogram', help='spectrogram or interval PSDs of SHRU files to a zarr store')
+    spec.add_argument('path', help='directory, glob pattern or file')
+    spec.add_argument('--pattern', default='*.D*', help="glob pattern of the files in the directory (default '*.D*')")
+    spec.add_argument('--out', required=True, help='output zarr store')
+    spec.add_argument('--nperseg', type=int, default=4096, help='samples per frame (default 4096)')
+    spec.add_argument('--overlap', type=float, default=0.5, help='overlap of the frames (default 0.5)')
+    spec.add_argument('--window', default='hann', help='window of the frames (default hann)')
+    spec.add_argument('--interval', type=float, default=None, help='Welch averaging interval [s] (default: every frame)')
+    spec.add_argument('--starttime', default=None, help='start time of the records (default: first record)')
+    spec.add_argument('--endtime', default=None, help='end time of the records (default: last record)')
+    spec.add_argument('--bit', default='24bit', choices=['24bit', '16bit', 'pseudo24bit', 'auto'])
+    spec.add_argument('--sensitivity', type=float, default=170)
+    spec.add_argument('--gain', type=float, default=20)
+    spec.add_argument('--chunk-size', type=int, default=16, help='records decoded at once (default 16)')
+    spec.add_argument('--workers', type=int, default=None, help='number of files processed in parallel (default: all cores)')
+    spec.add_argument('--json-log', action='store_true', help='log JSON events and timers to stderr instead of the progress bar')
+    spec.set_defaults(func=spectrogram_)
+
+    info = subparsers.add_parser('info', help='print the header of SHRU files')
+    info.add_argument('path', help='directory, glob pattern or file')
+    info.add_argument('--pattern', default='*.D*', help="glob pattern of the files in the directory (default '*.D*')")
+    info.add_argument('--records', action='store_true', help='print the header of every record')
+    info.set_defaults(func=info_)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'extract' and args.starttime is not None and args.endtime is None:
+        parser.error('--endtime is required with --starttime')
+
+    t0 = time.perf_counter()
+    args.func(args)
+
+    if args.command != 'info':
+        log_('pyoad %s finished in %.1f s' % (args.command, time.perf_counter() - t0))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: asyncio input functions (overlapping reads and decoding on high latency file systems)
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .help_functions_in import (shru_header, header_info_, resolve_bit_, decode_records_, demean_,
+                                assemble_traces_, assemble_dataarray_)
+from .shru_file import read_chunk_
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+async def aread_data(file_name, records_range, bit='24bit', sensitivity=170, gain=20, merge=False, output='stream',
+                     chunk_size=16, max_inflight_bytes=64*1024**2, io_threads=8, executor=None, opener=None):
+    '''
+    Async version of read_data. The records are read in chunks by concurrent I/O threads
+    (up to max_inflight_bytes ahead of the decoding) and decoded in an executor,
+    so waiting on a slow (network) file system overlaps with decoding.
+
+    parameters
+    ----------
+    file_name: path to file
+    records_range: range of record sections to extact
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'.
+    sensitivity: default is 170. optional to set to different value or specify it per channel
+    gain: default sensor gain is 20
+    merge: if True, contiguous records are merged into a single trace per channel. Default is False
+    output: 'stream' (default) returns an Obspy Stream. 'xarray' returns a (channel, time) xarray DataArray
+    chunk_size: number of records per read. Default is 16
+    max_inflight_bytes: maximum number of bytes read ahead and not decoded yet. Default is 64 MB
+    io_threads: number of concurrent reads. Default is 8
+    executor: executor of the decoding. Default (None) is the event loop default executor
+    opener: callable (file_name, mode) -> file object, for example fsspec.open. Default is the builtin open
+
+    Returns
+    -------
+    Header: header structure containing the parameters names and values (Pandas DataFrame)
+    Waveforms: Obspy Stream object or xarray DataArray
+
+    Example
+    -------
+    Header, Waveforms = await aread_data(file_name, range(128))
+    '''
+
+    if output not in ('stream', 'xarray'):
+        raise ValueError("output can get 'stream' or 'xarray', not " + repr(output))
+
+    blocks = []
+    records = []
+    starttimes = []
+
+    async for data, metadata in aiter_records(file_name, records_range, bit, sensitivity, gain, chunk_size, 'array',
+                                              False, max_inflight_bytes, io_threads, executor, opener):
+        blocks.append(data)
+        records.extend(metadata['records'])
+        starttimes.extend(metadata['starttime'])
+        Header = metadata['header']
+
+    if not blocks:
+        raise ValueError('records_range is empty')
+
+    data = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+    demean_(data)
+
+    if output == 'xarray':
+        return Header, assemble_dataarray_(data, records, Header, starttimes)
+
+    from obspy import Stream
+
+    return Header, Stream(traces=assemble_traces_(data, records, Header, merge, starttimes))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+async def aiter_records(files, records_range=None, bit='24bit', sensitivity=170, gain=20, chunk_size=16,
+                        output='stream', merge=False, max_inflight_bytes=64*1024**2, io_threads=8, executor=None,
+                        opener=None):
+    '''
+    Async generator over the records of one or several SHRU files. Headers and upcoming records
+    (also of the next files) are prefetched concurrently with bounded in-flight bytes,
+    the decoding runs in an executor and the chunks are yielded in order.
+
+    parameters
+    ----------
+    files: path to file or list of files (read in the given order)
+    records_range: range of record sections to extract from every file. Default (None) is all records
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'.
+    sensitivity: default is 170. optional to set to different value or specify it per channel
+    gain: default sensor gain is 20
+    chunk_size: number of records per read and per yielded chunk. Default is 16
+    output: 'stream' yields an Obspy Stream per chunk.
+            'array' yields a numpy array [records, channels, npts] (not demeaned) and a metadata dictionary per chunk
+    merge: if True, contiguous records of a chunk are merged into a single trace per channel. Default is False
+    max_inflight_bytes: maximum number of bytes read ahead and not decoded yet. Default is 64 MB
+    io_threads: number of concurrent reads. Default is 8
+    executor: executor of the decoding. Default (None) is the event loop default executor
+    opener: callable (file_name, mode) -> file object, for example fsspec.open. Default is the builtin open
+
+    Yields
+    -------
+    Obspy Stream, or numpy array and metadata dictionary
+
+    Example
+    -------
+    async for Waveforms in aiter_records(files):
+        ...
+    '''
+
+    if output not in ('stream', 'array'):
+        raise ValueError("output can get 'stream' or 'array', not " + repr(output))
+
+    if isinstance(files, (str, os.PathLike)):
+        files = [files]
+
+    loop = asyncio.get_running_loop()
+    io_pool = ThreadPoolExecutor(max_workers=io_threads)
+    budget = ByteBudget_(max_inflight_bytes)
+    chunks = asyncio.Queue()
+    done = object()
+
+    async def prefetch():
+        try:
+            headers = [loop.run_in_executor(io_pool, read_header_, file_name, opener) for file_name in files]
+
+            for file_name, header in zip(files, headers):
+
+                header_df, num_records = await header
+                reclen = int(header_df.loc['reclen'].values[0])
+                records = list(range(num_records)) if records_range is None else list(records_range)
+
+                for run in record_runs_(records, chunk_size):
+                    await budget.acquire(len(run)*reclen)
+                    read = loop.run_in_executor(io_pool, read_chunk_, file_name, header_df, run, opener)
+                    await chunks.put((len(run)*reclen, read))
+
+        except BaseException as e:
+            await chunks.put((0, e))
+            raise
+
+        finally:
+            await chunks.put((0, done))
+
+    producer = asyncio.ensure_future(prefetch())
+
+    try:
+        while True:
+
+            size, read = await chunks.get()
+            if read is done:
+                break
+            if isinstance(read, BaseException):
+                raise read
+
+            try:
+                chunk = await read
+                data, starttimes = await loop.run_in_executor(executor, decode_chunk_, chunk, bit, sensitivity, gain)
+            finally:
+                await budget.release(size)
+
+            header_df = chunk.header
+
+            if output == 'array':
+
+                metadata = {'records': chunk.records,
+                            'starttime': starttimes,
+                            'sampling_rate': float(header_df.loc['sampling_rate'].values[0]),
+                            'network': 'SR' + str(header_df.loc['shru_num'].values[0]),
+                            'header': header_df}
+
+                yield data, metadata
+                continue
+
+            from obspy import Stream
+
+            demean_(data)
+            yield Stream(traces=assemble_traces_(data, chunk.records, header_df, merge, starttimes))
+
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except BaseException:
+            pass
+
+        # drop the reads that are still queued (and their errors)
+        while not chunks.empty():
+            size, read = chunks.get_nowait()
+            if asyncio.isfuture(read) and not read.cancel():
+                read.exception()
+
+        io_pool.shutdown(wait=False)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class ByteBudget_:
+    '''
+    Help class that bounds the number of bytes in flight between the reads and the decoding.
+    A request larger than the budget is let through when nothing else is in flight.
+    '''
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._condition = asyncio.Condition()
+
+
+    async def acquire(self, size):
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used == 0 or self.used + size <= self.max_bytes)
+            self.used += size
+
+
+    async def release(self, size):
+
+        async with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_header_(file_name, opener):
+    '''
+    Help function that reads the header and the number of records of a file through an opener
+    '''
+
+    with (opener or open)(file_name, 'rb') as f:
+        raw_header = np.frombuffer(f.read(shru_header.itemsize), dtype=shru_header)
+        size = f.seek(0, os.SEEK_END)
+
+    return header_info_(raw_header), size//int(raw_header['reclen'][0])
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def record_runs_(records, chunk_size):
+    '''
+    Help function that splits a list of records into runs of contiguous records of at most chunk_size
+    '''
+
+    runs = []
+    for record in records:
+        if runs and record == runs[-1][-1] + 1 and len(runs[-1]) < chunk_size:
+            runs[-1].append(record)
+        else:
+            runs.append([record])
+
+    return runs
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_chunk_(chunk, bit, sensitivity, gain):
+    '''
+    Help function (executor) that decodes a chunk of records and reads their start times
+    '''
+
+    data = decode_records_(chunk, chunk.records, resolve_bit_(bit, chunk.header), sensitivity, gain)
+
+    return data, chunk.starttimes(chunk.records)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: persistent cache of decoded records
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .help_functions_in import calibration_, decode_records_
+from ..metrics import metrics_
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class RecordCache:
+    '''
+    On-disk cache of decoded records (float32 [channels, npts] blocks saved as .npy files and read back
+    memory mapped) with a size limit and least recently used eviction, plus a small in-memory layer.
+    Records are keyed by the file (path, size and modification time), the record number, the bit depth,
+    the sensitivity and the gain, so a changed file or other decoding parameters never hit stale data.
+
+    parameters
+    ----------
+    directory: cache directory (created if needed)
+    max_bytes: size limit of the cache directory. Default is 2 GB
+    memory_records: number of records kept in the in-memory layer. Default is 256
+
+    Example
+    -------
+    cache = RecordCache('./cache')
+    Header, Waveforms = read_data(file_name, range(10), cache=cache)
+    '''
+
+    def __init__(self, directory, max_bytes=2*1024**3, memory_records=256):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_records = memory_records
+        self._memory = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self._entries())
+
+
+    def __len__(self):
+        return sum(1 for _ in self._entries())
+
+
+    def keys(self, file_name, records, bit, sensitivity, gain):
+        '''
+        Returns the cache keys of decoded records of a file
+        '''
+
+        stat = os.stat(file_name)
+        prefix = '|'.join([os.path.abspath(file_name), str(stat.st_size), str(stat.st_mtime_ns), bit,
+                           np.asarray(sensitivity, dtype=np.float64).tobytes().hex(),
+                           np.asarray(gain, dtype=np.float64).tobytes().hex()])
+
+        return [hashlib.blake2b((prefix + '|' + str(r)).encode(), digest_size=16).hexdigest() for r in records]
+
+
+    def get(self, key):
+        '''
+        Returns the decoded record of a key (read only, memory mapped) or None
+        '''
+
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data
+
+        path = self._path(key)
+        try:
+            data = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # the modification time is the last use of an entry (eviction order)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self._remember(key, data)
+
+        return data
+
+
+    def put(self, key, data):
+        '''
+        Stores a decoded record and evicts the least recently used records above max_bytes
+        '''
+
+        path = self._path(key)
+        tmp = path + '.' + str(os.getpid()) + '.tmp'
+
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(data, dtype=np.float32))
+        os.replace(tmp, path)
+
+        self.size += os.path.getsize(path)
+        if self.size > self.max_bytes:
+            # evict down to 90% of the limit, so a burst of new records does not rescan the directory every time
+            self.evict(0.9*self.max_bytes)
+
+        self._remember(key, np.load(path, mmap_mode='r'))
+
+
+    def evict(self, max_bytes=None):
+        '''
+        Removes the least recently used records until the cache is below max_bytes (default self.max_bytes)
+        '''
+
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+
+        for entry in entries:
+
+            if self.size <= max_bytes:
+                break
+
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+
+            self.size -= size
+            self._memory.pop(entry.name[:-len('.npy')], None)
+
+
+    def clear(self):
+        '''
+        Removes all the cached records
+        '''
+
+        for entry in self._entries():
+            os.remove(entry.path)
+
+        self._memory.clear()
+        self.size = 0
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+
+    def _entries(self):
+        return (entry for entry in os.scandir(self.directory) if entry.name.endswith('.npy'))
+
+
+    def _remember(self, key, data):
+
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.memory_records:
+            self._memory.popitem(last=False)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_cached_(shru, records, bit, sensitivity, gain, cache, progress=None, metrics=None):
+    '''
+    Help function that returns decoded records [records, channels, npts] from the cache and
+    decodes (and caches) only the missing ones. progress wraps the decoded records (default tqdm).
+    '''
+
+    from tqdm import tqdm
+
+    progress = progress or tqdm
+    metrics = metrics_(metrics)
+
+    # a calibration table is keyed by its values for this SHRU
+    sensitivity, gain = calibration_(sensitivity, gain, shru.header, shru.chan_num)
+    keys = cache.keys(shru.file_name, records, bit, sensitivity, gain)
+    data = np.empty((len(records), shru.chan_num, shru.npts), dtype=np.float32)
+
+    missing = []
+    for i, key in enumerate(keys):
+        block = cache.get(key)
+        if block is None:
+            missing.append(i)
+        else:
+            data[i] = block
+
+    metrics.add('cache_hits', len(records) - len(missing))
+    metrics.add('records_decoded', len(missing))
+    metrics.add('bytes_read', len(missing)*shru.reclen)
+
+    if missing:
+        decoded = decode_records_(shru, progress([records[i] for i in missing]), bit, sensitivity, gain)
+        for j, i in enumerate(missing):
+            data[i] = decoded[j]
+            cache.put(keys[i], decoded[j])
+
+    return data
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: decimation of the records while they are read (stateful anti-alias FIR)
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import numpy as np
+
+from .help_functions_in import calibration_, decode_records_
+from .cache import decode_cached_
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class Decimator_:
+    '''
+    Help class that decimates a continuous [channels, samples] signal block by block with a
+    zero phase anti-alias FIR (polyphase, only the kept samples are computed). The last input
+    samples are carried to the next block, so the output does not depend on the block boundaries.
+    The filter is the scipy.signal.decimate FIR (20*factor + 1 taps, hamming window, cutoff at the
+    new Nyquist frequency). The signal is extended with its first and last samples at the edges.
+
+    parameters
+    ----------
+    factor: decimation factor (integer >= 2)
+    '''
+
+    def __init__(self, factor):
+
+        from scipy.signal import firwin
+
+        self.factor = factor
+        self.taps = firwin(20*factor + 1, 1/factor, window='hamming').astype(np.float32)
+        self.delay = 10*factor          # half the filter length, a multiple of factor
+        self.buffer = None              # pending input samples [channels, samples]
+        self.offset = 0                 # input index of buffer[:, 0] (0 is the first sample)
+        self.next = 0                   # input index of the next output sample
+        self.emitted = 0                # number of output samples so far
+
+
+    def process(self, data):
+        '''
+        Decimates the next block (returns the output samples it completes)
+        '''
+
+        if self.buffer is None:
+            self.buffer = np.repeat(data[:, :1], self.delay, axis=1)
+            self.offset = -self.delay
+
+        self.buffer = np.concatenate([self.buffer, data], axis=1)
+
+        return self._emit()
+
+
+    def flush(self):
+        '''
+        Returns the remaining output samples (the end of the signal is extended with its last sample)
+        '''
+
+        if self.buffer is None:
+            return None
+
+        last = self.offset + self.buffer.shape[1] - 1
+        self.buffer = np.concatenate([self.buffer, np.repeat(self.buffer[:, -1:], self.delay, axis=1)], axis=1)
+
+        return self._emit(last)
+
+
+    def _emit(self, last=None):
+
+        from scipy.signal import upfirdn
+
+        # output n needs the inputs n - delay ... n + delay
+        available = self.offset + self.buffer.shape[1] - 1 - self.delay
+        if last is not None:
+            available = min(available, last)
+
+        count = (available - self.next)//self.factor + 1
+        if count <= 0:
+            return np.empty((self.buffer.shape[0], 0), dtype=np.float32)
+
+        # the full convolution of the segment at 2*delay + m*factor is centred on output m
+        segment = self.buffer[:, self.next - self.delay - self.offset:]
+        out = upfirdn(self.taps, segment, 1, self.factor, axis=-1)
+        out = out[:, 2*self.delay//self.factor:2*self.delay//self.factor + count].astype(np.float32)
+
+        self.next += count*self.factor
+        self.emitted += count
+
+        # inputs before the next output window are not needed any more
+        drop = self.next - self.delay - self.offset
+        self.buffer = self.buffer[:, drop:]
+        self.offset += drop
+
+        return out
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class DecimatedRuns_:
+    '''
+    Help class that decimates blocks of decoded records [records, channels, npts] as they are read.
+    The filter state is kept across records and blocks of a continuous run and a new run starts
+    at a record number or time jump. The DC offset of the first record of a run is removed from
+    the whole run (demeaning every record would add steps at the record boundaries).
+
+    parameters
+    ----------
+    factor: decimation factor (integer >= 2)
+    sampling_rate: input sampling rate [Hz]
+    '''
+
+    def __init__(self, factor, sampling_rate):
+
+        self.factor = factor
+        self.sampling_rate = sampling_rate
+        self.decimator = None
+        self.mean = None
+        self.run_start = None
+        self.expected = None
+        self.done_until = None          # every pushed sample before this time is in the returned output
+
+
+    def push(self, data, starttimes, records=None):
+        '''
+        Adds decoded records (calibrated, not demeaned) and returns the finished output segments.
+        Without record numbers (records of consecutive files) only the start times are checked.
+
+        Returns
+        -------
+        list of (starttime, numpy array [channels, samples]) segments
+        '''
+
+        segments = []
+        dt = 1/self.sampling_rate
+        npts = data.shape[-1]
+
+        if records is None:
+            records = [None]*len(starttimes)
+
+        for r, (rec_num, starttime) in enumerate(zip(records, starttimes)):
+
+            if self.expected is not None:
+                expected_rec, expected_time = self.expected
+                if (rec_num is not None and rec_num != expected_rec) or abs(starttime - expected_time) > dt/2:
+                    segments.extend(self.flush())
+
+            if self.decimator is None:
+                self.decimator = Decimator_(self.factor)
+                self.mean = data[r].mean(axis=-1, keepdims=True)
+                self.run_start = starttime
+
+            segments.extend(self._segment(self.decimator.process(data[r] - self.mean)))
+            self.expected = (None if rec_num is None else rec_num + 1, starttime + npts*dt)
+            self.done_until = self.run_start + self.decimator.next*dt
+
+        return segments
+
+
+    def flush(self):
+        '''
+        Ends the current run and returns its last output segment
+        '''
+
+        if self.decimator is None:
+            return []
+
+        segments = self._segment(self.decimator.flush())
+        self.done_until = self.expected[1]
+        self.decimator = None
+        self.expected = None
+
+        return segments
+
+
+    def _segment(self, out):
+
+        if out is None or not out.shape[1]:
+            return []
+
+        first = self.decimator.emitted - out.shape[1]
+
+        return [(self.run_start + first*self.factor/self.sampling_rate, out)]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_decimated_(shru, records_range, bit, sensitivity, gain, factor, progress=None, metrics=None, cache=None,
+                    chunk_size=16):
+    '''
+    Help function that decodes the records chunk by chunk and decimates them as they are read,
+    only one chunk of full rate data is held in memory at a time.
+
+    Returns
+    -------
+    list of (starttime, numpy array [channels, samples]) decimated segments
+    '''
+
+    progress = progress or (lambda records: records)
+
+    sensitivity, gain = calibration_(sensitivity, gain, shru.header, shru.chan_num)
+    runs = DecimatedRuns_(factor, float(shru.header.loc['sampling_rate'].values[0]))
+    segments = []
+
+    for i in progress(range(0, len(records_range), chunk_size)):
+
+        records = records_range[i:i+chunk_size]
+
+        if cache is None:
+            data = decode_records_(shru, records, bit, sensitivity, gain)
+            if metrics is not None:
+                metrics.add('records_decoded', len(records))
+                metrics.add('bytes_read', len(records)*shru.reclen)
+        else:
+            data = decode_cached_(shru, records, bit, sensitivity, gain, cache, lambda records: records, metrics)
+
+        segments.extend(runs.push(data, shru.starttimes(records), records))
+
+    segments.extend(runs.flush())
+
+    return segments
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decimation_factor_(decimate):
+    '''
+    Help function that checks the decimation factor (None or 1 is no decimation)
+    '''
+
+    if decimate is None or decimate == 1:
+        return None
+
+    if int(decimate) != decimate or decimate < 1:
+        raise ValueError('decimate needs an integer factor >= 1, not ' + repr(decimate))
+
+    return int(decimate)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decimated_traces_(segments, header_df, factor, merge=True):
+    '''
+    Help function that wraps decimated segments into obspy traces (one per channel and segment,
+    contiguous segments of a run are joined when merge is True)
+    '''
+
+    from obspy import Trace
+    from .help_functions_in import trace_template_
+
+    stats = dict(trace_template_(header_df).stats)
+    for key in ('npts', 'endtime', 'delta'):
+        stats.pop(key)
+    stats['sampling_rate'] = stats['sampling_rate']/factor
+    dt = 1/stats['sampling_rate']
+
+    # contiguous segments are joined (one copy per run)
+    runs = []
+    for starttime, data in segments:
+        if merge and runs and abs(starttime - runs[-1][0] - runs[-1][1]*dt) <= dt/2:
+            runs[-1][1] += data.shape[1]
+            runs[-1][2].append(data)
+        else:
+            runs.append([starttime, data.shape[1], [data]])
+
+    traces = []
+    for starttime, _, blocks in runs:
+
+        data = np.concatenate(blocks, axis=1) if len(blocks) > 1 else blocks[0]
+
+        for c in range(data.shape[0]):
+            stats['starttime'] = starttime
+            stats['station'] = 'CHN0'+str(c+1)
+            traces.append(Trace(data=data[c], header=stats))
+
+    return traces
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decimated_dataarray_(segments, header_df, factor):
+    '''
+    Help function that wraps decimated segments into a (channel, time) DataArray (the time
+    coordinate skips the gaps between runs)
+    '''
+
+    import xarray as xr
+    from .help_functions_in import header_attrs_
+
+    sampling_rate = float(header_df.loc['sampling_rate'].values[0])/factor
+    chan_num = int(header_df.loc['channels'].values[0])
+
+    if segments:
+        data = np.concatenate([block for _, block in segments], axis=1)
+        time = np.concatenate([starttime.ns + np.rint(np.arange(block.shape[1])*1e9/sampling_rate).astype(np.int64)
+                               for starttime, block in segments]).astype('datetime64[ns]')
+    else:
+        data = np.empty((chan_num, 0), dtype=np.float32)
+        time = np.empty(0, dtype='datetime64[ns]')
+
+    attrs = header_attrs_(header_df)
+    attrs['sampling_rate'] = sampling_rate
+    attrs['delta'] = 1/sampling_rate
+    attrs['decimation'] = factor
+    attrs['units'] = 'Pa'
+
+    coords = {'channel': ['CHN0'+str(c+1) for c in range(data.shape[0])], 'time': time}
+
+    return xr.DataArray(data, dims=('channel', 'time'), name='pressure', attrs=attrs, coords=coords)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
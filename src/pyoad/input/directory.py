@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: multi file (deployment directory) input functions
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import glob
+import itertools
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .input import read_header, iter_waveforms
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def list_files(path, pattern='*.D*'):
+    '''
+    this function lists the SHRU files of a directory.
+
+    parameters
+    ----------
+    path: directory, file or list of files
+    pattern: glob pattern of the files in a directory. Default is '*.D*' (MMddhhmm.Dss)
+
+    Returns
+    -------
+    sorted list of files
+    '''
+
+    if isinstance(path, (list, tuple)):
+        return sorted(path)
+
+    if os.path.isdir(path):
+        return sorted(f for f in glob.glob(os.path.join(path, pattern)) if os.path.isfile(f))
+
+    return sorted(glob.glob(path))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def iter_files(files, records_range=None, bit='24bit', sensitivity=170, gain=20, merge=False,
+               workers=None, records_per_task=None, errors='raise'):
+    '''
+    Generator that reads several SHRU files with a process pool.
+    The files are ordered by their start time and the results are yielded in time order.
+
+    parameters
+    ----------
+    files: list of files
+    records_range: range of record sections to extract from every file. Default (None) is all records
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'.
+    sensitivity: default is 170. optional to set to different value or specify it per channel
+    gain: default sensor gain is 20
+    merge: if True, contiguous records are merged into a single trace per channel. Default is False
+    workers: number of worker processes. Default (None) is the number of cores
+    records_per_task: split the records of a file into tasks of this size. Default (None) is one task per file
+    errors: policy for files that can not be read. Can get: 'raise' (default), 'warn' and 'ignore'
+
+    Yields
+    -------
+    file name, header data frame and Obspy Stream (per task)
+    '''
+
+    if errors not in ('raise', 'warn', 'ignore'):
+        raise ValueError("errors can get 'raise', 'warn' or 'ignore', not " + repr(errors))
+
+    tasks = []
+    for file_name, header_df in sorted(file_headers_(files, errors), key=lambda f: f[1].loc['starttime'].values[0]):
+
+        if records_range is None:
+            num_records = os.path.getsize(file_name)//int(header_df.loc['reclen'].values[0])
+            records = list(range(num_records))
+        else:
+            records = list(records_range)
+
+        step = records_per_task or max(len(records), 1)
+        for i in range(0, len(records), step):
+            tasks.append((file_name, header_df, records[i:i+step]))
+
+
+    workers = workers or os.cpu_count()
+    tasks = iter(tasks)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def submit(task):
+            file_name, header_df, records = task
+            return task, executor.submit(read_task_, file_name, header_df, records, bit, sensitivity, gain, merge)
+
+        # keep a bounded number of tasks in flight so results are consumed in order with bounded memory
+        futures = deque(submit(task) for task in itertools.islice(tasks, 2*workers))
+
+        while futures:
+
+            (file_name, header_df, records), future = futures.popleft()
+            futures.extend(submit(task) for task in itertools.islice(tasks, 1))
+
+            try:
+                stream = future.result()
+            except Exception as e:
+                error_(file_name, e, errors)
+                continue
+
+            yield file_name, header_df, stream
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_task_(file_name, header_df, records, bit, sensitivity, gain, merge):
+    '''
+    Help function that reads a set of records of a file in a worker process
+    '''
+
+    stream = next(iter_waveforms(file_name, header_df, records, bit, sensitivity, gain, 
+                                 chunk_size=len(records), merge=merge))
+
+    return stream
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def file_headers_(files, errors):
+    '''
+    Help function that reads the headers of a list of files following the errors policy
+    '''
+
+    for file_name in files:
+
+        try:
+            yield file_name, read_header(file_name)
+        except Exception as e:
+            error_(file_name, e, errors)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def error_(file_name, e, errors):
+    '''
+    Help function that applies the errors policy to a file that can not be read
+    '''
+
+    if errors == 'raise':
+        raise e
+
+    if errors == 'warn':
+        warnings.warn('skipping ' + str(file_name) + ': ' + repr(e))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
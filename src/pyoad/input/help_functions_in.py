@@ -15,15 +15,93 @@ Python module to read the .D binary data files
     GNU General Public License, Version 3
     (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
-import matplotlib.pyplot as plt
-plt.rcParams['font.size'] = '16'
-plt.rcParams['figure.dpi'] = 125
-plt.rcParams['figure.facecolor'] = 'white'
-
 
 import numpy as np
-import pandas as pd
-from obspy import  UTCDateTime, Trace
+
+# pandas, obspy and xarray are imported in the functions that use them, so importing pyoad stays fast
+
+
+#this is the structure of the shru header (1024 bytes at the beginning of every record)
+shru_header = np.dtype([
+                        ('rhkey', ('b',4)),
+                        ('date', ('>u2', 2)), 
+                        ('time', ('>u2', 2)),
+                        
+                        ('microsec', '>u2'), 
+                        ('rec', '>u2'), 
+                        ('chan', '>u2'), 
+                        
+                        ('npts', '>i4'), 
+                        ('rhfs', '>f4'), 
+                        ('unused1', ('b',2)), 
+                        ('rectime', '>i4'),
+                        
+                        ('rhlat', ('b',16)),
+                        ('rhlng', ('b',16)),
+                        
+                        ('nav120', ('>u4', 28)),
+                        ('nav115', ('>u4', 28)),
+                        ('nav110', ('>u4', 28)),
+                        
+                        ('pos', ('b',128)), 
+                        
+                        ('unused2',('b',208)),
+                        
+                        ('nav_day',  '>i2'),
+                        ('nav_hour', '>i2'),
+                        ('nav_min',  '>i2'),
+                        ('nav_sec',  '>i2'),
+                        ('lblnav_flag', '>i2'), 
+                        
+                        ('unused3', ('b', 2)),
+                        
+                        ('reclen',     '>u4'),
+                        ('acq_day',    '>i2'),
+                        ('acq_hour',   '>i2'),
+                        ('acq_min',    '>i2'),
+                        ('acq_sec',    '>i2'),
+                        ('acq_recnum', '>i2'),
+                        
+                        ('ADC_tagbyte', '>i2'),
+                        ('glitchcode', '>i2'),
+                        ('bootflag', '>i2'),
+                        
+                        ('internal_temp', ('b', 16)), 
+                        
+                        ('bat_voltage', ('b', 16)),
+                        ('bat_current', ('b', 16)), 
+                        
+                        ('status', ('b', 16)), 
+                        ('project', ('b', 16)),
+                        
+                        ('shru_num', ('b', 16)),
+                        
+                        ('vla', ('b', 16)),
+                        ('hla', ('b', 16)),
+                        
+                        ('file_name', ('b', 32) ),   #MMddhhmm.Dss
+                        
+                        ('record', ('b', 16)),
+                        ('adate', ('b', 16)),
+                        ('atime', ('b', 16)),
+                        
+                        ('file_length', '>u4'),
+                        ('total_recoreds', '>u4'),
+                        
+                        ('unused4', ('b', 2)),
+                        
+                        ('adc_mode', '>i2'),
+                        ('adc_clk_code', '>i2'),
+                        
+                        ('unused5', ('b', 2)),
+                        
+                        ('time_base', '>i4'),
+                        
+                        ('unused6', ('b', 12)),
+                        ('unused7', ('b', 12)),
+                        
+                        ('rhkeyl', ('b', 4)) 
+                                                 ])
 
 
 # -------------------------------------------------------------------------------------------------
@@ -42,21 +120,15 @@ def header_info_(raw_header):
     Header structure containing the parameters names and values
     '''
 
-
+    import pandas as pd
+    from obspy import UTCDateTime
 
     header_list = []
     header_values = []
 
 
     # shru_num
-    s_num = 0
-    for c in raw_header['shru_num'][0]:
-        try:
-            s_num += chr(c)
-        except:
-            s_num = chr(c)
-
-
+    s_num = ascii_field_(raw_header[:1], 'shru_num')[0]
     header_list.append('shru_num')
     header_values.append(int(s_num[:3]))
 
@@ -85,14 +157,7 @@ def header_info_(raw_header):
     header_values.append(dt)
 
     # starttime
-    string = 0
-    for c in raw_header['atime'][0]:
-        try:
-            string += chr(c)
-        except:
-            string = chr(c)
-
-    start_time = UTCDateTime(str(raw_header['date'][0][0]) + str(raw_header['date'][0][1]) + 'T' + string[:15])
+    start_time = UTCDateTime(ns=int(record_starttimes_(raw_header[:1]).astype(np.int64)[0]))
 
     header_list.append('starttime')
     header_values.append(start_time)
@@ -105,62 +170,19 @@ def header_info_(raw_header):
 
 
 
-    # internal_temp
-    in_temp = 0
-    for c in raw_header['internal_temp'][0]:
-        try:
-            in_temp += chr(c)
-        except:
-            in_temp = chr(c)
-            
-    header_list.append('internal_temp')
-    header_values.append(float(in_temp[:4]))
-
+    # internal_temp, bat_voltage, bat_current
+    for name, width in (('internal_temp', 4), ('bat_voltage', 4), ('bat_current', 3)):
+        header_list.append(name)
+        header_values.append(float(ascii_field_(raw_header[:1], name, width)[0]))
 
-    # bat_voltage
-    bat_volt = 0
-    for c in raw_header['bat_voltage'][0]:
-        try:
-            bat_volt += chr(c)
-        except:
-            bat_volt = chr(c)
-            
-    header_list.append('bat_voltage')
-    header_values.append(float(bat_volt[:4]))
+    # vla, hla
+    for name in ('vla', 'hla'):
+        header_list.append(name)
+        header_values.append(ascii_field_(raw_header[:1], name)[0])
 
-
-    # bat_current
-    bat_cur = 0
-    for c in raw_header['bat_current'][0]:
-        try:
-            bat_cur += chr(c)
-        except:
-            bat_cur = chr(c)
-            
-    header_list.append('bat_current')
-    header_values.append(float(bat_cur[:3]))
-
-    # vla
-    vla = 0
-    for c in raw_header['vla'][0]:
-        try:
-            vla += chr(c)
-        except:
-            vla = chr(c)
-            
-    header_list.append('vla')
-    header_values.append(vla)
-
-    # hla
-    hla = 0
-    for c in raw_header['hla'][0]:
-        try:
-            hla += chr(c)
-        except:
-            hla = chr(c)
-            
-    header_list.append('hla')
-    header_values.append(hla)
+    # adc_mode
+    header_list.append('adc_mode')
+    header_values.append(int(raw_header['adc_mode'][0]))
 
 
     header_list = pd.DataFrame(header_values, index=header_list)
@@ -176,65 +198,216 @@ def header_info_(raw_header):
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
-def read_waveforms_24bit_(file_name, header_df, record_num, sensitivity_, gain_):
+def record_headers_(raw_headers, first_record=0):
     '''
-    Help function that reads the waveforms of a SHRU 24bit .DXX acoustic binary file.
+    this function decodes the headers of all the records of a SHRU .DXX acoustic binary file 
+    in one vectorized pass into a columnar table.
     
     parameters
     ----------
-    file_name: numpy fromfile array
-    header_df: header info in a data frame object
-    record_num: record number (out of 128)
-    sensitivity: default is 170. optional to set to different value or specify it per channel
+    raw_headers: numpy structured array (shru_header) with one header per record
+    first_record: record number of the first header. Default is 0
 
     Returns
     -------
-    Header structure containing the parameters names and values
+    Pandas DataFrame with one row per record
+    '''
+
+    import pandas as pd
+
+    records = pd.DataFrame(index=pd.RangeIndex(first_record, first_record + len(raw_headers), name='record'))
+
+    records['starttime'] = record_starttimes_(raw_headers)
+    records['year'] = raw_headers['date'][:, 0].astype(np.int32)
+    records['yday'] = raw_headers['date'][:, 1].astype(np.int32)
+    records['microsec'] = raw_headers['microsec'].astype(np.int32)
+    records['rec'] = raw_headers['rec'].astype(np.int32)
+    records['acq_recnum'] = raw_headers['acq_recnum'].astype(np.int32)
+    records['channels'] = raw_headers['chan'].astype(np.int32)
+    records['npts'] = raw_headers['npts'].astype(np.int64)
+    records['sampling_rate'] = raw_headers['rhfs'].astype(np.float64)
+    records['reclen'] = raw_headers['reclen'].astype(np.int64)
+
+    records['internal_temp'] = pd.to_numeric(ascii_field_(raw_headers, 'internal_temp', 4), errors='coerce')
+    records['bat_voltage'] = pd.to_numeric(ascii_field_(raw_headers, 'bat_voltage', 4), errors='coerce')
+    records['bat_current'] = pd.to_numeric(ascii_field_(raw_headers, 'bat_current', 3), errors='coerce')
+
+    records['glitchcode'] = raw_headers['glitchcode'].astype(np.int32)
+    records['bootflag'] = raw_headers['bootflag'].astype(np.int32)
+
+    return records
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def ascii_field_(raw_headers, name, width=None):
+    '''
+    Help function that decodes an ASCII field of the headers of all records at once
+    
+    parameters
+    ----------
+    raw_headers: numpy structured array (shru_header)
+    name: name of the field
+    width: keep only the first width characters. Default (None) is the full field
+
+    Returns
+    -------
+    numpy array of str
+    '''
+
+    field = np.ascontiguousarray(raw_headers[name])
+    strings = field.view('S' + str(field.shape[-1])).reshape(len(raw_headers))
+
+    if width is not None:
+        strings = strings.astype('S' + str(width))
+
+    return np.char.decode(strings, 'latin-1')
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def record_starttimes_(raw_headers):
+    '''
+    Help function that computes the start time of all records from the date (year, day of year) 
+    and the ASCII time (HH:MM:SS.ffffff) fields
+    
+    parameters
+    ----------
+    raw_headers: numpy structured array (shru_header)
+
+    Returns
+    -------
+    numpy datetime64[ns] array
     '''
 
-    f_data = open(file_name, "rb")  # reopen the file
-    data_binary = f_data.read()
+    import pandas as pd
+
+    year = raw_headers['date'][:, 0].astype(np.int64)
+    yday = raw_headers['date'][:, 1].astype(np.int64)
+
+    days = (year - 1970).astype('datetime64[Y]').astype('datetime64[D]') + (yday - 1).astype('timedelta64[D]')
+    time = pd.to_timedelta(ascii_field_(raw_headers, 'atime', 15), errors='coerce')
 
-    pos = 1024  #skip the length of the header
-    l = int(header_df.loc['reclen'].values) #record length
-    npts = int(header_df.loc['npts'].values)
+    return days.astype('datetime64[ns]') + time.values
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def utc_starttimes_(times, records, header_df):
+    '''
+    Help function that converts record start times to UTCDateTime. 
+    Records with an unreadable time (NaT) get the nominal time (file start time + npts*delta*record)
+    
+    parameters
+    ----------
+    times: numpy datetime64[ns] array with the start time of every record
+    records: list of record numbers
+    header_df: header data frame
+
+    Returns
+    -------
+    list of UTCDateTime
+    '''
+
+    from obspy import UTCDateTime
+
+    start_time = header_df.loc['starttime'].values[0]
+    record_time = int(header_df.loc['npts'].values[0])*float(header_df.loc['delta'].values[0])
+
+    starttimes = []
+    for t, rec_num in zip(times, records):
+
+        if np.isnat(t):
+            starttimes.append(start_time + record_time*rec_num)
+        else:
+            starttimes.append(UTCDateTime(ns=int(t.astype(np.int64))))
+
+    return starttimes
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def counts_24bit_(data_binary, chan_num):
+    '''
+    Help function that reads the ADC counts of a single 24bit record in one batched operation.
+    The samples are big-endian signed 24 bit integers interleaved by channel.
+    
+    parameters
+    ----------
+    data_binary: bytes-like object with the data section of a record (without the 1024 bytes header)
+    chan_num: number of channels
+
+    Returns
+    -------
+    numpy array [channels, npts] with the counts (int32)
+    '''
 
-    chan_num = int(header_df.loc['channels'].values)
     byte_step = 3
     pos_step = chan_num*byte_step # every 3 summed into a single data point
 
-    scaling = (2.5/(2**23)/gain_)
-    sensitivity = np.zeros(chan_num, dtype=np.float32)
-    sensitivity[:] = 10**(sensitivity_/20)
-    mPa_2_Pa = 1e-3
+    raw = np.frombuffer(data_binary, dtype=np.uint8, count=(len(data_binary)//pos_step)*pos_step)
 
-    channel = [[] for _ in range(chan_num)] # Initially save data as python list and not numpy array because .append to list is much much faster. 
+    # pad every sample to 4 bytes and let the arithmetic shift do the sign extension
+    words = np.zeros([raw.size//byte_step, 4], dtype=np.uint8)
+    words[:, :byte_step] = raw.reshape(-1, byte_step)
 
-    skip = l-pos
-    if record_num==0:
-        pos1 = pos
-        pos2 = pos1 + l - pos
-    else:
-        
-        pos1 = pos + l*record_num 
-        pos2 = pos1 + l - pos
+    return (words.view('>i4').reshape(-1, chan_num).T >> 8).astype(np.int32)
 
-    for loc in range(pos1,pos2, pos_step):
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
-        for c in range(0,chan_num):
 
-            d = bytearray(data_binary[loc:loc+byte_step])
-            dpoint = int.from_bytes(d, byteorder='big', signed=True) * scaling * sensitivity[c] * mPa_2_Pa
-            channel[c].append(dpoint)
-            loc+=byte_step
 
-    channels = np.zeros([chan_num, len(channel[0])], dtype=np.float32)
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
-    for c in range(0,chan_num):
-        
-        channels[c] = np.asarray(channel[c], dtype=np.float32)
+def counts_pseudo24bit_(data_binary, chan_num):
+    '''
+    Help function that reads the ADC counts of a single pseudo 24bit record.
+    Assumed layout (not validated against a recording, the synthetic files of write_synthetic use 
+    the same layout): every sample is a big-endian 32 bit word interleaved by channel, with the 
+    signed 24 bit sample in the upper 3 bytes and an unused low byte (dropped by the shift). 
+    The header adc_mode is not checked. A recorder that keeps the sample in the lower 3 bytes 
+    (sign extended) would read 256 times too small, compare read_counts(..., bit='pseudo24bit') 
+    with the expected amplitude before relying on it.
+    
+    parameters
+    ----------
+    data_binary: bytes-like object with the data section of a record (without the 1024 bytes header)
+    chan_num: number of channels
+
+    Returns
+    -------
+    numpy array [channels, npts] with the counts (int32)
+    '''
+
+    byte_step = 4
+    pos_step = chan_num*byte_step
 
-    return channels
+    # the words are read straight from the buffer, the arithmetic shift drops the low byte and keeps the sign
+    words = np.frombuffer(data_binary, dtype='>i4', count=len(data_binary)//pos_step*chan_num)
+
+    return (words.reshape(-1, chan_num).T >> 8).astype(np.int32)
 
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
@@ -244,82 +417,320 @@ def read_waveforms_24bit_(file_name, header_df, record_num, sensitivity_, gain_)
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
-def read_waveforms_16bit_(file_name, header_df, record_num, sensitivity_, gain_):
+def counts_16bit_(data_binary, chan_num):
     '''
-    Help function that reads the waveforms of a SHRU 16bit .DXX acoustic binary file.
+    Help function that reads the raw words of a single 16bit (floating gain) record, 
+    de-interleaved with strides. Every word holds a 14 bit mantissa and a 2 bit gain code
+    (unpacked by unpack_16bit_).
     
     parameters
     ----------
-    file_name: numpy fromfile array
-    header_df: header info in a data frame object
-    record_num: record number (out of 128)
-    sensitivity: default is 170. optional to set to different vakue or specify it per channel
-    gain: default sensor gain is 20
+    data_binary: bytes-like object with the data section of a record (without the 1024 bytes header)
+    chan_num: number of channels
 
     Returns
     -------
-    Header structure containing the parameters names and values
+    numpy array [channels, npts] with the raw words (int16)
     '''
 
-    f_data = open(file_name, "rb")  # reopen the file
-    data_binary = f_data.read()
+    byte_step = 2
+    pos_step = chan_num*byte_step
 
-    pos = 1024  #skip the length of the header
-    l = int(header_df.loc['reclen'].values) #record length
-    npts = int(header_df.loc['npts'].values)
+    words = np.frombuffer(data_binary, dtype='>i2', count=len(data_binary)//pos_step*chan_num)
 
-    chan_num = int(header_df.loc['channels'].values)
-    byte_step = 2
-    pos_step = chan_num*byte_step # every 3 summed into a single data point
+    return words.reshape(-1, chan_num).T.astype(np.int16)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def unpack_16bit_(words, out):
+    '''
+    Help function that unpacks 16bit floating gain words into 16 bit counts (in place in out)
+    
+    parameters
+    ----------
+    words: numpy array of raw 16bit words
+    out: float32 numpy array of the same shape (can be words converted to float32)
+
+    Returns
+    -------
+    out
+    '''
+
+    out[...] = words
+
+    ## following Keith's code faster version
+    out /= 4
+    gain = out - np.floor(out)    # mantissa is the integer part
+    gain *= 4*3
+    np.exp2(gain, out=gain)
+    out /= gain
+
+    return out
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def calibration_(sensitivity, gain, header_df, chan_num):
+    '''
+    Help function that returns the per channel sensitivity and gain
+    
+    parameters
+    ----------
+    sensitivity: single value, one value per channel, or a calibration table (DataFrame with shru_num, channel 
+                 (1 based), sensitivity and optionally gain columns, see load_calibration)
+    gain: single value or one value per channel (replaced by the gain column of a calibration table)
+    header_df: header data frame (shru_num of the calibration table)
+    chan_num: number of channels
+
+    Returns
+    -------
+    sensitivity and gain (float64 numpy arrays [channels])
+    '''
+
+    if hasattr(sensitivity, 'columns'):
+
+        shru_num = int(header_df.loc['shru_num'].values[0])
+        rows = sensitivity[sensitivity['shru_num'] == shru_num].set_index('channel')
+        channels = list(range(1, chan_num + 1))
 
+        missing = [c for c in channels if c not in rows.index]
+        if missing:
+            raise ValueError('the calibration table has no shru_num ' + str(shru_num) + ' channels ' + str(missing))
+
+        if 'gain' in rows.columns:
+            gain = rows.loc[channels, 'gain'].to_numpy(dtype=np.float64)
+        sensitivity = rows.loc[channels, 'sensitivity'].to_numpy(dtype=np.float64)
+
+    values = []
+    for name, value in (('sensitivity', sensitivity), ('gain', gain)):
+        try:
+            values.append(np.broadcast_to(np.asarray(value, dtype=np.float64), (chan_num,)))
+        except ValueError:
+            raise ValueError(name + ' needs 1 or ' + str(chan_num) + ' (channels) values, not ' + 
+                             str(np.size(value))) from None
+
+    return values[0], values[1]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def calibration_factors_(bit, sensitivity, gain):
+    '''
+    Help function that precomputes the factor from counts to Pa of every channel
+    (full scale 2.5 V, sensor gain, sensitivity in dB re 1 V/uPa and mPa to Pa)
     
-    scaling = (2.5/8192/gain_)
-    sensitivity = np.zeros(chan_num, dtype=np.float32)
-    sensitivity[:] = 10**(sensitivity_/20)
+    parameters
+    ----------
+    bit: type of binry file. Can get: '24bit', '16bit' and 'pseudo24bit'
+    sensitivity: sensitivity of every channel
+    gain: sensor gain of every channel
+
+    Returns
+    -------
+    float32 numpy array [channels]
+    '''
+
+    full_scale = 8192 if bit == '16bit' else 2**23
     mPa_2_Pa = 1e-3
+
+    factors = 2.5/full_scale/np.asarray(gain, dtype=np.float64)
+    factors = factors*10**(np.asarray(sensitivity, dtype=np.float64)/20)*mPa_2_Pa
+
+    return factors.astype(np.float32)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def calibrate_(data, factors):
+    '''
+    Help function that multiplies a block of float counts by the per channel factors in place
+    
+    parameters
+    ----------
+    data: float32 numpy array [..., channels, npts]
+    factors: numpy array [channels] (see calibration_factors_)
+
+    Returns
+    -------
+    the calibrated data array (Pa)
+    '''
+
+    data *= np.asarray(factors, dtype=data.dtype)[:, np.newaxis]
+
+    return data
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_24bit_(data_binary, chan_num, sensitivity_, gain_):
+    '''
+    Help function that decodes the data section of a single 24bit record to Pa
     
-    channel = [[] for _ in range(chan_num)] # Initially save data as python list and not numpy array because .append to list is much much faster. 
+    parameters
+    ----------
+    data_binary: bytes-like object with the data section of a record (without the 1024 bytes header)
+    chan_num: number of channels
+    sensitivity: default is 170. optional to set to different value or specify it per channel
+    gain: default sensor gain is 20. optional to specify it per channel
+
+    Returns
+    -------
+    numpy array [channels, npts] with the data in Pa
+    '''
+
+    return decode_record_('24bit', data_binary, chan_num, sensitivity_, gain_)
 
-    skip = l-pos
-    if record_num==0:
-        pos1 = pos
-        pos2 = pos1 + l - pos
+
+def decode_pseudo24bit_(data_binary, chan_num, sensitivity_, gain_):
+    '''
+    Help function that decodes the data section of a single pseudo 24bit record to Pa (see decode_24bit_)
+    '''
+
+    return decode_record_('pseudo24bit', data_binary, chan_num, sensitivity_, gain_)
+
+
+def decode_16bit_(data_binary, chan_num, sensitivity_, gain_):
+    '''
+    Help function that decodes the data section of a single 16bit (floating gain) record to Pa (see decode_24bit_)
+    '''
+
+    return decode_record_('16bit', data_binary, chan_num, sensitivity_, gain_)
+
+
+def decode_record_(bit, data_binary, chan_num, sensitivity_, gain_):
+    '''
+    Help function that decodes a single record: counts, float32 and the per channel calibration
+    '''
+
+    sensitivity, gain = calibration_(sensitivity_, gain_, None, chan_num)
+    counts = counter_(bit)(data_binary, chan_num)
+
+    channels = np.empty(counts.shape, dtype=np.float32)
+    if bit == '16bit':
+        unpack_16bit_(counts, channels)
     else:
-        
-        pos1 = pos + l*record_num 
-        pos2 = pos1 + l - pos
+        channels[...] = counts
 
-    for loc in range(pos1,pos2, pos_step):
+    return calibrate_(channels, calibration_factors_(bit, sensitivity, gain))
 
-        for c in range(0,chan_num):
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
-            d = bytearray(data_binary[loc:loc+byte_step])
-            dpoint = int.from_bytes(d, byteorder='big', signed=True) 
-            
 
-            channel[c].append(dpoint)
-            loc+=byte_step
 
 
-    channels = np.zeros([chan_num, len(channel[0])], dtype=np.float32)
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
+def decoder_(bit):
+    '''
+    Help function that returns the record decoder for a binary file type
+    
+    parameters
+    ----------
+    bit: type of binry file. Can get: '24bit', '16bit' and 'pseudo24bit' ('auto' is resolved by resolve_bit_).
 
-    for c in range(0,chan_num):
-        
-        channels[c] = np.asarray(channel[c], dtype=np.float32)
+    Returns
+    -------
+    decoder function (data_binary, chan_num, sensitivity, gain) -> numpy array [channels, npts]
+    '''
+
+    decoders = {'24bit': decode_24bit_,
+                '16bit': decode_16bit_,
+                'pseudo24bit': decode_pseudo24bit_}
+
+    try:
+        return decoders[bit]
+    except KeyError:
+        raise ValueError('bit can get ' + ', '.join(repr(b) for b in decoders) + ', not ' + repr(bit)) from None
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def counter_(bit):
+    '''
+    Help function that returns the counts reader of a binary file type
+    
+    parameters
+    ----------
+    bit: type of binry file. Can get: '24bit', '16bit' and 'pseudo24bit'
+
+    Returns
+    -------
+    function (data_binary, chan_num) -> integer numpy array [channels, npts]
+    '''
 
-        ## following Keith's code faster version
-        channels[c] = channels[c]/4
-        mantissa = np.floor(channels[c])
-        gain = 4*(channels[c] - mantissa)
-        gain = 2**(3*gain)
-        channels[c] = (channels[c]/gain) * scaling * sensitivity[c] * mPa_2_Pa
+    decoder_(bit)  # unknown types raise the ValueError of decoder_
 
-    return channels
+    return {'24bit': counts_24bit_, '16bit': counts_16bit_, 'pseudo24bit': counts_pseudo24bit_}[bit]
 
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
+def resolve_bit_(bit, header_df):
+    '''
+    Help function that returns the type of binary file. For bit='auto' the type is detected from 
+    the number of bytes per sample, (reclen - 1024)/(npts*channels): 2 is '16bit', 3 is '24bit'
+    and 4 is 'pseudo24bit'.
+    
+    parameters
+    ----------
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'.
+    header_df: header info in a data frame object
+
+    Returns
+    -------
+    type of binary file
+    '''
+
+    if bit != 'auto':
+        return bit
+
+    reclen = int(header_df.loc['reclen'].values[0])
+    samples = int(header_df.loc['npts'].values[0])*int(header_df.loc['channels'].values[0])
+    data_bytes = reclen - shru_header.itemsize
+
+    bits = {2: '16bit', 3: '24bit', 4: 'pseudo24bit'}
+
+    if samples <= 0 or data_bytes % samples or data_bytes//samples not in bits:
+        raise ValueError('can not detect the bit depth: reclen ' + str(reclen) + ' does not fit ' + str(samples) +
+                         ' samples of 2, 3 or 4 bytes (adc_mode ' + str(header_df.loc['adc_mode'].values[0]) + ')')
+
+    return bits[data_bytes//samples]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
 
 
@@ -339,6 +750,8 @@ def trace_template_(header_df):
     Trace template
     '''
 
+    from obspy import Trace
+
     tr = Trace()
     tr.stats.network = 'SR' + str(header_df.loc['shru_num'].values[0])
     # tr.stats.station = 
@@ -355,3 +768,267 @@ def trace_template_(header_df):
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_records_(shru, records, bit, sensitivity, gain, calibrate=True):
+    '''
+    Help function that decodes several records of an open ShruFile into a single preallocated block.
+    The counts of every record are written into the block and the calibration is applied once to 
+    the whole block, with one precomputed factor per channel.
+    
+    parameters
+    ----------
+    shru: open ShruFile
+    records: list of record numbers
+    bit: type of binry file. Can get: '24bit', '16bit' and 'pseudo24bit'
+    sensitivity: default is 170. optional to set to different value, specify it per channel or 
+                 give a calibration table (see load_calibration)
+    gain: default sensor gain is 20. optional to specify it per channel
+    calibrate: if False, the raw counts are returned (int32, or the int16 words of 16bit files) 
+               and the calibration is deferred (see calibrate). Default is True
+
+    Returns
+    -------
+    numpy array [records, channels, npts] with the data in Pa (float32) or the raw counts
+    '''
+
+    counts_ = counter_(bit)
+
+    if not calibrate:
+        data = np.empty([len(records), shru.chan_num, shru.npts], dtype=np.int16 if bit == '16bit' else np.int32)
+        for r, rec_num in enumerate(records):
+            data[r] = counts_(shru.record(rec_num), shru.chan_num)
+        return data
+
+    sensitivity, gain = calibration_(sensitivity, gain, shru.header, shru.chan_num)
+    data = np.empty([len(records), shru.chan_num, shru.npts], dtype=np.float32)
+
+    for r, rec_num in enumerate(records):
+        if bit == '16bit':
+            unpack_16bit_(counts_(shru.record(rec_num), shru.chan_num), data[r])
+        else:
+            data[r] = counts_(shru.record(rec_num), shru.chan_num)
+
+    return calibrate_(data, calibration_factors_(bit, sensitivity, gain))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_counts_(shru, records, bit, sensitivity, gain):
+    '''
+    Help function that decodes several records into int32 sample counts and the per channel factor 
+    from counts to Pa (units='counts'). 16bit floating gain words become word*2**(9 - 3*gain code), 
+    the float path (word/4/2**(3*gain code), the gain code bits included as in the original decoder) 
+    in steps of 2**-11, so every gain range stays an integer and counts*calib equals the Pa samples.
+    
+    parameters
+    ----------
+    shru: open ShruFile
+    records: list of record numbers
+    bit: type of binry file. Can get: '24bit', '16bit' and 'pseudo24bit'
+    sensitivity: default is 170. optional to set to different value, specify it per channel or 
+                 give a calibration table (see load_calibration)
+    gain: default sensor gain is 20. optional to specify it per channel
+
+    Returns
+    -------
+    numpy array [records, channels, npts] with the counts (int32) and the calib factor of every channel [Pa/count]
+    '''
+
+    counts = decode_records_(shru, records, bit, None, None, calibrate=False)
+    sensitivity, gain = calibration_(sensitivity, gain, shru.header, shru.chan_num)
+    calib = calibration_factors_(bit, sensitivity, gain).astype(np.float64)
+
+    if bit == '16bit':
+        words = counts.astype(np.int32)
+        counts = words << (9 - 3*(words & 3))
+        calib /= 2**11
+
+    return counts, calib
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def demean_(data):
+    '''
+    Help function that removes the mean of every record and channel in place (along the last axis)
+    
+    parameters
+    ----------
+    data: numpy array [..., npts]
+
+    Returns
+    -------
+    the demeaned data array
+    '''
+
+    data -= data.mean(axis=-1, keepdims=True)
+
+    return data
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def assemble_traces_(data, records, header_df, merge=False, starttimes=None, calib=None):
+    '''
+    Help function that wraps a block of decoded records into obspy traces. 
+    Without merging, the traces are views of the data block (no copy). 
+    
+    parameters
+    ----------
+    data: numpy array [records, channels, npts]
+    records: list of record numbers of the data block
+    header_df: header data frame
+    merge: if True, contiguous records are merged into a single trace per channel
+    starttimes: start time of every record (from the record headers). 
+                Default (None) is the nominal time (file start time + npts*delta*record)
+    calib: factor from counts to Pa of every channel when data holds counts (stats.calib, units 'counts').
+           Default (None) is data in Pa
+
+    Returns
+    -------
+    list of obspy traces
+    '''
+
+    from obspy import Trace
+
+    tr_template = trace_template_(header_df)
+    dt = tr_template.stats.delta
+    record_time = tr_template.stats.npts*dt
+
+    if starttimes is None:
+        starttimes = [tr_template.stats.starttime + record_time*rec_num for rec_num in records]
+
+    stats = dict(tr_template.stats)
+    for key in ('npts', 'endtime', 'delta'):
+        stats.pop(key)
+
+    # runs of contiguous records [first, last), a run breaks on a record number or on a time jump
+    if merge:
+        jumps = [abs(t2 - t1 - record_time*(r2 - r1)) > dt/2 
+                 for t1, t2, r1, r2 in zip(starttimes[:-1], starttimes[1:], records[:-1], records[1:])]
+        breaks = np.flatnonzero((np.diff(records) != 1) | np.array(jumps, dtype=bool)) + 1
+        runs = zip(np.r_[0, breaks], np.r_[breaks, len(records)])
+    else:
+        runs = ((r, r+1) for r in range(len(records)))
+
+    traces = []
+    for r1, r2 in runs:
+
+        for c in range(data.shape[1]):
+
+            stats['starttime'] = starttimes[r1]
+            stats['station'] = 'CHN0'+str(c+1)
+            if calib is not None:
+                stats['calib'] = float(calib[c])
+                stats['units'] = 'counts'
+            traces.append(Trace(data=data[r1:r2, c].reshape(-1), header=stats))
+
+    return traces
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def assemble_dataarray_(data, records, header_df, starttimes, calib=None):
+    '''
+    Help function that wraps a block of decoded records into a single (channel, time) xarray DataArray
+    without creating obspy traces.
+    
+    parameters
+    ----------
+    data: numpy array [records, channels, npts]
+    records: list of record numbers of the data block
+    header_df: header data frame
+    starttimes: start time (UTCDateTime) of every record
+    calib: factor from counts to Pa of every channel when data holds counts (calib coordinate, 
+           units 'counts'). Default (None) is data in Pa
+
+    Returns
+    -------
+    xarray DataArray [channel, time] (float32 or int32) with time and record coordinates and the header as attributes
+    '''
+
+    import xarray as xr
+
+    rec_num, chan_num, npts = data.shape
+    dt = float(header_df.loc['delta'].values[0])
+
+    values = data.transpose(1, 0, 2).reshape(chan_num, rec_num*npts)
+
+    start_ns = np.array([t.ns for t in starttimes], dtype=np.int64)
+    offset_ns = np.round(np.arange(npts)*dt*1e9).astype(np.int64)
+    time = (start_ns[:, np.newaxis] + offset_ns).reshape(-1).astype('datetime64[ns]')
+
+    attrs = header_attrs_(header_df)
+    attrs['units'] = 'Pa' if calib is None else 'counts'
+
+    coords = {'channel': ['CHN0'+str(c+1) for c in range(chan_num)],
+              'time': time,
+              'record': ('time', np.repeat(np.asarray(records), npts))}
+    if calib is not None:
+        coords['calib'] = ('channel', np.asarray(calib, dtype=np.float64))
+
+    dataarray = xr.DataArray(values, dims=('channel', 'time'), name='pressure', attrs=attrs, coords=coords)
+
+    return dataarray
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def header_attrs_(header_df):
+    '''
+    Help function that converts the header to xarray attributes (plain python values and time strings)
+    
+    parameters
+    ----------
+    header_df: header data frame
+
+    Returns
+    -------
+    dictionary of attributes, with the network name
+    '''
+
+    from obspy import UTCDateTime
+
+    attrs = {}
+    for key, value in header_df[0].items():
+        if isinstance(value, UTCDateTime):
+            value = str(value)
+        elif isinstance(value, np.generic):
+            value = value.item()
+        attrs[key] = value
+
+    attrs['network'] = 'SR' + str(header_df.loc['shru_num'].values[0])
+
+    return attrs
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
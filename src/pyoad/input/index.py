@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: header-only scan and persistent index of SHRU files
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .help_functions_in import shru_header, header_info_, record_headers_
+from .directory import list_files, error_
+
+
+# columns of the index table
+index_columns_ = ['file_name', 'size', 'mtime', 'shru_num', 'channels', 'npts', 'sampling_rate', 'reclen',
+                  'num_records', 'record', 'starttime', 'endtime', 'offset']
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def scan_headers(files, pattern='*.D*', records=False, workers=None, index_file=None, errors='warn'):
+    '''
+    this function reads only the headers of SHRU files (1024 bytes per file, or per record with seek)
+    and builds an index table. The files are scanned in parallel (thread pool).
+
+    parameters
+    ----------
+    files: directory, glob pattern or list of files
+    pattern: glob pattern of the files in a directory. Default is '*.D*' (MMddhhmm.Dss)
+    records: if True, the header of every record is read and the index has one row per record.
+             Default is False (one row per file, nominal record times)
+    workers: number of threads. Default (None) is the number of cores + 4 (ThreadPoolExecutor default)
+    index_file: if given, the index is saved to this file (.sqlite/.db or .parquet)
+    errors: policy for files that can not be read. Can get: 'raise', 'warn' (default) and 'ignore'
+
+    Returns
+    -------
+    Pandas DataFrame with one row per file (or per record): file_name, size, mtime, shru_num, channels,
+    npts, sampling_rate, reclen, num_records, record (-1 for per file rows), starttime, endtime, 
+    offset (byte offset of the record)
+    '''
+
+    import pandas as pd
+
+    if errors not in ('raise', 'warn', 'ignore'):
+        raise ValueError("errors can get 'raise', 'warn' or 'ignore', not " + repr(errors))
+
+    # a missing Parquet engine fails before the scan
+    if index_file is not None and str(index_file).endswith('.parquet'):
+        parquet_engine_()
+
+    def scan(file_name):
+        try:
+            return scan_file_(file_name, records)
+        except Exception as e:
+            error_(file_name, e, errors)
+
+    files = list_files(files, pattern)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        tables = [table for table in executor.map(scan, files) if table is not None]
+
+    if tables:
+        index = pd.concat(tables, ignore_index=True)
+        index = index.sort_values(['starttime', 'file_name', 'record'], kind='stable', ignore_index=True)
+    else:
+        index = pd.DataFrame(columns=index_columns_)
+
+    if index_file is not None:
+        save_index(index, index_file)
+
+    return index
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def save_index(index, index_file):
+    '''
+    this function saves an index table to a SQLite (.sqlite, .db) or Parquet (.parquet) file
+
+    parameters
+    ----------
+    index: index table (see scan_headers)
+    index_file: path to file
+
+    Returns
+    -------
+    Nothing
+    '''
+
+    if str(index_file).endswith('.parquet'):
+        parquet_engine_()
+        index.to_parquet(index_file, index=False)
+        return
+
+    # times are stored as int64 nanoseconds (exact and sortable)
+    index = index.copy()
+    for column in ('starttime', 'endtime'):
+        index[column] = index[column].values.astype('datetime64[ns]').astype(np.int64)
+
+    with sqlite3.connect(index_file) as con:
+        index.to_sql('records', con, if_exists='replace', index=False)
+        con.execute('CREATE INDEX IF NOT EXISTS records_time ON records (starttime, endtime)')
+
+    con.close()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def load_index(index_file):
+    '''
+    this function loads an index table saved by scan_headers/save_index
+
+    parameters
+    ----------
+    index_file: path to file (.sqlite, .db or .parquet)
+
+    Returns
+    -------
+    Pandas DataFrame index table
+    '''
+
+    import pandas as pd
+
+    if str(index_file).endswith('.parquet'):
+        parquet_engine_()
+        return pd.read_parquet(index_file)
+
+    with sqlite3.connect(index_file) as con:
+        index = pd.read_sql('SELECT * FROM records', con)
+
+    con.close()
+
+    for column in ('starttime', 'endtime'):
+        index[column] = pd.to_datetime(index[column], unit='ns')
+
+    return index
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def query_index(index, starttime, endtime):
+    '''
+    this function selects the rows (files or records) of an index that overlap a time window
+
+    parameters
+    ----------
+    index: index table, or path to an index file
+    starttime: start of the time window (UTCDateTime, datetime or string)
+    endtime: end of the time window (UTCDateTime, datetime or string)
+
+    Returns
+    -------
+    Pandas DataFrame with the selected rows
+    '''
+
+    import pandas as pd
+
+    if not isinstance(index, pd.DataFrame):
+        index = load_index(index)
+
+    starttime = np.datetime64(str(starttime).rstrip('Z'), 'ns')
+    endtime = np.datetime64(str(endtime).rstrip('Z'), 'ns')
+
+    selected = (index['starttime'].values < endtime) & (index['endtime'].values > starttime)
+
+    return index[selected]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def query_records(index, starttime, endtime):
+    '''
+    this function finds the records that cover a time window. 
+    Per file rows (record = -1) are expanded to their records using the nominal record times.
+
+    parameters
+    ----------
+    index: index table, or path to an index file
+    starttime: start of the time window (UTCDateTime, datetime or string)
+    endtime: end of the time window (UTCDateTime, datetime or string)
+
+    Returns
+    -------
+    Pandas DataFrame with one row per record, in time order
+    '''
+
+    import pandas as pd
+
+    rows = query_index(index, starttime, endtime)
+
+    per_file = rows[rows['record'] < 0]
+    if len(per_file) == 0:
+        return rows
+
+    starttime = np.datetime64(str(starttime).rstrip('Z'), 'ns')
+    endtime = np.datetime64(str(endtime).rstrip('Z'), 'ns')
+
+    expanded = []
+    for _, row in per_file.iterrows():
+
+        record_time = np.timedelta64(int(round(row['npts']/row['sampling_rate']*1e9)), 'ns')
+        r1 = max(0, int((starttime - row['starttime'].to_datetime64())//record_time))
+        r2 = min(int(row['num_records']), int(-((row['starttime'].to_datetime64() - endtime)//record_time)))
+
+        records = pd.DataFrame([row]*(r2 - r1)).reset_index(drop=True)
+        records['record'] = np.arange(r1, r2)
+        records['starttime'] = row['starttime'] + records['record']*record_time
+        records['endtime'] = records['starttime'] + record_time
+        records['offset'] = records['record']*row['reclen']
+        expanded.append(records)
+
+    rows = pd.concat([rows[rows['record'] >= 0]] + expanded, ignore_index=True)
+
+    return rows.sort_values(['starttime', 'file_name', 'record'], kind='stable', ignore_index=True)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def scan_file_(file_name, records):
+    '''
+    Help function that reads the header (and optionally every record header) of a single file
+    '''
+
+    import pandas as pd
+
+    size = os.path.getsize(file_name)
+    mtime = os.path.getmtime(file_name)
+
+    with open(file_name, 'rb') as f:
+
+        raw_header = np.frombuffer(f.read(shru_header.itemsize), dtype=shru_header)
+        header_df = header_info_(raw_header)
+
+        reclen = int(raw_header['reclen'][0])
+        num_records = size//reclen
+
+        if records:
+            raw_headers = bytearray()
+            for rec_num in range(num_records):
+                f.seek(rec_num*reclen)
+                raw_headers += f.read(shru_header.itemsize)
+            raw_headers = np.frombuffer(raw_headers, dtype=shru_header)
+
+    npts = int(raw_header['npts'][0])
+    record_time = np.timedelta64(int(round(npts*float(header_df.loc['delta'].values[0])*1e9)), 'ns')
+
+    if records:
+        table = record_headers_(raw_headers)[['starttime']].reset_index()
+        table['endtime'] = table['starttime'] + record_time
+        table['offset'] = table['record']*reclen
+    else:
+        starttime = np.datetime64(header_df.loc['starttime'].values[0].datetime, 'ns')
+        table = pd.DataFrame({'record': [-1],
+                              'starttime': [starttime],
+                              'endtime': [starttime + num_records*record_time],
+                              'offset': [0]})
+
+    table['file_name'] = os.path.abspath(file_name)
+    table['size'] = size
+    table['mtime'] = mtime
+    table['shru_num'] = int(header_df.loc['shru_num'].values[0])
+    table['channels'] = int(header_df.loc['channels'].values[0])
+    table['npts'] = npts
+    table['sampling_rate'] = float(header_df.loc['sampling_rate'].values[0])
+    table['reclen'] = reclen
+    table['num_records'] = num_records
+
+    return table[index_columns_]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def parquet_engine_():
+    '''
+    Help function that checks that pandas can read and write Parquet files (pyarrow or fastparquet)
+    '''
+
+    from importlib.util import find_spec
+
+    if find_spec('pyarrow') is None and find_spec('fastparquet') is None:
+        raise ImportError("Parquet index files need pyarrow (pip install 'pyoad[parquet]') or fastparquet, "
+                          "or use a .sqlite index file")
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -17,11 +17,13 @@ Python module to read the .D binary data files
 """
 
 import numpy as np
-import pandas as pd
-from tqdm import tqdm
 
-from obspy import read_inventory, read,  UTCDateTime, Stream, Trace
-from .help_functions_in import header_info_, read_waveforms_24bit_, read_waveforms_16bit_, trace_template_
+from .help_functions_in import (shru_header, header_info_, resolve_bit_, decoder_, decode_records_, decode_counts_, demean_, 
+                                assemble_traces_, assemble_dataarray_)
+from .shru_file import ShruFile
+from .cache import RecordCache, decode_cached_
+from .decimate import DecimatedRuns_, read_decimated_, decimation_factor_, decimated_traces_, decimated_dataarray_
+from ..metrics import metrics_
 
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
@@ -41,90 +43,8 @@ def read_header(file_name):
 
 
 
-    #this is the structure of the shru header
-    shru_header = np.dtype([
-                            ('rhkey', ('b',4)),
-                            ('date', ('>u2', 2)), 
-                            ('time', ('>u2', 2)),
-                            
-                            ('microsec', '>u2'), 
-                            ('rec', '>u2'), 
-                            ('chan', '>u2'), 
-                            
-                            ('npts', '>i4'), 
-                            ('rhfs', '>f4'), 
-                            ('unused1', ('b',2)), 
-                            ('rectime', '>i4'),
-                            
-                            ('rhlat', ('b',16)),
-                            ('rhlng', ('b',16)),
-                            
-                            ('nav120', ('>u4', 28)),
-                            ('nav115', ('>u4', 28)),
-                            ('nav110', ('>u4', 28)),
-                            
-                            ('pos', ('b',128)), 
-                            
-                            ('unused2',('b',208)),
-                            
-                            ('nav_day',  '>i2'),
-                            ('nav_hour', '>i2'),
-                            ('nav_min',  '>i2'),
-                            ('nav_sec',  '>i2'),
-                            ('lblnav_flag', '>i2'), 
-                            
-                            ('unused3', ('b', 2)),
-                            
-                            ('reclen',     '>u4'),
-                            ('acq_day',    '>i2'),
-                            ('acq_hour',   '>i2'),
-                            ('acq_min',    '>i2'),
-                            ('acq_sec',    '>i2'),
-                            ('acq_recnum', '>i2'),
-                            
-                            ('ADC_tagbyte', '>i2'),
-                            ('glitchcode', '>i2'),
-                            ('bootflag', '>i2'),
-                            
-                            ('internal_temp', ('b', 16)), 
-                            
-                            ('bat_voltage', ('b', 16)),
-                            ('bat_current', ('b', 16)), 
-                            
-                            ('status', ('b', 16)), 
-                            ('project', ('b', 16)),
-                            
-                            ('shru_num', ('b', 16)),
-                            
-                            ('vla', ('b', 16)),
-                            ('hla', ('b', 16)),
-                            
-                            ('file_name', ('b', 32) ),   #MMddhhmm.Dss
-                            
-                            ('record', ('b', 16)),
-                            ('adate', ('b', 16)),
-                            ('atime', ('b', 16)),
-                            
-                            ('file_length', '>u4'),
-                            ('total_recoreds', '>u4'),
-                            
-                            ('unused4', ('b', 2)),
-                            
-                            ('adc_mode', '>i2'),
-                            ('adc_clk_code', '>i2'),
-                            
-                            ('unused5', ('b', 2)),
-                            
-                            ('time_base', '>i4'),
-                            
-                            ('unused6', ('b', 12)),
-                            ('unused7', ('b', 12)),
-                            
-                            ('rhkeyl', ('b', 4)) 
-                                                     ])
-
-    # reading the header
-    header_raw = np.fromfile(file_name, dtype=shru_header)
+    # reading the header (only the first 1024 bytes)
+    header_raw = np.fromfile(file_name, dtype=shru_header, count=1)
     header_df = header_info_(header_raw)
 
 
@@ -138,65 +58,329 @@ def read_header(file_name):
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
-def read_waveforms(file_name, header_df, records_range, bit, sensitivity, gain):
+def read_record_headers(file_name):
+    '''
+    this function reads the headers of all the records of a SHRU .DXX acoustic binary file 
+    in one vectorized pass.
+    
+    parameters
+    ----------
+    file_name: path to file
+
+    Returns
+    -------
+    Pandas DataFrame with one row per record (starttime, year, yday, microsec, rec, 
+    internal_temp, bat_voltage, bat_current, ...)
+    '''
+
+    with ShruFile(file_name) as shru:
+        record_df = shru.record_headers
+
+
+    return record_df
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_waveforms(file_name, header_df, records_range, bit, sensitivity, gain, merge=False, output='stream', cache=None,
+                   metrics=None, units='Pa', decimate=None):
     '''
     This function reads the waveforms of a SHRU 24bit .DXX acoustic binary file. 
     One SHRU file nominally contains 128 records, specify a record number 
-    So far the functions reads only the first record of the first channel. 
+    The file is opened once and the records are decoded from a memory map.
     
     
     parameters
     ----------
-    file_name: path to file
+    file_name: path to file or an open ShruFile
     header_df: header info in a data frame object
     records_range: range of record sections to extract
-    bit: type of binry file. Can get: '24bit', and '16bit'. Default is for 24. Still need to add the pseudo 24 bit.
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
     sensitivity: default is 170. optional to set to different value or specify it per channel
     gain: default sensor gain is 20
+    merge: if True, contiguous records are merged into a single trace per channel. Default is False
+    output: 'stream' (default) returns an Obspy Stream. 'xarray' returns a single (channel, time) 
+            float32 xarray DataArray without creating obspy traces
+    cache: RecordCache (or cache directory) of decoded records. Default (None) is no cache
+    metrics: Metrics object that collects the timers and counters instead of the printed progress. Default is None
+    units: 'Pa' (default) float32 demeaned data in Pa. 'counts' int32 raw counts (not demeaned) with 
+           the factor to Pa of every channel in tr.stats.calib (or the calib coordinate of a DataArray)
+    decimate: integer decimation factor. The records are low pass filtered (anti-alias FIR) and decimated 
+              while they are read, with the filter state carried across records, so only the reduced 
+              rate data are kept. Contiguous records are merged and the DC offset of the first record 
+              of a continuous run is removed from the run. Default (None) is no decimation
 
     Returns
     -------
-    numpy array with the data
+    Obspy Stream object or xarray DataArray
+    '''
+
+    from tqdm import tqdm
+    from obspy import Stream
+
+    if output not in ('stream', 'xarray'):
+        raise ValueError("output can get 'stream' or 'xarray', not " + repr(output))
+
+    if units not in ('Pa', 'counts'):
+        raise ValueError("units can get 'Pa' or 'counts', not " + repr(units))
+
+    if units == 'counts' and cache is not None:
+        raise ValueError("the cache holds data in Pa, it can not be used with units='counts'")
+
+    factor = decimation_factor_(decimate)
+    if factor and units == 'counts':
+        raise ValueError("decimated data are filtered, they can not be read with units='counts'")
+
+    if not isinstance(file_name, ShruFile):
+        with ShruFile(file_name) as shru:
+            return read_waveforms(shru, header_df, records_range, bit, sensitivity, gain, merge, output, cache, metrics, 
+                                  units, decimate)
+
+    records_range = list(records_range)
+    bit = resolve_bit_(bit, header_df)
+    decoder_(bit)  # unknown types fail before the progress is printed
+
+    # with a metrics object the progress is reported as events instead of printed
+    metrics = metrics_(metrics)
+    progress = (lambda records: records) if metrics.enabled else tqdm
+
+    if not metrics.enabled:
+        print('Reading waveforms - shru', int(header_df.loc['shru_num'].values[0]))
+
+    if factor:
+        return read_decimated_waveforms_(file_name, header_df, records_range, bit, sensitivity, gain, output, cache,
+                                         metrics, progress, factor)
+
+    calib = None
+
+    with metrics.timer('decode'):
+        if units == 'counts':
+            data, calib = decode_counts_(file_name, progress(records_range), bit, sensitivity, gain)
+            metrics.add('records_decoded', len(records_range))
+            metrics.add('bytes_read', len(records_range)*file_name.reclen)
+        elif cache is None:
+            data = decode_records_(file_name, progress(records_range), bit, sensitivity, gain)
+            metrics.add('records_decoded', len(records_range))
+            metrics.add('bytes_read', len(records_range)*file_name.reclen)
+        else:
+            if not isinstance(cache, RecordCache):
+                cache = RecordCache(cache)
+            data = decode_cached_(file_name, records_range, bit, sensitivity, gain, cache, progress, metrics)
+
+        if calib is None:
+            demean_(data)
+
+    with metrics.timer('assemble'):
+
+        starttimes = file_name.starttimes(records_range)
+
+        if output == 'xarray':
+            waveforms = assemble_dataarray_(data, records_range, header_df, starttimes, calib)
+        else:
+            waveforms = Stream(traces=assemble_traces_(data, records_range, header_df, merge, starttimes, calib))
+
+    metrics.event('read', file_name=file_name.file_name, records=len(records_range), samples=int(data.size))
+
+
+    return waveforms
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_decimated_waveforms_(shru, header_df, records_range, bit, sensitivity, gain, output, cache, metrics, progress,
+                              factor):
     '''
+    Help function of read_waveforms that decimates the records while they are read
+    '''
+
+    from obspy import Stream
+
+    if cache is not None and not isinstance(cache, RecordCache):
+        cache = RecordCache(cache)
+
+    with metrics.timer('decode'):
+        segments = read_decimated_(shru, records_range, bit, sensitivity, gain, factor, progress, metrics, cache)
+
+    with metrics.timer('assemble'):
+        if output == 'xarray':
+            waveforms = decimated_dataarray_(segments, header_df, factor)
+        else:
+            waveforms = Stream(traces=decimated_traces_(segments, header_df, factor))
+
+    metrics.event('read', file_name=shru.file_name, records=len(records_range), 
+                  samples=int(sum(block.size for _, block in segments)), decimation=factor)
+
+    return waveforms
 
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def iter_waveforms(file_name, header_df, records_range, bit, sensitivity, gain, chunk_size=1, output='stream', merge=False,
+                   decimate=None):
+    '''
+    Generator that decodes the waveforms of a SHRU .DXX acoustic binary file chunk by chunk.
+    Only one chunk of records is held in memory at a time.
+    
     
-    tr_template = trace_template_(header_df)
-    num_points = int(header_df.loc['npts'].values)
-    dt = float(header_df.loc['delta'].values)
-    chan_num = int(header_df.loc['channels'].values)
-    stream = Stream()
+    parameters
+    ----------
+    file_name: path to file or an open ShruFile
+    header_df: header info in a data frame object
+    records_range: range of record sections to extract
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'.
+    sensitivity: default is 170. optional to set to different value or specify it per channel
+    gain: default sensor gain is 20
+    chunk_size: number of records in every yielded chunk. Default is 1
+    output: 'stream' yields an Obspy Stream per chunk. 
+            'array' yields a numpy array [records, channels, npts] (not demeaned) and a metadata dictionary per chunk
+    merge: if True, contiguous records of a chunk are merged into a single trace per channel. Default is False
+    decimate: integer decimation factor. Every chunk is low pass filtered and decimated with the filter state 
+              carried from the previous chunk (no edge effects at the chunk boundaries). A chunk yields the 
+              decimated samples it completes, one trace per channel and continuous segment ('array' yields a 
+              list of (starttime, [channels, samples]) segments). The last samples are yielded after the 
+              last chunk. Default (None) is no decimation
+
+    Yields
+    -------
+    Obspy Stream, or numpy array and metadata dictionary
+    '''
+
+    from obspy import Stream
+
+    if output not in ('stream', 'array'):
+        raise ValueError("output can get 'stream' or 'array', not " + repr(output))
+
+    if not isinstance(file_name, ShruFile):
+        with ShruFile(file_name) as shru:
+            yield from iter_waveforms(shru, header_df, records_range, bit, sensitivity, gain, chunk_size, output, merge,
+                                      decimate)
+        return
+
+    shru = file_name
+    bit = resolve_bit_(bit, header_df)
+    records_range = list(records_range)
+
+    factor = decimation_factor_(decimate)
+    if factor:
+        yield from iter_decimated_(shru, header_df, records_range, bit, sensitivity, gain, chunk_size, output, factor)
+        return
+
+
+    for i in range(0, len(records_range), chunk_size):
+
+        records = records_range[i:i+chunk_size]
+        data = decode_records_(shru, records, bit, sensitivity, gain)
+        starttimes = shru.starttimes(records)
+
+        if output == 'array':
+
+            metadata = {'records': records,
+                        'starttime': starttimes,
+                        'sampling_rate': float(header_df.loc['sampling_rate'].values[0]),
+                        'network': 'SR' + str(header_df.loc['shru_num'].values[0]),
+                        'header': header_df}
+
+            yield data, metadata
+            continue
 
+        demean_(data)
+        stream = Stream(traces=assemble_traces_(data, records, header_df, merge, starttimes))
+
+        yield stream
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
 
-    if bit == '24bit':
-        read_waveforms_ = read_waveforms_24bit_
 
-    elif bit == '16bit':
-        read_waveforms_ = read_waveforms_16bit_
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
+def iter_decimated_(shru, header_df, records_range, bit, sensitivity, gain, chunk_size, output, factor):
+    '''
+    Help generator of iter_waveforms that decimates the chunks with one filter state
+    '''
 
+    from obspy import Stream
 
-    print('Reading waveforms - shru', int(header_df.loc['shru_num'].values))
-    for rec_num in tqdm(records_range):
+    sampling_rate = float(header_df.loc['sampling_rate'].values[0])
+    runs = DecimatedRuns_(factor, sampling_rate)
 
-        channels = read_waveforms_(file_name, header_df, rec_num, sensitivity, gain)
+    def chunk_output(segments):
 
-        for c in range(0,chan_num):
+        if output == 'array':
+            metadata = {'sampling_rate': sampling_rate/factor,
+                        'decimation': factor,
+                        'network': 'SR' + str(header_df.loc['shru_num'].values[0]),
+                        'header': header_df}
+            return segments, metadata
 
-            tr = tr_template.copy()
-            tr.stats.starttime = tr.stats.starttime + num_points*dt*rec_num
-            tr.stats.station = 'CHN0'+str(c+1)
-            tr.data = channels[c]
-            tr.detrend('demean')
+        return Stream(traces=decimated_traces_(segments, header_df, factor))
+
+    for i in range(0, len(records_range), chunk_size):
+
+        records = records_range[i:i+chunk_size]
+        data = decode_records_(shru, records, bit, sensitivity, gain)
+
+        yield chunk_output(runs.push(data, shru.starttimes(records), records))
+
+    yield chunk_output(runs.flush())
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
-            stream = stream + tr
 
 
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def load_calibration(file_name):
+    '''
+    This function loads a calibration table (csv) with one row per SHRU and channel. 
+    The table can be given as the sensitivity of the read functions, every file is then 
+    calibrated with the sensitivity (and gain) of its SHRU number and channels.
+    
+    parameters
+    ----------
+    file_name: csv file with shru_num, channel (1 based), sensitivity [dB] and optionally gain columns
+
+    Returns
+    -------
+    calibration table (Pandas DataFrame)
+
+    Example
+    -------
+    calibration = load_calibration('calibration.csv')
+    Header, Waveforms = read_data(file_name, range(128), sensitivity=calibration)
+    '''
+
+    import pandas as pd
 
+    table = pd.read_csv(file_name, skipinitialspace=True)
 
+    missing = {'shru_num', 'channel', 'sensitivity'} - set(table.columns)
+    if missing:
+        raise ValueError(file_name + ' has no ' + ', '.join(sorted(missing)) + ' columns')
 
+    if table.duplicated(['shru_num', 'channel']).any():
+        raise ValueError(file_name + ' has more than one row for a shru_num and channel')
 
-    return stream
+    return table
 
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
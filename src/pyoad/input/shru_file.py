@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: memory mapped SHRU file reader
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import mmap
+import numpy as np
+
+from .help_functions_in import shru_header, header_info_, record_headers_, utc_starttimes_
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class ShruFile:
+    '''
+    SHRU .DXX acoustic binary file opened once and memory mapped.
+    The header is parsed from the first 1024 bytes and the records are handed out as zero-copy views.
+
+    parameters
+    ----------
+    file_name: path to file
+
+    Example
+    -------
+    with ShruFile(file_name) as shru:
+        data = shru.record(0)
+    '''
+
+    header_size = shru_header.itemsize
+
+    def __init__(self, file_name):
+
+        self.file_name = file_name
+        self._file = open(file_name, 'rb')
+
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            self._file.close()
+            raise
+
+        self.header_raw = np.frombuffer(self._mmap[:self.header_size], dtype=shru_header)
+        self.header = header_info_(self.header_raw)
+
+        self.reclen = int(self.header_raw['reclen'][0])
+        self.npts = int(self.header_raw['npts'][0])
+        self.chan_num = int(self.header_raw['chan'][0])
+        self.num_records = len(self._mmap)//self.reclen
+        self._record_headers = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __len__(self):
+        return self.num_records
+
+
+    def record(self, record_num):
+        '''
+        Returns a zero-copy view of the data section (without the 1024 bytes header) of a record
+
+        parameters
+        ----------
+        record_num: record number (out of 128)
+
+        Returns
+        -------
+        memoryview of the record data
+        '''
+
+        if record_num < 0 or record_num >= self.num_records:
+            raise IndexError('record ' + str(record_num) + ' is out of range, the file has ' +
+                             str(self.num_records) + ' records')
+
+        pos1 = self.reclen*record_num + self.header_size
+        pos2 = pos1 + self.reclen - self.header_size
+
+        return memoryview(self._mmap)[pos1:pos2]
+
+
+    @property
+    def record_headers(self):
+        '''
+        Headers of all the records (found at reclen strides) decoded in one vectorized pass.
+        Pandas DataFrame with one row per record (see record_headers_)
+        '''
+
+        if self._record_headers is None:
+
+            # strided view over the memory map, copied so the map is not kept exported
+            view = np.ndarray(shape=(self.num_records,), dtype=shru_header, buffer=self._mmap, strides=(self.reclen,))
+            raw_headers = view.copy()
+            del view
+
+            self._record_headers = record_headers_(raw_headers)
+
+        return self._record_headers
+
+
+    def starttimes(self, records):
+        '''
+        Returns the start time of records from their own headers. 
+        Records with an unreadable time get the nominal time (file start time + npts*delta*record)
+
+        parameters
+        ----------
+        records: list of record numbers
+
+        Returns
+        -------
+        list of UTCDateTime
+        '''
+
+        times = self.record_headers['starttime'].values[records]
+
+        return utc_starttimes_(times, records, self.header)
+
+
+    def close(self):
+        '''
+        Closes the memory map and the file
+        '''
+
+        if self._file.closed:
+            return
+
+        try:
+            self._mmap.close()
+        except BufferError:
+            # record views are still referenced, the map is released once they are garbage collected
+            pass
+
+        self._file.close()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class RecordChunk_:
+    '''
+    Contiguous whole records (headers included) of a file read into memory.
+    Offers the record interface of ShruFile (record, starttimes, chan_num, npts) to the decoders.
+    '''
+
+    def __init__(self, file_name, header_df, records, raw):
+
+        self.file_name = file_name
+        self.header = header_df
+        self.records = records
+        self.raw = raw
+
+        self.reclen = int(header_df.loc['reclen'].values[0])
+        self.npts = int(header_df.loc['npts'].values[0])
+        self.chan_num = int(header_df.loc['channels'].values[0])
+        self.data_size = len(records)*self.npts*self.chan_num
+
+
+    def record(self, record_num):
+
+        pos1 = (record_num - self.records[0])*self.reclen + shru_header.itemsize
+        pos2 = pos1 + self.reclen - shru_header.itemsize
+
+        return memoryview(self.raw)[pos1:pos2]
+
+
+    def starttimes(self, records):
+
+        view = np.ndarray(shape=(len(self.records),), dtype=shru_header, buffer=self.raw, strides=(self.reclen,))
+        times = record_headers_(view.copy(), self.records[0])['starttime'].loc[records].values
+        del view
+
+        return utc_starttimes_(times, records, self.header)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_chunk_(file_name, header_df, records, opener=None):
+    '''
+    Help function that reads contiguous whole records of a file into a RecordChunk_.
+    opener is a callable (file_name, mode) -> file object, default is the builtin open.
+    '''
+
+    reclen = int(header_df.loc['reclen'].values[0])
+    raw = bytearray(len(records)*reclen)
+
+    with (opener or open)(file_name, 'rb') as f:
+        f.seek(records[0]*reclen)
+        size = f.readinto(raw)
+
+    if size < len(raw):
+        raise IndexError('records ' + str(records[0]) + '-' + str(records[-1]) + ' are out of range of ' + str(file_name))
+
+    return RecordChunk_(file_name, header_df, records, raw)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: continuous streams stitched from consecutive files
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import bisect
+import warnings
+
+import numpy as np
+
+from .help_functions_in import (resolve_bit_, decode_records_, decode_counts_, demean_, trace_template_,
+                                header_attrs_)
+from .shru_file import ShruFile
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_continuous_(files, starttime=None, endtime=None, bit='24bit', sensitivity=170, gain=20, output='stream',
+                     units='Pa', tolerance=1, fill_value=None, max_gap=60):
+    '''
+    this function reads consecutive SHRU files into one continuous block per channel.
+    Every record is placed at the sample of its header time: records within tolerance samples of
+    the end of the previous record are contiguous, other records start a gap or an overlap
+    (the later record overwrites the overlapping samples). The data are copied once into a
+    preallocated [channels, samples] array that holds only the covered samples (and the filled
+    gaps of the xarray output), the traces are views of it.
+
+    parameters
+    ----------
+    files: list of files (ordered by the time of their first record)
+    starttime: start of the window (UTCDateTime, datetime or string). Default (None) is the first record
+    endtime: end of the window. Default (None) is the end of the last record
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'
+    sensitivity: default is 170. optional to set to different value, specify it per channel or
+                 give a calibration table (see load_calibration)
+    gain: default sensor gain is 20. optional to specify it per channel
+    output: 'stream' returns one trace per channel and continuous segment, 'xarray' a (channel, time) DataArray
+            with fill_value in the gaps
+    units: 'Pa' (float32, every record demeaned) or 'counts' (int32 with the calib factor)
+    tolerance: largest header time jitter [samples] of contiguous records. Default is 1
+    fill_value: value of the gap samples. Default (None) is NaN for Pa and 0 for counts
+    max_gap: xarray only, longest gap [s] filled with fill_value. The time coordinate jumps over longer
+             gaps (e.g. a clock jump), which are reported with a warning. Default is 60
+
+    Returns
+    -------
+    Header: header of the first file
+    Waveforms: Obspy Stream or xarray DataArray
+    gaps: gaps and overlaps (Pandas DataFrame with file_name, record, type, starttime, endtime, samples)
+    '''
+
+    import pandas as pd
+    from obspy import UTCDateTime
+
+    if output not in ('stream', 'xarray'):
+        raise ValueError("output can get 'stream' or 'xarray', not " + repr(output))
+
+    if units not in ('Pa', 'counts'):
+        raise ValueError("units can get 'Pa' or 'counts', not " + repr(units))
+
+    plan = record_plan_(files, bit)
+    header_df = plan[0]['header']
+    sampling_rate = float(header_df.loc['sampling_rate'].values[0])
+    chan_num = int(header_df.loc['channels'].values[0])
+
+    start_ns = None if starttime is None else UTCDateTime(starttime).ns
+    end_ns = None if endtime is None else UTCDateTime(endtime).ns
+
+    placement, gaps, t0 = place_records_(plan, sampling_rate, start_ns, end_ns, tolerance)
+    if not placement:
+        raise ValueError('no records between ' + str(starttime) + ' and ' + str(endtime))
+
+    # the covered samples of the window
+    segments = covered_segments_(placement)
+    first = 0 if start_ns is None else max(int(round((start_ns - t0)*sampling_rate/1e9)), 0)
+    last = segments[-1][1] if end_ns is None else min(int(round((end_ns - t0)*sampling_rate/1e9)), segments[-1][1])
+    segments = [(max(s1, first), min(s2, last)) for s1, s2 in segments if s2 > first and s1 < last]
+
+    # the xarray output fills the gaps up to max_gap, longer gaps (and every gap of a stream) are not allocated
+    runs = join_segments_(segments, 0 if output == 'stream' else int(round(max_gap*sampling_rate)))
+    if output == 'xarray' and len(runs) > 1:
+        warnings.warn(str(len(runs) - 1) + ' gaps longer than max_gap=' + str(max_gap) + ' s are not filled, '
+                      'the time coordinate jumps over them')
+
+    dtype = np.int32 if units == 'counts' else np.float32
+    if fill_value is None:
+        fill_value = 0 if units == 'counts' else np.nan
+
+    # one preallocated block of the runs, only the gaps inside a run need the fill value
+    starts = [s1 for s1, _ in runs]
+    offsets = np.cumsum([0] + [s2 - s1 for s1, s2 in runs]).tolist()
+    data = np.empty((chan_num, offsets[-1]), dtype=dtype)
+    for (_, s2), (next1, _) in zip(segments[:-1], segments[1:]):
+        k = bisect.bisect_right(starts, s2) - 1
+        if next1 <= runs[k][1]:
+            data[:, offsets[k] + s2 - starts[k]:offsets[k] + next1 - starts[k]] = fill_value
+
+    calib = None
+
+    for file_info, records, idxs, npts in placement:
+
+        with ShruFile(file_info['file_name']) as shru:
+            if units == 'counts':
+                block, file_calib = decode_counts_(shru, records, file_info['bit'], sensitivity, gain)
+                if calib is not None and not np.allclose(file_calib, calib, rtol=1e-9):
+                    raise ValueError(file_info['file_name'] + ' has calib ' + str(list(file_calib)) + ', ' +
+                                     plan[0]['file_name'] + ' has ' + str(list(calib)) + 
+                                     ' (read the files separately or in Pa)')
+                calib = file_calib
+            else:
+                block = demean_(decode_records_(shru, records, file_info['bit'], sensitivity, gain))
+
+        # records are copied to their run, the part outside the window is dropped
+        for r, idx in enumerate(idxs):
+            lo, hi = max(idx, first), min(idx + npts, last)
+            if lo < hi:
+                k = bisect.bisect_right(starts, lo) - 1
+                data[:, offsets[k] + lo - runs[k][0]:offsets[k] + hi - runs[k][0]] = block[r][:, lo - idx:hi - idx]
+
+        del block
+
+    # the runs are views of the block, sample 0 is the start of the window
+    blocks = [(starts[k] - first, data[:, offsets[k]:offsets[k + 1]]) for k in range(len(runs))]
+    t0 = t0 + int(round(first*1e9/sampling_rate))
+
+    gaps = pd.DataFrame(gaps, columns=['file_name', 'record', 'type', 'starttime', 'endtime', 'samples'])
+
+    if output == 'xarray':
+        return header_df, stitched_dataarray_(data, blocks, header_df, t0, sampling_rate, calib), gaps
+
+    return header_df, stitched_stream_(blocks, header_df, t0, sampling_rate, calib), gaps
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def record_plan_(files, bit):
+    '''
+    Help function that reads the header and the record start times of every file, ordered by the
+    time of the first record. Records with an unreadable time get the nominal time.
+
+    Returns
+    -------
+    list of dictionaries (file_name, header, bit, npts, times [ns])
+    '''
+
+    plan = []
+
+    for file_name in files:
+
+        with ShruFile(file_name) as shru:
+
+            header_df = shru.header
+            times = shru.record_headers['starttime'].values.astype('datetime64[ns]')
+            record_ns = shru.npts*1e9/float(header_df.loc['sampling_rate'].values[0])
+            nominal = header_df.loc['starttime'].values[0].ns + np.rint(np.arange(len(shru))*record_ns).astype(np.int64)
+
+            plan.append({'file_name': file_name,
+                         'header': header_df,
+                         'bit': resolve_bit_(bit, header_df),
+                         'npts': shru.npts,
+                         'times': np.where(np.isnat(times), nominal, times.astype(np.int64))})
+
+    plan = sorted((info for info in plan if len(info['times'])), key=lambda info: info['times'][0])
+    if not plan:
+        raise ValueError('no records to read')
+
+    for info in plan[1:]:
+        for key in ('shru_num', 'channels', 'sampling_rate'):
+            if info['header'].loc[key].values[0] != plan[0]['header'].loc[key].values[0]:
+                raise ValueError(info['file_name'] + ' has ' + key + ' ' + str(info['header'].loc[key].values[0]) +
+                                 ', ' + plan[0]['file_name'] + ' has ' + str(plan[0]['header'].loc[key].values[0]))
+
+    return plan
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def place_records_(plan, sampling_rate, start_ns, end_ns, tolerance):
+    '''
+    Help function that selects the records of the window and assigns their first sample index.
+    A record that starts more than tolerance samples after (before) the end of the previous record
+    is a gap (overlap).
+
+    Returns
+    -------
+    list of (file info, records, first sample indices, npts) per file, list of gaps/overlaps,
+    time of sample 0 [ns]
+    '''
+
+    placement = []
+    gaps = []
+    t0 = None
+    expected = None
+    previous_end = None
+
+    for info in plan:
+
+        npts = info['npts']
+        record_ns = npts*1e9/sampling_rate
+        times = info['times']
+
+        selected = np.ones(len(times), dtype=bool)
+        if start_ns is not None:
+            selected &= times + record_ns > start_ns
+        if end_ns is not None:
+            selected &= times < end_ns
+
+        records = np.flatnonzero(selected)
+        if not len(records):
+            continue
+
+        if t0 is None:
+            t0 = int(times[records[0]])
+
+        idxs = np.rint((times[records] - t0)*sampling_rate/1e9).astype(np.int64)
+
+        for r, rec_num in enumerate(records):
+
+            # jitter within tolerance does not move a contiguous record
+            if expected is not None:
+                if abs(idxs[r] - expected) <= tolerance:
+                    idxs[r] = expected
+                else:
+                    gaps.append((info['file_name'], int(rec_num), 'gap' if idxs[r] > expected else 'overlap',
+                                 np.datetime64(previous_end, 'ns'), np.datetime64(int(times[rec_num]), 'ns'),
+                                 int(idxs[r] - expected)))
+
+            expected = idxs[r] + npts
+            previous_end = int(times[rec_num] + record_ns)
+
+        placement.append((info, records.tolist(), idxs.tolist(), npts))
+
+    # overlaps before the first record are cut
+    if placement:
+        shift = -min(min(idxs) for _, _, idxs, _ in placement)
+        if shift > 0:
+            placement = [(info, records, [idx + shift for idx in idxs], npts) for info, records, idxs, npts in placement]
+            t0 = t0 - int(round(shift*1e9/sampling_rate))
+
+    return placement, gaps, t0
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def covered_segments_(placement):
+    '''
+    Help function that merges the sample ranges of the placed records into continuous segments
+
+    Returns
+    -------
+    sorted list of [first, last) sample ranges
+    '''
+
+    intervals = sorted((idx, idx + npts) for _, _, idxs, npts in placement for idx in idxs)
+
+    segments = [list(intervals[0])]
+    for first, last in intervals[1:]:
+        if first <= segments[-1][1]:
+            segments[-1][1] = max(segments[-1][1], last)
+        else:
+            segments.append([first, last])
+
+    return [tuple(segment) for segment in segments]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def join_segments_(segments, max_gap):
+    '''
+    Help function that joins the segments separated by gaps of up to max_gap samples into runs
+
+    Returns
+    -------
+    list of [first, last) sample ranges
+    '''
+
+    runs = [list(segments[0])]
+    for first, last in segments[1:]:
+        if first - runs[-1][1] <= max_gap:
+            runs[-1][1] = last
+        else:
+            runs.append([first, last])
+
+    return [tuple(run) for run in runs]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def stitched_stream_(blocks, header_df, t0, sampling_rate, calib):
+    '''
+    Help function that wraps the (first sample, [channels, samples] view) continuous segments into one 
+    trace per channel and segment
+    '''
+
+    from obspy import Stream, Trace, UTCDateTime
+
+    stats = dict(trace_template_(header_df).stats)
+    for key in ('npts', 'endtime', 'delta'):
+        stats.pop(key)
+
+    traces = []
+    for c in range(blocks[0][1].shape[0]):
+
+        stats['station'] = 'CHN0'+str(c+1)
+        if calib is not None:
+            stats['calib'] = float(calib[c])
+            stats['units'] = 'counts'
+
+        for first, data in blocks:
+            stats['starttime'] = UTCDateTime(ns=t0 + int(round(first*1e9/sampling_rate)))
+            traces.append(Trace(data=data[c], header=stats))
+
+    return Stream(traces=traces)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def stitched_dataarray_(data, blocks, header_df, t0, sampling_rate, calib):
+    '''
+    Help function that wraps the stitched block into a (channel, time) DataArray (the time coordinate
+    jumps between the (first sample, view) runs of the block)
+    '''
+
+    import xarray as xr
+
+    chan_num = data.shape[0]
+    time = np.concatenate([t0 + np.rint((first + np.arange(block.shape[1]))*1e9/sampling_rate).astype(np.int64)
+                           for first, block in blocks]).astype('datetime64[ns]')
+
+    attrs = header_attrs_(header_df)
+    attrs['units'] = 'Pa' if calib is None else 'counts'
+
+    coords = {'channel': ['CHN0'+str(c+1) for c in range(chan_num)], 'time': time}
+    if calib is not None:
+        coords['calib'] = ('channel', np.asarray(calib, dtype=np.float64))
+
+    return xr.DataArray(data, dims=('channel', 'time'), name='pressure', attrs=attrs, coords=coords)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: processed-file manifest of the conversion pipeline (resumable conversions)
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import warnings
+
+
+# columns of the manifest table
+manifest_columns_ = ['file_name', 'size', 'mtime', 'hash', 'num_records', 'records_done', 'outputs']
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def load_manifest(manifest_file):
+    '''
+    this function loads the manifest of a conversion (see convert)
+
+    parameters
+    ----------
+    manifest_file: path to the SQLite manifest file
+
+    Returns
+    -------
+    Pandas DataFrame with one row per file: file_name, size, mtime, hash (of the first record),
+    num_records, records_done (records 0 to records_done-1 are converted), outputs (list of written files)
+    '''
+
+    import pandas as pd
+
+    with sqlite3.connect(manifest_file) as con:
+        manifest = pd.read_sql('SELECT * FROM files ORDER BY file_name', con)
+
+    con.close()
+
+    manifest['outputs'] = manifest['outputs'].map(json.loads)
+
+    return manifest
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def manifest_connect_(manifest_file):
+    '''
+    Help function that opens (and creates) a manifest file
+
+    Returns
+    -------
+    SQLite connection and a dictionary of the manifest entries by file name
+    '''
+
+    con = sqlite3.connect(manifest_file)
+    con.execute('CREATE TABLE IF NOT EXISTS files (file_name TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT, '
+                'num_records INTEGER, records_done INTEGER, outputs TEXT)')
+    con.commit()
+
+    entries = {}
+    for row in con.execute('SELECT ' + ', '.join(manifest_columns_) + ' FROM files'):
+        entry = dict(zip(manifest_columns_, row))
+        entry['outputs'] = set(json.loads(entry['outputs']))
+        entries[entry['file_name']] = entry
+
+    return con, entries
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def manifest_start_(entries, file_name, reclen):
+    '''
+    Help function that finds the first record of a file that is not converted yet.
+    Unchanged files (size and mtime) are trusted, otherwise the hash of the first record decides
+    whether the file grew (resume) or was replaced (start over).
+
+    Returns
+    -------
+    manifest entry of the file (new or updated) and the first record to convert
+    '''
+
+    file_name = os.path.abspath(file_name)
+    size = os.path.getsize(file_name)
+    mtime = os.path.getmtime(file_name)
+    entry = entries.get(file_name)
+
+    if entry is not None and entry['size'] == size and entry['mtime'] == mtime:
+        return entry, entry['records_done']
+
+    file_hash = file_hash_(file_name, reclen)
+
+    if entry is None or entry['hash'] != file_hash:
+
+        if entry is not None:
+            warnings.warn(file_name + ' changed since it was converted, converting it again')
+
+        entry = {'file_name': file_name, 'records_done': 0, 'outputs': set()}
+
+    entry.update(size=size, mtime=mtime, hash=file_hash, num_records=size//reclen)
+    entries[file_name] = entry
+
+    return entry, entry['records_done']
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def manifest_update_(con, entry):
+    '''
+    Help function that writes (and commits) the manifest entry of a file
+    '''
+
+    row = dict(entry, outputs=json.dumps(sorted(entry['outputs'])))
+
+    con.execute('INSERT OR REPLACE INTO files (' + ', '.join(manifest_columns_) + ') VALUES (' +
+                ', '.join('?'*len(manifest_columns_)) + ')', [row[c] for c in manifest_columns_])
+    con.commit()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def file_hash_(file_name, reclen):
+    '''
+    Help function that hashes the first record (header and data) of a file.
+    The first record does not change when a file grows, so the hash identifies the file.
+    '''
+
+    with open(file_name, 'rb') as f:
+        return hashlib.blake2b(f.read(reclen), digest_size=16).hexdigest()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: per stage timers and counters of the read/write pipeline
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('pyoad')
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class Metrics:
+    '''
+    Timers and counters of the read/write pipeline (thread safe). Passing a Metrics object to read_data,
+    save2mseed or convert replaces the printed progress (tqdm/print) with structured events.
+
+    Counters: bytes_read, records_decoded, samples_written, bytes_written, files_written, dirs_created, ...
+    Timers [s]: read, decode, assemble, decimate, write
+
+    parameters
+    ----------
+    callback: function called with every event (dictionary with 'event', 'time' and the event fields).
+              Default is None
+    log: if True, every event is logged as a JSON line to the 'pyoad' logger (INFO level). Default is False
+
+    Example
+    -------
+    metrics = Metrics(callback=print)
+    Header, Waveforms = read_data(file_name, range(128), metrics=metrics)
+    metrics.summary()
+    '''
+
+    enabled = True
+
+    def __init__(self, callback=None, log=False):
+
+        self.callback = callback
+        self.log = log
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self._lock = threading.Lock()
+
+
+    def add(self, name, value=1):
+        '''
+        Adds value to a counter
+        '''
+
+        with self._lock:
+            self.counters[name] += value
+
+
+    @contextmanager
+    def timer(self, name):
+        '''
+        Context manager that adds the elapsed time of its block to a timer
+        '''
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.timers[name] += elapsed
+
+
+    def event(self, name, **fields):
+        '''
+        Sends an event to the callback and the log
+        '''
+
+        event = dict(event=name, time=time.time(), **fields)
+
+        if self.callback is not None:
+            self.callback(event)
+
+        if self.log:
+            logger.info(json.dumps(event, default=str))
+
+
+    def summary(self):
+        '''
+        Returns the counters and the timers (name_seconds) in a dictionary
+        '''
+
+        with self._lock:
+            summary = dict(self.counters)
+            summary.update((name + '_seconds', value) for name, value in self.timers.items())
+
+        return summary
+
+
+    def reset(self):
+        '''
+        Sets all the counters and timers to zero
+        '''
+
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class NullMetrics_(Metrics):
+    '''
+    Help class that does nothing, used when no Metrics object is given
+    '''
+
+    enabled = False
+
+    def add(self, name, value=1):
+        pass
+
+
+    @contextmanager
+    def timer(self, name):
+        yield
+
+
+    def event(self, name, **fields):
+        pass
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def metrics_(metrics):
+    '''
+    Help function that returns the metrics object, or a no-op one for None
+    '''
+
+    return NullMetrics_() if metrics is None else metrics
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
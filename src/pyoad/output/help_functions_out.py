@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: help functions for output module functions
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import numpy as np
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def file_groups_(waveforms, dir_name, group):
+    '''
+    Help function that assigns the traces to output files in a year/network/station structure
+    
+    parameters
+    ----------
+    waveforms: Obspy stream
+    dir_name: output directory
+    group: None (one file per trace), 'hour' or 'day'
+
+    Returns
+    -------
+    dictionary {file name: list of traces}, traces crossing an hour/day boundary are split (views)
+    '''
+
+    if group not in (None, 'hour', 'day'):
+        raise ValueError("group can get None, 'hour' or 'day', not " + repr(group))
+
+    period = {'hour': 3600, 'day': 86400}.get(group)
+    groups = {}
+
+    for tr in waveforms:
+
+        if period is None:
+            pieces = [tr]
+        else:
+            pieces = split_periods_(tr, period)
+
+        for piece in pieces:
+            groups.setdefault(file_name_(piece, dir_name, group), []).append(piece)
+
+    return groups
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def file_name_(tr, dir_name, group):
+    '''
+    Help function that builds the output file name of a trace
+    
+    parameters
+    ----------
+    tr: Obspy trace
+    dir_name: output directory
+    group: None (one file per trace), 'hour' or 'day'
+
+    Returns
+    -------
+    file name dir_name/year/network/station/id.year.julday[.hour[.minute.second]]
+    '''
+
+    t = tr.stats.starttime
+    name = tr.id + '.' + str(t.year) + '.' + str(t.julday)
+
+    if group != 'day':
+        name = name + '.' + str(t.hour).zfill(2)
+
+    if group is None:
+        name = name + '.' + str(t.minute) + '.' + str(t.second)
+
+    return os.path.join(dir_name, str(t.year), tr.stats.network, tr.stats.station, name)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def split_periods_(tr, period):
+    '''
+    Help function that splits a trace at hour/day boundaries
+    
+    parameters
+    ----------
+    tr: Obspy trace
+    period: length of the period in seconds (3600 or 86400)
+
+    Returns
+    -------
+    list of traces (views of the data)
+    '''
+
+    from obspy import UTCDateTime
+
+    start = tr.stats.starttime
+    end = tr.stats.endtime
+
+    boundary = UTCDateTime((start.timestamp//period + 1)*period)
+    if boundary > end:
+        return [tr]
+
+    pieces = []
+    while start <= end:
+        pieces.append(tr.slice(start, boundary - tr.stats.delta/2, nearest_sample=False))
+        start = boundary
+        boundary = boundary + period
+
+    return [piece for piece in pieces if piece.stats.npts > 0]
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def write_group_(fname, traces, encoding, append):
+    '''
+    Help function that merges the traces of a single output file and writes them
+    
+    parameters
+    ----------
+    fname: file name
+    traces: list of traces
+    encoding: mseed encoding, None is FLOAT32 for float data and STEIM2 for integer counts
+    append: if True, append to an existing file
+
+    Returns
+    -------
+    number of bytes added to the file
+    '''
+
+    from obspy import Stream
+
+    before = os.path.getsize(fname) if append and os.path.exists(fname) else 0
+
+    stream = Stream(traces=traces)
+    if len(stream) > 1:
+        stream.sort(['starttime'])
+        stream.merge(method=-1)  # joins only contiguous traces, gaps stay as separate traces
+
+    options = {}
+    if encoding is not None:
+        options['encoding'] = encoding.upper()
+    elif all(tr.data.dtype == np.int32 for tr in stream):
+        options['encoding'] = 'STEIM2'
+
+    with open(fname, 'ab' if append else 'wb') as f:
+        stream.write(f, format='MSEED', **options)
+
+    return os.path.getsize(fname) - before
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def write_calib_table_(dir_name, groups, appends):
+    '''
+    Help function that keeps the calib (Pa = counts*calib) of the integer counts of an mseed archive in 
+    one dir_name/calib.csv table, since MiniSEED has no calib field. The table has a row per file, channel 
+    and calib: file (relative to dir_name), id (as written to the file, the network is cut to 2 characters), 
+    starttime, endtime and calib. The rows of overwritten files are replaced
+    
+    parameters
+    ----------
+    dir_name: archive directory
+    groups: dictionary {file name: list of written traces}
+    appends: dictionary {file name: True if the traces were appended to the file}
+
+    Returns
+    -------
+    Nothing
+    '''
+
+    import csv
+    from obspy import UTCDateTime
+
+    table = os.path.join(dir_name, 'calib.csv')
+    columns = ['file', 'id', 'starttime', 'endtime', 'calib']
+
+    def relative(fname):
+        return os.path.relpath(os.path.abspath(fname), os.path.abspath(dir_name)).replace(os.sep, '/')
+
+    counts = {fname: traces for fname, traces in groups.items() 
+              if all(np.issubdtype(tr.data.dtype, np.integer) for tr in traces)}
+    if not counts and not os.path.exists(table):
+        return
+
+    rows = []
+    if os.path.exists(table):
+        with open(table, newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    overwritten = {relative(fname) for fname in groups if not appends[fname]}
+    rows = [row for row in rows if row['file'] not in overwritten]
+
+    for fname, traces in counts.items():
+
+        file_name = relative(fname)
+
+        for tr in sorted(traces, key=lambda tr: tr.stats.starttime):
+
+            trace_id = '.'.join([tr.stats.network[:2], tr.stats.station[:5], tr.stats.location[:2], 
+                                 tr.stats.channel[:3]])
+            calib = repr(float(tr.stats.calib))
+
+            last = next((row for row in reversed(rows) if row['file'] == file_name and row['id'] == trace_id), None)
+            if last is not None and last['calib'] == calib:
+                last['endtime'] = str(max(tr.stats.endtime, UTCDateTime(last['endtime'])))
+            else:
+                rows.append({'file': file_name, 'id': trace_id, 'starttime': str(tr.stats.starttime), 
+                             'endtime': str(tr.stats.endtime), 'calib': calib})
+
+    with open(table, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
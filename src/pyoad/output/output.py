@@ -18,12 +18,12 @@ Python module to read the .D binary data files
 
 import numpy as np
 import os
-from tqdm import tqdm
-from obspy import read_inventory, read, UTCDateTime, Stream, Trace
-# from .help_functions_out import 
+from concurrent.futures import ThreadPoolExecutor
+from .help_functions_out import file_groups_, write_group_, write_calib_table_
+from ..metrics import metrics_
 
 
-def save2mseed_(waveforms, dir_name):
+def save2mseed_(waveforms, dir_name, group=None, encoding=None, workers=None, append=False, metrics=None):
     '''
     this function gets the waveforms data and write it to mseed 
     
@@ -32,58 +32,108 @@ def save2mseed_(waveforms, dir_name):
     waveforms: Obspy stream
     dir_name: directory to save the data to in a year/network/station structure. 
               default directory is Results
+    group: None (default) writes one file per trace. 'hour' or 'day' groups the traces of every channel 
+           into hour-long or day-long files
+    encoding: mseed encoding. Default (None) is FLOAT32 for Pa and STEIM2 for int32 counts (units='counts'). 
+              'STEIM2', 'STEIM1', 'INT32' and 'INT16' need integer data. The calib of integer counts is 
+              kept in a dir_name/calib.csv table (file, id, starttime, endtime, calib), MiniSEED does not keep it
+    workers: number of threads that encode and write the files in parallel. Default (None) is the 
+             ThreadPoolExecutor default
+    append: if True, the records are appended to existing files (e.g. when writing chunk by chunk 
+            into day-long files). A set of file names appends only to these files and overwrites the 
+            others, the written files are added to the set. Default is False (overwrite)
+    metrics: Metrics object that collects the timers and counters instead of the printed progress. Default is None
 
     Returns
     -------
     Nothing
     '''
 
+    from tqdm import tqdm
 
-    print('Writing to MSEED...')
-    for tr in tqdm(waveforms):
+    metrics = metrics_(metrics)
 
-        r = dir_name
-        y = str(tr.stats.starttime.year)+'/'
-        n = tr.stats.network+'/'
-        s = tr.stats.station+'/'
-        name = tr.id + '.'+str(tr.stats.starttime.year) + '.'+ str(tr.stats.starttime.julday) + \
-        '.'+ str(tr.stats.starttime.hour).zfill(2) + '.'+ str(tr.stats.starttime.minute) + '.'+ str(tr.stats.starttime.second) 
-        fname = r+y+n+s+name
+    if encoding is not None and encoding.upper() in ('STEIM1', 'STEIM2', 'INT32', 'INT16'):
+        for tr in waveforms:
+            if not np.issubdtype(tr.data.dtype, np.integer):
+                raise ValueError(encoding + ' encoding needs integer data, ' + tr.id + ' is ' + str(tr.data.dtype))
+
+    groups = file_groups_(waveforms, dir_name, group)
+
+    # create the year/network/station tree once
+    for dir_path in set(os.path.dirname(fname) for fname in groups):
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+            metrics.add('dirs_created')
+
+
+    if not metrics.enabled:
+        print('Writing to MSEED...')
+
+    with metrics.timer('write'), ThreadPoolExecutor(max_workers=workers) as executor:
         
+        # a set holds the files written earlier in this run, existing files of older runs are overwritten
+        appends = {fname: (os.path.abspath(fname) in append if isinstance(append, set) else append) for fname in groups}
+        jobs = [executor.submit(write_group_, fname, traces, encoding, appends[fname]) for fname, traces in groups.items()]
+
+        # the bytes added to every file (appended files are not counted again)
+        size = 0
+        for job in (jobs if metrics.enabled else tqdm(jobs)):
+            size += job.result()
+
+        write_calib_table_(dir_name, groups, appends)
+
+    if isinstance(append, set):
+        append.update(os.path.abspath(fname) for fname in groups)
+
+    if metrics.enabled:
+        samples = sum(tr.stats.npts for tr in waveforms)
+        metrics.add('files_written', len(groups))
+        metrics.add('samples_written', samples)
+        metrics.add('bytes_written', size)
+        metrics.event('write', dir_name=dir_name, files=len(groups), samples=samples, bytes=size)
+
+
+
+def save2xarray_(waveforms, file_name, format='zarr', chunk_size=None, append=False):
+    '''
+    this function writes (channel, time) waveforms to a chunked Zarr store or NetCDF file
+    
+    parameters
+    ----------
+    waveforms: xarray DataArray
+    file_name: Zarr store (directory) or NetCDF file
+    format: 'zarr' (default) or 'netcdf'
+    chunk_size: number of samples per chunk along time. Default (None) is one record (npts)
+    append: if True, append along time to an existing Zarr store
+
+    Returns
+    -------
+    Nothing
+    '''
+
+    if format not in ('zarr', 'netcdf'):
+        raise ValueError("format can get 'zarr' or 'netcdf', not " + repr(format))
+
+    if chunk_size is None:
+        chunk_size = int(waveforms.attrs.get('npts', waveforms.sizes['time']))
+
+    chunks = (waveforms.sizes['channel'], min(chunk_size, waveforms.sizes['time']))
+    dataset = waveforms.to_dataset()
+    name = waveforms.name
+
+
+    if format == 'zarr':
+
+        if append:
+            dataset.to_zarr(file_name, append_dim='time')
+        else:
+            dataset.to_zarr(file_name, mode='w', encoding={name: {'chunks': chunks}})
+
+    else:
 
+        if append:
+            raise ValueError('append is only supported for zarr')
 
-        try:
-            tr.write(fname, format="MSEED") 
-
-        except:
-            
-            if os.path.exists(r+y+n+s)==True:
-                tr.write(fname, format="MSEED") 
-                # print('saving file')
-            
-            elif os.path.exists(r+y+n)==True:
-                os.mkdir(r+y+n+s)
-                tr.write(fname, format="MSEED")  
-                # print('creating station directory')
-
-            elif os.path.exists(r+y)==True:
-                os.mkdir(r+y+n)
-                os.mkdir(r+y+n+s)
-                tr.write(fname, format="MSEED")  
-                # print('creating network + station directories')
-
-            elif os.path.exists(r)==True:
-                os.mkdir(r+y)
-                os.mkdir(r+y+n)
-                os.mkdir(r+y+n+s)
-                tr.write(fname, format="MSEED")  
-                # print('creating year + network + station directories')
-
-            else:
-                os.mkdir(r)
-                os.mkdir(r+y)
-                os.mkdir(r+y+n)
-                os.mkdir(r+y+n+s)
-                tr.write(fname, format="MSEED")  
-                # print('creating Results + year + network + station directories')
+        dataset.to_netcdf(file_name, engine='netcdf4', encoding={name: {'chunksizes': chunks, 'zlib': True}})
 
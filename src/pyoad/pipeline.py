@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: streaming conversion pipeline (.D files -> mseed/zarr archive)
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .input.input import read_header
+from .input.directory import list_files, error_
+from .input.help_functions_in import (shru_header, resolve_bit_, decoder_, decode_records_, decode_counts_, demean_, assemble_traces_, 
+                                      assemble_dataarray_)
+from .input.shru_file import read_chunk_
+from .input.decimate import DecimatedRuns_, decimation_factor_, decimated_traces_, decimated_dataarray_
+from .output.output import save2xarray_
+from .output.help_functions_out import file_groups_, write_group_, write_calib_table_
+from .manifest import manifest_connect_, manifest_start_, manifest_update_
+from .metrics import metrics_
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def convert_(inputs, out, format='mseed', bit='24bit', sensitivity=170, gain=20, chunk_size=16, pattern='*.D*',
+             io_threads=2, workers=None, queue_size=4, group='day', encoding=None, manifest=None, watch=False, 
+             poll_interval=60, metrics=None, units='Pa', decimate=None, errors='warn'):
+    '''
+    this function converts .D files to an archive with overlapping read, decode and write stages
+    connected by bounded queues, so the memory use does not depend on the size of the input.
+
+    parameters
+    ----------
+    inputs: directory, glob pattern or list of files
+    out: output directory (mseed) or Zarr store (zarr)
+    format: 'mseed' (default) or 'zarr'
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'.
+    sensitivity: default is 170. optional to set to different value or specify it per channel
+    gain: default sensor gain is 20
+    chunk_size: number of records per chunk. Default is 16
+    pattern: glob pattern of the files in a directory. Default is '*.D*'
+    io_threads: number of reading threads. Default is 2
+    workers: number of decoding threads. Default (None) is the number of cores
+    queue_size: maximum number of chunks waiting in every queue. Default is 4
+    group: mseed only, 'day' (default) or 'hour' long files per channel, None for one file per record
+    encoding: mseed only, mseed encoding. Default (None) is FLOAT32 for Pa and STEIM2 for counts
+    units: 'Pa' (default) or 'counts' (int32 raw counts and the factor to Pa in the calib of every trace)
+    decimate: integer decimation factor. The chunks are decoded in parallel and decimated in order by the 
+              writer, with one filter state across the chunks and consecutive files. In watch mode the state is 
+              kept from poll to poll and the last samples of a run are written when the next records arrive 
+              or the watch ends. A rerun or resume of a manifest starts a new run (the filter edge is at the 
+              first resumed record). Default (None) is no decimation
+    manifest: SQLite file that records the converted records and the written outputs of every file.
+              Reruns skip converted files and resume partially converted (or grown) files. Default is None
+    watch: if True, poll the inputs every poll_interval seconds and convert new records until interrupted
+           (requires a manifest). Default is False
+    poll_interval: seconds between polls in watch mode. Default is 60
+    metrics: Metrics object that collects the per stage timers (read, decode, assemble, write, write_wait) and 
+             counters, and receives 'chunk' and 'convert' events instead of the printed summary. Default is None
+    errors: policy for files whose header can not be read. Can get: 'raise', 'warn' (default) and 'ignore'.
+            Files without one complete record (still being offloaded) are deferred to the next poll in watch mode
+
+    Returns
+    -------
+    dictionary with the number of files (converted and skipped), records, bytes and samples, 
+    the elapsed time, MB/s and samples/s
+    '''
+
+    if format not in ('mseed', 'zarr'):
+        raise ValueError("format can get 'mseed' or 'zarr', not " + repr(format))
+
+    if watch and manifest is None:
+        raise ValueError('watch mode requires a manifest')
+
+    if errors not in ('raise', 'warn', 'ignore'):
+        raise ValueError("errors can get 'raise', 'warn' or 'ignore', not " + repr(errors))
+
+    if bit != 'auto':
+        decoder_(bit)  # unknown types fail before any file is read
+
+    if units not in ('Pa', 'counts'):
+        raise ValueError("units can get 'Pa' or 'counts', not " + repr(units))
+
+    factor = decimation_factor_(decimate)
+    if factor and units == 'counts':
+        raise ValueError("decimated data are filtered, they can not be written with units='counts'")
+
+    metrics = metrics_(metrics)
+    stats = {'files': 0, 'skipped': 0, 'records': 0, 'bytes': 0, 'samples': 0}
+    t0 = time.perf_counter()
+
+    con, entries = manifest_connect_(manifest) if manifest is not None else (None, {})
+
+    # one filter state for every poll, decimated chunks wait for their manifest update until the filter 
+    # returned all their samples
+    decimation = {'runs': None, 'header': None, 'done_until': None, 'pending': []}
+
+    try:
+        while True:
+
+            tasks = []
+            for file_name, header_df in input_headers_(inputs, pattern, errors, watch):
+
+                reclen = int(header_df.loc['reclen'].values[0])
+                if con is None:
+                    tasks.append((file_name, header_df, None, 0, os.path.getsize(file_name)//reclen))
+                    continue
+
+                entry, start = manifest_start_(entries, file_name, reclen)
+                # records still held by the decimation filter (written at a later poll) are not read again
+                start = max(start, entry.get('records_queued', 0))
+                if start < entry['num_records']:
+                    tasks.append((file_name, header_df, entry, start, entry['num_records']))
+                elif not watch:
+                    stats['skipped'] += 1
+
+            if tasks:
+                stats['files'] += len(tasks)
+                pipeline_(tasks, out, format, bit, sensitivity, gain, chunk_size, io_threads, workers, 
+                          queue_size, group, encoding, con, entries, stats, metrics, units, factor, decimation, 
+                          flush=not watch)
+
+            if not watch:
+                break
+
+            try:
+                time.sleep(poll_interval)
+            except KeyboardInterrupt:
+                break
+
+        # the end of the last run is written when the watch ends
+        if watch and factor:
+            pipeline_([], out, format, bit, sensitivity, gain, chunk_size, io_threads, workers, queue_size, group, 
+                      encoding, con, entries, stats, metrics, units, factor, decimation)
+
+    finally:
+        if con is not None:
+            con.close()
+
+
+    stats['seconds'] = time.perf_counter() - t0
+    stats['MB/s'] = stats['bytes']/1e6/stats['seconds']
+    stats['samples/s'] = stats['samples']/stats['seconds']
+
+    if metrics.enabled:
+        metrics.event('convert', **stats)
+    else:
+        print('Converted %d files (%d skipped), %d records, %.1f MB in %.2f s: %.1f MB/s, %.3g samples/s' %
+              (stats['files'], stats['skipped'], stats['records'], stats['bytes']/1e6, stats['seconds'], stats['MB/s'], 
+               stats['samples/s']))
+
+    return stats
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def input_headers_(inputs, pattern, errors, watch):
+    '''
+    Help function that reads the headers of the input files, ordered by their start time.
+    Files that do not hold one complete record yet are deferred in watch mode (they are still
+    being offloaded), files that can not be read follow the errors policy.
+
+    Returns
+    -------
+    list of (file name, header data frame)
+    '''
+
+    headers = []
+
+    for file_name in list_files(inputs, pattern):
+
+        try:
+            size = os.path.getsize(file_name)
+            if size < shru_header.itemsize:
+                if watch:
+                    continue
+                raise ValueError('the file is shorter than a header (%d bytes)' % size)
+
+            header_df = read_header(file_name)
+            reclen = int(header_df.loc['reclen'].values[0])
+            if reclen < shru_header.itemsize:
+                raise ValueError('invalid record length %d' % reclen)
+
+            if size < reclen:
+                if watch:
+                    continue
+                raise ValueError('the file is shorter than a record (%d bytes)' % size)
+
+        except Exception as e:
+            error_(file_name, e, errors)
+            continue
+
+        headers.append((file_name, header_df))
+
+    return sorted(headers, key=lambda f: f[1].loc['starttime'].values[0])
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def pipeline_(tasks, out, format, bit, sensitivity, gain, chunk_size, io_threads, workers, queue_size, group, 
+              encoding, con, entries, stats, metrics, units, factor=None, decimation=None, flush=True):
+    '''
+    Help function that runs the read -> decode -> write pipeline over a list of 
+    (file name, header, manifest entry, first record, number of records) tasks.
+    With decimation the filter state is taken from (and left in) the decimation dictionary, 
+    the last run is ended only when flush is True
+    '''
+
+    read_q = queue.Queue(maxsize=queue_size)
+    decode_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(q, item):
+        # bounded put that gives up when the pipeline is stopped
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        # get that gives up when the pipeline is stopped
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return done
+
+    def read(file_name, header_df, records):
+        with metrics.timer('read'):
+            chunk = read_chunk_(file_name, header_df, records)
+        metrics.add('bytes_read', len(chunk.raw))
+        return chunk
+
+    def write(waveforms):
+        with metrics.timer('write'):
+            if format == 'mseed':
+                return write_mseed_chunk_(waveforms, out, group, encoding, written, metrics)
+            outputs = [os.path.abspath(out)]
+            save2xarray_(waveforms, out, 'zarr', append=outputs[0] in written)
+            written.update(outputs)
+            return outputs
+
+    if decimation is None:
+        decimation = {'runs': None, 'header': None, 'done_until': None, 'pending': []}
+
+    # outputs that already hold converted data are appended to, new ones are overwritten
+    written = set()
+    for entry in entries.values():
+        written.update(output for output in entry['outputs'] if os.path.exists(output))
+
+    with ThreadPoolExecutor(max_workers=io_threads) as io_pool, ThreadPoolExecutor(max_workers=workers) as decode_pool:
+
+        def read_stage():
+            try:
+                for file_name, header_df, entry, start, num_records in tasks:
+                    for r in range(start, num_records, chunk_size):
+                        records = list(range(r, min(r + chunk_size, num_records)))
+                        if not put(read_q, (entry, io_pool.submit(read, file_name, header_df, records))):
+                            return
+            finally:
+                put(read_q, done)
+
+        def decode_stage():
+            try:
+                while True:
+                    job = get(read_q)
+                    if job is done:
+                        return
+                    entry, read_job = job
+                    if not put(decode_q, (entry, decode_pool.submit(decode_chunk_, read_job, bit, sensitivity, 
+                                                                    gain, format, metrics, units, factor))):
+                        return
+            finally:
+                put(decode_q, done)
+
+        stages = [threading.Thread(target=read_stage, daemon=True), threading.Thread(target=decode_stage, daemon=True)]
+        for stage in stages:
+            stage.start()
+
+        # the writer runs in this thread and consumes the chunks in order
+        try:
+            while True:
+
+                with metrics.timer('write_wait'):
+                    job = get(decode_q)
+                    if job is done:
+                        break
+
+                    entry, decode_job = job
+                    chunk, waveforms = decode_job.result()
+
+                if factor:
+                    with metrics.timer('decimate'):
+                        waveforms, samples = decimate_chunk_(decimation, chunk, waveforms, factor, format)
+                    outputs = [output for w in waveforms for output in write(w)]
+                else:
+                    outputs, samples = write(waveforms), int(chunk.data_size)
+
+                metrics.add('samples_written', samples)
+                metrics.event('chunk', file_name=chunk.file_name, records=[chunk.records[0], chunk.records[-1]], 
+                              outputs=outputs)
+
+                # the manifest is updated once the chunk is written
+                if entry is not None and factor:
+                    npts = int(chunk.header.loc['npts'].values[0])
+                    end = chunk.starttimes(chunk.records[-1:])[0] + npts/float(chunk.header.loc['sampling_rate'].values[0])
+                    decimation['pending'].append((entry, chunk.records[-1] + 1, end))
+                    entry['records_queued'] = chunk.records[-1] + 1
+                    release_chunks_(decimation, outputs, con)
+                elif entry is not None:
+                    entry['records_done'] = chunk.records[-1] + 1
+                    entry['outputs'].update(outputs)
+                    manifest_update_(con, entry)
+
+                stats['records'] += len(chunk.records)
+                stats['bytes'] += len(chunk.raw)
+                stats['samples'] += int(chunk.data_size)
+
+            # the end of the last run is written once all the chunks are converted
+            if factor and flush:
+                waveforms, samples = decimate_chunk_(decimation, None, None, factor, format)
+                outputs = [output for w in waveforms for output in write(w)]
+                metrics.add('samples_written', samples)
+                release_chunks_(decimation, outputs, con)
+
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decode_chunk_(read_job, bit, sensitivity, gain, format, metrics, units, factor=None):
+    '''
+    Help function (decode stage) that decodes a chunk of records into a Stream or a DataArray
+    (the calibrated records, not demeaned, when they are decimated by the writer)
+    '''
+
+    from obspy import Stream
+
+    chunk = read_job.result()
+
+    with metrics.timer('decode'):
+        if units == 'counts':
+            data, calib = decode_counts_(chunk, chunk.records, resolve_bit_(bit, chunk.header), sensitivity, gain)
+        else:
+            data, calib = decode_records_(chunk, chunk.records, resolve_bit_(bit, chunk.header), sensitivity, gain), None
+            if factor:
+                metrics.add('records_decoded', len(chunk.records))
+                return chunk, data
+            demean_(data)
+    metrics.add('records_decoded', len(chunk.records))
+
+    with metrics.timer('assemble'):
+        starttimes = chunk.starttimes(chunk.records)
+
+        if format == 'zarr':
+            return chunk, assemble_dataarray_(data, chunk.records, chunk.header, starttimes, calib)
+
+        return chunk, Stream(traces=assemble_traces_(data, chunk.records, chunk.header, True, starttimes, calib))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def decimate_chunk_(decimation, chunk, data, factor, format):
+    '''
+    Help function (write stage) that decimates the decoded chunks in order. One filter state runs across 
+    chunks and files, a new run starts at a time gap or another instrument (a None chunk ends the last run).
+
+    Returns
+    -------
+    list of Streams or DataArrays of the finished decimated samples, number of samples
+    '''
+
+    from obspy import Stream
+
+    groups = []
+    header_df = decimation['header']
+
+    if decimation['runs'] is not None and (chunk is None or 
+                                           any(chunk.header.loc[key].values[0] != header_df.loc[key].values[0]
+                                               for key in ('shru_num', 'channels', 'sampling_rate'))):
+        # the end of the previous run is written with its own header
+        groups.append((header_df, decimation['runs'].flush()))
+        decimation['done_until'] = decimation['runs'].done_until
+        decimation['runs'] = None
+
+    if chunk is not None:
+        if decimation['runs'] is None:
+            decimation['runs'] = DecimatedRuns_(factor, float(chunk.header.loc['sampling_rate'].values[0]))
+            decimation['header'] = chunk.header
+        groups.append((chunk.header, decimation['runs'].push(data, chunk.starttimes(chunk.records))))
+        decimation['done_until'] = decimation['runs'].done_until
+
+    groups = [(header, segments) for header, segments in groups if segments]
+    samples = sum(block.size for _, segments in groups for _, block in segments)
+
+    if format == 'zarr':
+        return [decimated_dataarray_(segments, header, factor) for header, segments in groups], samples
+
+    return [Stream(traces=decimated_traces_(segments, header, factor)) for header, segments in groups], samples
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def release_chunks_(decimation, outputs, con):
+    '''
+    Help function (write stage) that updates the manifest of the decimated chunks whose samples are
+    all written. The filter holds the end of a chunk until the next samples (or the end of the run)
+    arrive, so a chunk is done once the written output reaches its end time.
+    '''
+
+    pending = decimation['pending']
+
+    # the written outputs can hold samples of every waiting chunk
+    for entry, _, _ in pending:
+        entry['outputs'].update(outputs)
+
+    done_until = decimation['done_until']
+
+    while pending and done_until is not None and pending[0][2] <= done_until + 1e-6:
+        entry, records_done, _ = pending.pop(0)
+        entry['records_done'] = records_done
+        manifest_update_(con, entry)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def write_mseed_chunk_(waveforms, out, group, encoding, written, metrics):
+    '''
+    Help function (write stage) that writes a chunk to mseed.
+    Files are overwritten the first time they are written in a run and appended to afterwards.
+    Returns the written files.
+    '''
+
+    outputs = []
+    groups = {os.path.abspath(fname): traces for fname, traces in file_groups_(waveforms, out, group).items()}
+    appends = {fname: fname in written for fname in groups}
+
+    for fname, traces in groups.items():
+
+        if not appends[fname]:
+            if not os.path.isdir(os.path.dirname(fname)):
+                os.makedirs(os.path.dirname(fname), exist_ok=True)
+                metrics.add('dirs_created')
+            metrics.add('files_written')
+
+        metrics.add('bytes_written', write_group_(fname, traces, encoding, appends[fname]))
+        written.add(fname)
+        outputs.append(fname)
+
+    write_calib_table_(out, groups, appends)
+
+    return outputs
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -16,23 +16,30 @@ Python module to read the .D binary data files
     (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
 
-import matplotlib.pyplot as plt
-plt.rcParams['font.size'] = '16'
-plt.rcParams['figure.dpi'] = 125
-plt.rcParams['figure.facecolor'] = 'white'
-
 import numpy as np
-import pandas as pd
 
-from obspy import read_inventory, read, UTCDateTime, Stream, Trace
-from .input.input import read_header, read_waveforms
-from .output.output import save2mseed_
+from .input.input import read_header, read_record_headers, read_waveforms, iter_waveforms, load_calibration
+from .input.help_functions_in import (resolve_bit_, decoder_, decode_records_, decode_counts_, demean_, assemble_traces_, 
+                                      calibration_, calibration_factors_, calibrate_, unpack_16bit_)
+from .input.shru_file import ShruFile
+from .input.cache import RecordCache
+from .input.async_input import aread_data, aiter_records
+from .input.directory import list_files, iter_files
+from .input.stitch import read_continuous_
+from .input.index import scan_headers, save_index, load_index, query_index, query_records
+from .output.output import save2mseed_, save2xarray_
+from .pipeline import convert_
+from .spectral import spectrogram_
+from .manifest import load_manifest
+from .synthetic import write_synthetic
+from .metrics import Metrics
 
 
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
-def read_data(file_name, records_range, bit='24bit', sensitivity=170, gain=20):
+def read_data(file_name, records_range, bit='24bit', sensitivity=170, gain=20, merge=False, output='stream', cache=None, 
+              metrics=None, units='Pa', decimate=None):
     '''
     This function teads the data from a .D 16 or 24 bit binary file
 
@@ -41,21 +48,40 @@ def read_data(file_name, records_range, bit='24bit', sensitivity=170, gain=20):
     ----------
         file_name: path to file
         records_range: range of record sections to extact
-        bit: type of binry file. Can get: '24bit', and '16bit'. Default is for 24. Still need to add the pseudo 24 bit.
-        sensitivity: default is 170. optional to set to different value or specify it per channel
-        gain: default sensor gain is 20
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        merge: if True, contiguous records are merged into a single trace per channel. Default is False
+        output: 'stream' (default) returns an Obspy Stream. 'xarray' returns a single (channel, time) 
+                float32 xarray DataArray with time coordinates and the header as attributes
+        cache: RecordCache (or a cache directory) of decoded records. Repeated reads of the same records 
+               are loaded from the cache instead of decoded. Default (None) is no cache
+        metrics: Metrics object that collects per stage timers (decode, assemble) and counters (bytes_read, 
+                 records_decoded, ...) and receives a 'read' event instead of the printed progress. Default is None
+        units: 'Pa' (default) returns float32 demeaned data in Pa. 'counts' returns the raw int32 counts 
+               (not demeaned, written Steim2 compressed by save2mseed) with the 
+               factor to Pa of every channel in tr.stats.calib (Pa = counts*calib, equal to the float32 Pa 
+               samples to float32 rounding). 16bit samples are counts of 2**-11 steps. Not compatible with cache
+        decimate: integer decimation factor (e.g. 4). The records are anti-alias filtered (FIR) and decimated 
+                  while they are read, with the filter state carried across the records (no edge effects), 
+                  so only the reduced rate data are kept in memory. Contiguous records are merged into one 
+                  trace per channel and the DC offset of the first record of a run is removed. Not 
+                  compatible with units='counts'. Default (None) is no decimation
 
     Returns
     -------
     Header: header structure containing the parameters names and values (Pandas DataFrame)
-    Waveforms: Obspy Stream object
+    Waveforms: Obspy Stream object or xarray DataArray
 
     '''
 
 
     
-    Header = read_header(file_name)
-    Waveforms = read_waveforms(file_name, Header, records_range, bit, sensitivity, gain)
+    with ShruFile(file_name) as shru:
+        Header = shru.header
+        Waveforms = read_waveforms(shru, Header, records_range, bit, sensitivity, gain, merge, output, cache, metrics, 
+                                   units, decimate)
 
 
 
@@ -67,18 +93,410 @@ def read_data(file_name, records_range, bit='24bit', sensitivity=170, gain=20):
 
 
 
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def iter_records(file_name, records_range, bit='24bit', sensitivity=170, gain=20, chunk_size=1, output='stream', merge=False,
+                 decimate=None):
+    '''
+    This function lazily reads the data from a .D 16 or 24 bit binary file. 
+    The records are decoded and yielded chunk by chunk so long recordings can be processed with bounded memory.
+
+
+    parameters
+    ----------
+        file_name: path to file
+        records_range: range of record sections to extact
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        chunk_size: number of records in every yielded chunk. Default is 1
+        output: 'stream' (default) yields an Obspy Stream per chunk. 
+                'array' yields a numpy array [records, channels, npts] (not demeaned) and a metadata dictionary 
+                (records, starttime per record, sampling_rate, network and header) per chunk
+        merge: if True, contiguous records of a chunk are merged into a single trace per channel. Default is False
+        decimate: integer decimation factor. The filter state is carried from chunk to chunk, every chunk yields 
+                  the decimated samples it completes and one more Stream with the last samples follows the 
+                  last chunk. 'array' yields a list of (starttime, [channels, samples]) segments and the 
+                  metadata. Default (None) is no decimation
+
+    Yields
+    -------
+    Waveforms: Obspy Stream object, or numpy array and metadata dictionary
+
+    Example
+    -------
+    for st in iter_records(file_name, range(0, 128), chunk_size=8):
+        process(st)
+
+    '''
+
+    with ShruFile(file_name) as shru:
+        yield from iter_waveforms(shru, shru.header, records_range, bit, sensitivity, gain, chunk_size, output, merge,
+                                  decimate)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_counts(file_name, records_range, bit='24bit'):
+    '''
+    This function reads the raw ADC counts of a .D binary file without calibration, to be calibrated 
+    later with calibrate. 16bit files are kept as their int16 floating gain words (half the memory of 
+    the float32 data), 24bit and pseudo 24bit files as int32 counts.
+
+
+    parameters
+    ----------
+        file_name: path to file
+        records_range: range of record sections to extact
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+
+    Returns
+    -------
+    Header: header structure containing the parameters names and values (Pandas DataFrame)
+    counts: numpy array [records, channels, npts] (int32, or int16 words for 16bit files)
+
+    Example
+    -------
+    Header, counts = read_counts(file_name, range(128))
+    data = calibrate(counts, Header, sensitivity=[170, 171, 169, 170])
+
+    '''
+
+    with ShruFile(file_name) as shru:
+        Header = shru.header
+        counts = decode_records_(shru, list(records_range), resolve_bit_(bit, Header), None, None, calibrate=False)
+
+    return Header, counts
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def calibrate(counts, Header, bit='24bit', sensitivity=170, gain=20, out=None):
+    '''
+    This function calibrates raw counts (see read_counts) to Pa with one precomputed factor per channel.
+
+
+    parameters
+    ----------
+        counts: numpy array [..., channels, npts] of counts (from read_counts)
+        Header: header of the file (read_header or read_counts)
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        out: float32 array of the same shape to write to. Can be counts itself when counts is float32 
+             (calibration in place). Default (None) is a new array
+
+    Returns
+    -------
+    numpy array with the data in Pa (float32)
+
+    '''
+
+    bit = resolve_bit_(bit, Header)
+    decoder_(bit)
+
+    chan_num = counts.shape[-2]
+    sensitivity, gain = calibration_(sensitivity, gain, Header, chan_num)
+
+    if out is None:
+        out = np.empty(counts.shape, dtype=np.float32)
+
+    if bit == '16bit':
+        unpack_16bit_(counts, out)
+    elif out is not counts:
+        out[...] = counts
+
+    return calibrate_(out, calibration_factors_(bit, sensitivity, gain))
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_directory(path, pattern='*.D*', records_range=None, bit='24bit', sensitivity=170, gain=20, merge=False,
+                   workers=None, records_per_task=None, errors='raise'):
+    '''
+    This function reads all the .D files of a SHRU deployment directory in parallel (process pool)
+
+
+    parameters
+    ----------
+        path: directory, glob pattern or list of files
+        pattern: glob pattern of the files in the directory. Default is '*.D*' (MMddhhmm.Dss)
+        records_range: range of record sections to extact from every file. Default (None) is all records
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        merge: if True, contiguous records are merged into a single trace per channel. Default is False
+        workers: number of worker processes. Default (None) is the number of cores
+        records_per_task: split the records of large files into tasks of this size. Default (None) is one task per file
+        errors: policy for files that can not be read. 'raise' (default) aborts, 'warn' and 'ignore' skip the file
+
+    Returns
+    -------
+    Headers: header values of all the files, one column per file (Pandas DataFrame)
+    Waveforms: Obspy Stream object in time order
+
+    '''
+
+    import pandas as pd
+    from obspy import Stream
+
+    headers = {}
+    traces = []
+
+    for file_name, Header, Waveforms in iter_directory(path, pattern, records_range, bit, sensitivity, gain, merge, 
+                                                       workers, records_per_task, errors):
+        headers[file_name] = Header[0]
+        traces.extend(Waveforms.traces)
+
+    Headers = pd.DataFrame(headers)
+    Waveforms = Stream(traces=traces)
+
+    return Headers, Waveforms
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def iter_directory(path, pattern='*.D*', records_range=None, bit='24bit', sensitivity=170, gain=20, merge=False,
+                   workers=None, records_per_task=None, errors='raise'):
+    '''
+    This function reads all the .D files of a SHRU deployment directory in parallel (process pool) 
+    and yields the results in time order as soon as they are ready
+
+
+    parameters
+    ----------
+        same as read_directory
+
+    Yields
+    -------
+    file_name: path to file
+    Header: header structure containing the parameters names and values (Pandas DataFrame)
+    Waveforms: Obspy Stream object (all the records of the file, or records_per_task records)
+
+    '''
+
+    files = list_files(path, pattern)
+
+    yield from iter_files(files, records_range, bit, sensitivity, gain, merge, workers, records_per_task, errors)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_time_window(index, starttime, endtime, channels=None, bit='24bit', sensitivity=170, gain=20, units='Pa'):
+    '''
+    This function reads a time window using a prebuilt index (see scan_headers). 
+    Only the records that cover the window are decoded and the first and last records are trimmed 
+    to the requested samples.
+
+
+    parameters
+    ----------
+        index: index table or path to an index file
+        starttime: start of the time window (UTCDateTime, datetime or string)
+        endtime: end of the time window (UTCDateTime, datetime or string)
+        channels: list of channel numbers (1, 2, ...) to return. Default (None) is all channels
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        units: 'Pa' (default) or 'counts', raw int32 counts with the factor to Pa in tr.stats.calib (see read_data)
+
+    Returns
+    -------
+    Waveforms: Obspy Stream object, merged per channel (one trace per channel and continuous segment 
+               when the window spans a gap)
+
+    '''
+
+    from obspy import UTCDateTime, Stream
+
+    if units not in ('Pa', 'counts'):
+        raise ValueError("units can get 'Pa' or 'counts', not " + repr(units))
+
+    starttime = UTCDateTime(starttime)
+    endtime = UTCDateTime(endtime)
+    rows = query_records(index, starttime, endtime)
+    traces = []
+
+    for file_name, file_rows in rows.groupby('file_name', sort=False):
+
+        records = file_rows['record'].tolist()
+
+        with ShruFile(file_name) as shru:
+            if units == 'counts':
+                data, calib = decode_counts_(shru, records, resolve_bit_(bit, shru.header), sensitivity, gain)
+            else:
+                data, calib = decode_records_(shru, records, resolve_bit_(bit, shru.header), sensitivity, gain), None
+                demean_(data)
+            starttimes = shru.starttimes(records)
+            header_df = shru.header
+
+        traces.extend(assemble_traces_(data, records, header_df, True, starttimes, calib))
+
+    Waveforms = Stream(traces=traces)
+
+    if channels is not None:
+        stations = ['CHN0'+str(c) for c in channels]
+        Waveforms = Stream(traces=[tr for tr in Waveforms if tr.stats.station in stations])
+
+    Waveforms.merge()
+    Waveforms.trim(starttime, endtime, nearest_sample=False)
+
+    # gaps between the records are masked by merge, the continuous parts are returned as traces
+    return Waveforms.split()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+
+
+
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def read_continuous(path, pattern='*.D*', starttime=None, endtime=None, bit='24bit', sensitivity=170, gain=20, 
+                    output='stream', units='Pa', tolerance=1, fill_value=None, max_gap=60):
+    '''
+    This function reads consecutive .D files (a deployment) as one continuous stream per channel.
+    Gaps and overlaps are detected from the start time in the header of every record and reported. 
+    The records are copied once into a preallocated [channels, samples] array of the covered samples, 
+    so long windows do not need obspy's merge over many small traces and a clock jump does not allocate 
+    its gap.
+
+
+    parameters
+    ----------
+        path: directory, glob pattern or list of files (ordered by the time of their first record)
+        pattern: glob pattern of the files in a directory. Default is '*.D*'
+        starttime: start of the window (UTCDateTime, datetime or string). Default (None) is the first record
+        endtime: end of the window. Default (None) is the end of the last record
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        output: 'stream' (default) returns one trace per channel and continuous segment (views of one array). 
+                'xarray' returns a single (channel, time) DataArray with fill_value in the gaps
+        units: 'Pa' (default, every record demeaned as in read_data) or 'counts' (raw int32 counts, see read_data).
+               Files of another SHRU, number of channels or sampling rate (or another calib in counts) 
+               raise a ValueError
+        tolerance: header time jitter [samples] still treated as contiguous. Default is 1
+        fill_value: value of the gap samples of the array. Default (None) is NaN for Pa and 0 for counts
+        max_gap: xarray only, longest gap [s] filled with fill_value. The time coordinate jumps over longer 
+                 gaps, which are reported with a warning. Default is 60
+
+    Returns
+    -------
+    Header: header of the first file (Pandas DataFrame)
+    Waveforms: Obspy Stream object or xarray DataArray
+    gaps: gaps and overlaps (Pandas DataFrame): file name and record after the gap, type ('gap' or 'overlap'), 
+          expected and actual start time, and the size in samples (negative for overlaps)
+
+    Example
+    -------
+    Header, Waveforms, gaps = read_continuous('/data/shru1/', starttime='2021-01-01', endtime='2021-01-08')
+
+    '''
+
+    return read_continuous_(list_files(path, pattern), starttime, endtime, bit, sensitivity, gain, output, units, 
+                            tolerance, fill_value, max_gap)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
 
+def spectrogram(path, pattern='*.D*', out=None, nperseg=4096, overlap=0.5, window='hann', interval=None, starttime=None, 
+                endtime=None, bit='24bit', sensitivity=170, gain=20, chunk_size=16, workers=None, metrics=None):
+    '''
+    This function computes the spectrogram, or the Welch PSD of every time interval, of consecutive .D files 
+    in one bounded memory pass, without creating Streams. The records are decoded chunk by chunk and cut 
+    into frames that run across record and file boundaries. The PSDs of all the channels and frames of a 
+    chunk are computed with one batched FFT, and the files are processed in parallel.
 
 
+    parameters
+    ----------
+        path: directory, glob pattern or list of files
+        pattern: glob pattern of the files in a directory. Default is '*.D*'
+        out: Zarr store the spectra are appended to while they are computed (float32). Default (None) keeps 
+             them in memory
+        nperseg: samples per frame (FFT length). Default is 4096
+        overlap: overlap of the frames (fraction of nperseg). Default is 0.5
+        window: window of the frames (see scipy.signal.get_window). Default is 'hann'
+        interval: averaging interval [s] of the Welch PSDs (e.g. 60 or 3600), aligned to UTC. 
+                  Default (None) is one spectrum per frame (spectrogram)
+        starttime: start time of the records to process. Default (None) is the first record
+        endtime: end time of the records to process. Default (None) is the last record
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        chunk_size: number of records decoded at once. Default is 16
+        workers: number of files processed in parallel. Default (None) is the number of cores
+        metrics: Metrics object that collects per stage timers (decode, fft, write) and counters (frames, 
+                 spectra_written, ...) and receives a 'spectra' event per file instead of the progress bar. 
+                 Default is None
 
+    Returns
+    -------
+    Spectra: xarray Dataset with psd [Pa^2/Hz] (channel, time, frequency), the start time of every frame 
+             (or interval) and the number of frames averaged in every time (frames)
 
+    Example
+    -------
+    Spectra = spectrogram('/data/shru1/', out='shru1_psd.zarr', nperseg=8192, interval=60)
 
+    '''
 
+    return spectrogram_(list_files(path, pattern), out, nperseg, overlap, window, interval, starttime, endtime, bit, 
+                        sensitivity, gain, chunk_size, workers, metrics)
 
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
-def save2mseed(waveforms, dir_name='./Results/'):
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def save2mseed(waveforms, dir_name='./Results/', group=None, encoding=None, workers=None, append=False, metrics=None):
     '''
     This function teads the data from a .D 24 bit binary file
 
@@ -88,6 +506,50 @@ def save2mseed(waveforms, dir_name='./Results/'):
         waveforms: obspy strem 
         dir_name: directory to save the data to in a year/network/station structure. 
                   default directory is /Results/
+        group: None (default) writes one file per trace. 'hour' or 'day' groups the traces of every 
+               channel into hour-long or day-long files
+        encoding: mseed encoding. Default (None) is FLOAT32 for Pa data and STEIM2 for counts 
+                  (units='counts'). 'STEIM2', 'STEIM1', 'INT32' and 'INT16' need integer data. MiniSEED does 
+                  not keep the calib of counts, it is written to a dir_name/calib.csv table with a row per 
+                  file, channel and calib (file relative to dir_name, id as written, starttime, endtime, calib)
+        workers: number of threads that encode and write the files in parallel
+        append: if True, append to existing files (writing chunk by chunk into day-long files). 
+                A set of file names appends only to these files (the files written earlier in the same run) 
+                and overwrites the others, the written files are added to the set. Default is False
+        metrics: Metrics object that collects the write time and counters (files, directories, samples, bytes) 
+                 instead of the printed progress. Default is None
+
+    Returns
+    -------
+    Nothing
+
+
+    '''
+
+    save2mseed_(waveforms, dir_name, group, encoding, workers, append, metrics)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def save2xarray(waveforms, file_name, format='zarr', chunk_size=None, append=False):
+    '''
+    This function saves (channel, time) waveforms (read_data(..., output='xarray')) to a chunked 
+    Zarr store or NetCDF file, so whole deployments can be stored and sliced without MiniSEED
+
+
+    parameters
+    ----------
+        waveforms: xarray DataArray
+        file_name: Zarr store (directory) or NetCDF file
+        format: 'zarr' (default) or 'netcdf'
+        chunk_size: number of samples per chunk along time. Default (None) is one record
+        append: if True, append along time to an existing Zarr store. Default is False
 
     Returns
     -------
@@ -96,10 +558,71 @@ def save2mseed(waveforms, dir_name='./Results/'):
 
     '''
 
-    save2mseed_(waveforms, dir_name)
+    save2xarray_(waveforms, file_name, format, chunk_size, append)
 
 # -------------------------------------------------------------------------------------------------
 # -------------------------------------------------------------------------------------------------
 
 
 
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def convert(inputs, out='./Results/', format='mseed', bit='24bit', sensitivity=170, gain=20, chunk_size=16, 
+            pattern='*.D*', io_threads=2, workers=None, queue_size=4, group='day', encoding=None, manifest=None, 
+            watch=False, poll_interval=60, metrics=None, units='Pa', decimate=None, errors='warn'):
+    '''
+    This function converts .D files to a mseed or zarr archive with bounded memory. 
+    Reading, decoding and writing run as overlapping stages connected by bounded queues 
+    (I/O threads -> decode workers -> writer).
+
+
+    parameters
+    ----------
+        inputs: directory, glob pattern or list of files
+        out: output directory (mseed, year/network/station structure) or Zarr store (zarr). 
+             default directory is /Results/
+        format: 'mseed' (default) or 'zarr'
+        bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto' (detected from the header). Default is for 24.
+        sensitivity: default is 170. optional to set to different value, specify it per channel or give a 
+                     calibration table per SHRU and channel (see load_calibration)
+        gain: default sensor gain is 20. optional to specify it per channel
+        chunk_size: number of records decoded and written at once. Default is 16
+        pattern: glob pattern of the files in a directory. Default is '*.D*'
+        io_threads: number of reading threads. Default is 2
+        workers: number of decoding threads. Default (None) is the number of cores
+        queue_size: maximum number of chunks waiting between the stages. Default is 4
+        group: mseed only, 'day' (default) or 'hour' long files per channel, None for one file per record
+        encoding: mseed only, mseed encoding. Default (None) is FLOAT32 for Pa and STEIM2 for counts
+        units: 'Pa' (default) or 'counts', raw int32 counts with the factor to Pa in the calib of every 
+               trace (see read_data). The calib is kept in an out/calib.csv table (see save2mseed)
+        decimate: integer decimation factor. The records are anti-alias filtered and decimated before they 
+                  are written (see read_data), one filter state runs across the chunks and consecutive 
+                  files, so the archive is written at the reduced rate. The state is kept across the polls of
+                  watch mode, a rerun or resume of a manifest starts a new filter run. Default (None) is no decimation
+        manifest: SQLite file that keeps the converted records and written outputs of every file 
+                  (see load_manifest). Reruns skip converted files and resume partial files at the 
+                  first record that is not converted. Default is None
+        watch: if True, keep polling the inputs and convert newly offloaded files and records until 
+               interrupted (Ctrl-C). Requires a manifest. Default is False
+        poll_interval: seconds between polls in watch mode. Default is 60
+        metrics: Metrics object that collects per stage timers (read, decode, assemble, write, write_wait) and 
+                 counters, and receives a 'chunk' event per written chunk and a final 'convert' event 
+                 instead of the printed summary. Default is None
+        errors: policy for files whose header can not be read: 'raise', 'warn' (default) or 'ignore'. 
+                In watch mode, files without one complete record yet (still being offloaded) are left for 
+                the next poll
+
+    Returns
+    -------
+    Throughput statistics (dictionary): files, skipped, records, bytes, samples, seconds, MB/s, samples/s
+
+
+    '''
+
+    return convert_(inputs, out, format, bit, sensitivity, gain, chunk_size, pattern, io_threads, workers, 
+                    queue_size, group, encoding, manifest, watch, poll_interval, metrics, units, decimate, errors)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: streaming spectrograms and PSDs (Welch) computed from the records
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .input.help_functions_in import decode_records_, header_attrs_
+from .input.shru_file import ShruFile
+from .input.stitch import record_plan_, place_records_
+from .metrics import metrics_
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def spectrogram_(files, out=None, nperseg=4096, overlap=0.5, window='hann', interval=None, starttime=None, endtime=None,
+                 bit='24bit', sensitivity=170, gain=20, chunk_size=16, workers=None, metrics=None):
+    '''
+    this function computes the spectrogram (or the Welch PSDs of time intervals) of consecutive SHRU files
+    in one pass with bounded memory. The records are decoded chunk by chunk and cut into frames on one
+    sample grid, so frames run across record and file boundaries. The files are processed in parallel,
+    every file gets the end of the previous file as lead-in so the result does not depend on the split.
+
+    parameters
+    ----------
+    files: list of files
+    out: Zarr store the spectra are appended to while they are computed. Default (None) keeps them in memory
+    nperseg: samples per frame. Default is 4096
+    overlap: overlap of the frames (fraction of nperseg). Default is 0.5
+    window: window of the frames (scipy.signal.get_window). Default is 'hann'
+    interval: averaging interval [s]. The frames that start in an interval (aligned to UTC) are averaged
+              into one PSD (Welch). Default (None) is one spectrum per frame
+    starttime: start of the records to read. Default (None) is the first record
+    endtime: end of the records to read. Default (None) is the last record
+    bit: type of binry file. Can get: '24bit', '16bit', 'pseudo24bit' and 'auto'
+    sensitivity: default is 170. optional to set to different value, specify it per channel or
+                 give a calibration table (see load_calibration)
+    gain: default sensor gain is 20. optional to specify it per channel
+    chunk_size: number of records decoded at once. Default is 16
+    workers: number of files processed in parallel. Default (None) is the number of cores
+    metrics: Metrics object that collects the timers (decode, fft, write) and counters and receives a
+             'spectra' event per file instead of the progress bar. Default is None
+
+    Returns
+    -------
+    xarray Dataset with the psd [Pa^2/Hz] (channel, time, frequency) and the number of frames of every time
+    '''
+
+    import os
+    from tqdm import tqdm
+    from obspy import UTCDateTime
+    from scipy.signal import get_window
+
+    step = int(round(nperseg*(1 - overlap)))
+    if not 0 < step <= nperseg:
+        raise ValueError('overlap needs to be in [0, 1), not ' + repr(overlap))
+
+    metrics = metrics_(metrics)
+
+    plan = record_plan_(files, bit)
+    header_df = plan[0]['header']
+    sampling_rate = float(header_df.loc['sampling_rate'].values[0])
+
+    start_ns = None if starttime is None else UTCDateTime(starttime).ns
+    end_ns = None if endtime is None else UTCDateTime(endtime).ns
+    placement, _, t0 = place_records_(plan, sampling_rate, start_ns, end_ns, 1)
+    if not placement:
+        raise ValueError('no records between ' + str(starttime) + ' and ' + str(endtime))
+
+    engine = {'nperseg': nperseg,
+              'step': step,
+              'window': get_window(window, nperseg).astype(np.float32),
+              'sampling_rate': sampling_rate,
+              't0': t0,
+              'interval': None if interval is None else int(round(interval*1e9))}
+
+    tasks = spectral_tasks_(placement, nperseg, step)
+    progress = (lambda tasks: tasks) if metrics.enabled else tqdm
+
+    rows = SpectralRows_(out, header_df, engine, nperseg, overlap, window, interval, metrics)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        # a bounded number of files in flight, the results are merged in order
+        jobs = []
+        size = 2*(workers or os.cpu_count() or 1)
+
+        for task in progress(tasks):
+
+            jobs.append(pool.submit(spectral_task_, task, sensitivity, gain, chunk_size, engine, metrics))
+
+            if len(jobs) >= size:
+                rows.add(*jobs.pop(0).result())
+
+        for job in jobs:
+            rows.add(*job.result())
+
+    return rows.close()
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def spectral_tasks_(placement, nperseg, step):
+    '''
+    Help function that splits the placed records into one task per file. A task owns the frames that end
+    in its records (after the end of the previous files) and starts with the records of the previous files
+    these frames need.
+
+    Returns
+    -------
+    list of dictionaries (file_name, records [(file_name, bit, record, first sample)], first_frame)
+    '''
+
+    entries = [[(info['file_name'], info['bit'], rec, idx) for rec, idx in zip(records, idxs)]
+               for info, records, idxs, _ in placement]
+    npts = placement[0][3]
+
+    tasks = []
+    previous_end = None
+
+    for i, own in enumerate(entries):
+
+        boundary = own[0][3] if previous_end is None else max(own[0][3], previous_end)
+        first_frame = max(0, -(-(boundary - nperseg + 1)//step))
+
+        # records of the previous files that the first frames start in
+        lead_in = []
+        for earlier in reversed(entries[:i]):
+            needed = [entry for entry in earlier if first_frame*step < entry[3] + npts and entry[3] < own[0][3]]
+            lead_in = needed + lead_in
+            if not needed or earlier[0][3] <= first_frame*step:
+                break
+
+        tasks.append({'file_name': own[0][0], 'records': lead_in + own, 'first_frame': first_frame})
+
+        end = max(entry[3] for entry in own) + npts
+        previous_end = end if previous_end is None else max(previous_end, end)
+
+    return tasks
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def spectral_task_(task, sensitivity, gain, chunk_size, engine, metrics):
+    '''
+    Help function (worker) that decodes the records of a task chunk by chunk and returns its
+    spectra rows
+
+    Returns
+    -------
+    row times [ns], psd sums [channels, rows, frequencies], number of frames per row
+    '''
+
+    spectra = Spectra_(engine['nperseg'], engine['step'], engine['window'], engine['sampling_rate'], task['first_frame'])
+    results = []
+
+    # consecutive records of the same file are decoded together
+    groups = []
+    for entry in task['records']:
+        if groups and groups[-1][0][0] == entry[0] and len(groups[-1]) < chunk_size:
+            groups[-1].append(entry)
+        else:
+            groups.append([entry])
+
+    shru = None
+
+    try:
+        for group in groups:
+
+            if shru is None or shru.file_name != group[0][0]:
+                if shru is not None:
+                    shru.close()
+                shru = ShruFile(group[0][0])
+
+            records = [entry[2] for entry in group]
+            idxs = [entry[3] for entry in group]
+
+            with metrics.timer('decode'):
+                data = decode_records_(shru, records, group[0][1], sensitivity, gain)
+            metrics.add('records_decoded', len(records))
+            metrics.add('bytes_read', len(records)*shru.reclen)
+
+            with metrics.timer('fft'):
+                # contiguous records are one block, so the frames are batched
+                splits = [r for r in range(1, len(idxs)) if idxs[r] != idxs[r-1] + shru.npts]
+                for first, last in zip([0] + splits, splits + [len(idxs)]):
+                    block = data[first:last].transpose(1, 0, 2).reshape(data.shape[1], -1)
+                    frames, psd = spectra.push(block, idxs[first])
+                    if len(frames):
+                        results.append(spectral_rows_(frames, psd, engine))
+
+            del data
+
+    finally:
+        if shru is not None:
+            shru.close()
+
+    metrics.add('frames', sum(int(counts.sum()) for _, _, counts in results))
+    metrics.event('spectra', file_name=task['file_name'], records=len(task['records']))
+
+    return merge_rows_(results)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class Spectra_:
+    '''
+    Help class that cuts a continuous [channels, samples] signal into frames on a fixed sample grid
+    (frame k starts at sample k*step) block by block and returns their PSDs. The samples of the
+    frames that are not complete are carried to the next block. A block that is not contiguous with
+    the previous one drops them. The PSD is the one sided density of scipy.signal.spectrogram
+    (constant detrend), computed for all the channels and frames with one batched FFT.
+
+    parameters
+    ----------
+    nperseg: samples per frame
+    step: samples between the frames
+    window: window [nperseg]
+    sampling_rate: sampling rate [Hz]
+    first_frame: first frame to return. Default is 0
+    '''
+
+    def __init__(self, nperseg, step, window, sampling_rate, first_frame=0):
+
+        self.nperseg = nperseg
+        self.step = step
+        self.window = window
+        self.scale = 1/(sampling_rate*float(np.sum(window.astype(np.float64)**2)))
+        self.buffer = None
+        self.start = None               # sample index of buffer[:, 0]
+        self.next = first_frame         # next frame (it never goes back, overlapping data are skipped)
+
+
+    def push(self, data, start):
+        '''
+        Adds a block of samples that starts at sample index start
+
+        Returns
+        -------
+        frame numbers, psd [channels, frames, frequencies]
+        '''
+
+        if self.buffer is None or start != self.start + self.buffer.shape[1]:
+            self.buffer = data
+            self.start = start
+        else:
+            self.buffer = np.concatenate([self.buffer, data], axis=1)
+
+        self.next = max(self.next, -(-self.start//self.step))
+        last = (self.start + self.buffer.shape[1] - self.nperseg)//self.step
+
+        if last < self.next:
+            return np.empty(0, dtype=np.int64), None
+
+        first = self.next*self.step - self.start
+        frames = sliding_window_view(self.buffer, self.nperseg, axis=-1)[:, first:first + (last - self.next)*self.step + 1:self.step]
+        psd = self._psd(frames)
+        numbers = np.arange(self.next, last + 1)
+
+        # only the samples of the next frames are kept
+        self.next = last + 1
+        drop = min(self.next*self.step - self.start, self.buffer.shape[1])
+        self.buffer = self.buffer[:, drop:]
+        self.start += drop
+
+        return numbers, psd
+
+
+    def _psd(self, frames):
+
+        from scipy.fft import rfft
+
+        x = frames - frames.mean(axis=-1, keepdims=True)
+        x *= self.window
+
+        spectrum = rfft(x, axis=-1)
+        psd = spectrum.real**2
+        psd += spectrum.imag**2
+        psd *= self.scale
+
+        # one sided: every frequency but 0 (and Nyquist for an even nperseg) has the energy of two
+        psd[..., 1:None if self.nperseg % 2 else -1] *= 2
+
+        return psd
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def spectral_rows_(frames, psd, engine):
+    '''
+    Help function that turns frames into rows: one per frame, or the sum of the frames that start in
+    the same interval
+
+    Returns
+    -------
+    row times [ns], psd sums [channels, rows, frequencies], number of frames per row
+    '''
+
+    times = engine['t0'] + np.rint(frames*engine['step']*1e9/engine['sampling_rate']).astype(np.int64)
+
+    if engine['interval'] is None:
+        return times, psd, np.ones(len(times), dtype=np.int64)
+
+    bins = times//engine['interval']*engine['interval']
+    firsts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+
+    return bins[firsts], np.add.reduceat(psd, firsts, axis=1), np.diff(np.r_[firsts, len(bins)])
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def merge_rows_(results):
+    '''
+    Help function that concatenates spectra rows in time order (rows of the same interval are added)
+    '''
+
+    if not results:
+        return np.empty(0, dtype=np.int64), None, np.empty(0, dtype=np.int64)
+
+    times, psd, counts = results[0]
+    times, psd, counts = [times], [psd], [counts]
+
+    for t, p, c in results[1:]:
+        if t[0] == times[-1][-1]:
+            psd[-1][:, -1] += p[:, 0]
+            counts[-1][-1] += c[0]
+            t, p, c = t[1:], p[:, 1:], c[1:]
+        if len(t):
+            times.append(t)
+            psd.append(p)
+            counts.append(c)
+
+    return np.concatenate(times), np.concatenate(psd, axis=1), np.concatenate(counts)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+class SpectralRows_:
+    '''
+    Help class that collects the rows of the tasks in order. The last row can still get frames from the
+    next task, all the others are finished and appended to the Zarr store (or kept in memory).
+    '''
+
+    def __init__(self, out, header_df, engine, nperseg, overlap, window, interval, metrics):
+
+        self.out = out
+        self.metrics = metrics
+        self.pending = None
+        self.blocks = []
+        self.written = False
+        self.channels = ['CHN0'+str(c+1) for c in range(int(header_df.loc['channels'].values[0]))]
+        self.frequency = np.fft.rfftfreq(nperseg, 1/engine['sampling_rate'])
+
+        self.attrs = header_attrs_(header_df)
+        self.attrs.update({'nperseg': nperseg, 'overlap': overlap, 'window': str(window), 'units': 'Pa^2/Hz',
+                           'interval': 'frame' if interval is None else interval})
+
+
+    def add(self, times, psd, counts):
+
+        if not len(times):
+            return
+
+        if self.pending is not None:
+            times, psd, counts = merge_rows_([self.pending, (times, psd, counts)])
+
+        # the last row is finished by the next task
+        if len(times) > 1:
+            self._write(times[:-1], psd[:, :-1], counts[:-1])
+
+        self.pending = (times[-1:], psd[:, -1:], counts[-1:])
+
+
+    def close(self):
+
+        if self.pending is not None:
+            self._write(*self.pending)
+            self.pending = None
+
+        if self.out is not None:
+            import xarray as xr
+            return xr.open_zarr(self.out)
+
+        if not self.blocks:
+            return self._dataset(np.empty(0, dtype=np.int64),
+                                 np.empty((len(self.channels), 0, len(self.frequency)), dtype=np.float32),
+                                 np.empty(0, dtype=np.int64))
+
+        import xarray as xr
+        return xr.concat(self.blocks, dim='time')
+
+
+    def _dataset(self, times, psd, counts):
+
+        import xarray as xr
+
+        psd = (psd/counts[None, :, None]).astype(np.float32)
+
+        return xr.Dataset({'psd': (('channel', 'time', 'frequency'), psd),
+                           'frames': ('time', counts.astype(np.int32))},
+                          coords={'channel': self.channels,
+                                  'time': times.astype('datetime64[ns]'),
+                                  'frequency': self.frequency},
+                          attrs=self.attrs)
+
+
+    def _write(self, times, psd, counts):
+
+        dataset = self._dataset(times, psd, counts)
+        self.metrics.add('spectra_written', len(times))
+
+        if self.out is None:
+            self.blocks.append(dataset)
+            return
+
+        with self.metrics.timer('write'):
+            if self.written:
+                dataset.to_zarr(self.out, append_dim='time')
+            else:
+                # the times of all the appended rows keep nanosecond precision
+                dataset.to_zarr(self.out, mode='w', encoding={'time': {'units': 'nanoseconds since 1970-01-01', 
+                                                                       'dtype': 'int64'}})
+                self.written = True
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
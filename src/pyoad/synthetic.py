@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Python module to read the .D binary data files
+
+.. module:: synthetic SHRU file generator (benchmarks and examples)
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import numpy as np
+
+from .input.help_functions_in import shru_header
+
+
+# bytes per sample of every binary file type
+sample_bytes_ = {'24bit': 3, '16bit': 2, 'pseudo24bit': 4}
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def write_synthetic(file_name, records=128, channels=4, npts=4096, sampling_rate=2000, bit='24bit',
+                    starttime='2021-01-01T00:00:00', shru_num=1, seed=0):
+    '''
+    this function writes a synthetic SHRU .DXX file: every record has a valid 1024 bytes shru_header
+    followed by the channel interleaved samples (a sine per channel plus noise).
+
+    parameters
+    ----------
+    file_name: path to file
+    records: number of records. Default is 128
+    channels: number of channels. Default is 4
+    npts: number of samples per record and channel. Default is 4096
+    sampling_rate: sampling rate [Hz]. Default is 2000
+    bit: type of binry file. Can get: '24bit' (default), '16bit' and 'pseudo24bit'
+    starttime: start time of the first record (string or datetime). Default is '2021-01-01T00:00:00'
+    shru_num: SHRU number. Default is 1
+    seed: seed of the noise. Default is 0
+
+    Returns
+    -------
+    number of bytes written
+    '''
+
+    if bit not in sample_bytes_:
+        raise ValueError('bit can get ' + ', '.join(repr(b) for b in sample_bytes_) + ', not ' + repr(bit))
+
+    data_bytes = npts*channels*sample_bytes_[bit]
+    record_dtype = np.dtype([('header', shru_header), ('data', np.uint8, (data_bytes,))])
+    out = np.zeros(records, dtype=record_dtype)
+
+    synthetic_headers_(out['header'], channels, npts, sampling_rate, shru_header.itemsize + data_bytes,
+                       np.datetime64(str(starttime).rstrip('Z'), 'ns'), shru_num)
+
+    # a sine per channel plus noise, in ADC counts of the 24 bit scale
+    rng = np.random.default_rng(seed)
+    t = np.arange(records*npts)/sampling_rate
+    freqs = sampling_rate/20*(np.arange(channels) + 1)
+    signal = 2**20*np.sin(2*np.pi*t[:, np.newaxis]*freqs) + rng.normal(0, 2**14, (records*npts, channels))
+
+    out['data'] = encode_(signal, bit).reshape(records, data_bytes)
+
+    with open(file_name, 'wb') as f:
+        out.tofile(f)
+
+    return out.nbytes
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def synthetic_headers_(headers, channels, npts, sampling_rate, reclen, starttime, shru_num):
+    '''
+    Help function that fills the headers of all records (structured array, in place)
+    '''
+
+    records = len(headers)
+    times = starttime + (np.arange(records)*npts*1e9/sampling_rate).astype('timedelta64[ns]')
+    days = times.astype('datetime64[D]')
+    years = days.astype('datetime64[Y]')
+
+    headers['date'][:, 0] = years.astype(np.int64) + 1970
+    headers['date'][:, 1] = (days - years).astype(np.int64) + 1
+    headers['rec'] = np.arange(records)
+    headers['acq_recnum'] = np.arange(records)
+    headers['chan'] = channels
+    headers['npts'] = npts
+    headers['rhfs'] = sampling_rate
+    headers['reclen'] = reclen
+    headers['total_recoreds'] = records
+    headers['file_length'] = records*reclen
+
+    start = np.datetime_as_string(starttime, unit='m')
+    atime = np.char.encode(np.array([t[11:26] for t in np.datetime_as_string(times, unit='us')]), 'latin-1')
+    ascii_fields = {'atime': atime,
+                    'adate': np.char.encode(np.datetime_as_string(days), 'latin-1'),
+                    'record': np.char.encode(np.arange(records).astype(str), 'latin-1'),
+                    'shru_num': '%03d' % shru_num,
+                    'internal_temp': '23.5C',
+                    'bat_voltage': '14.2V',
+                    'bat_current': '120mA',
+                    'vla': 'vla0',
+                    'hla': 'hla0',
+                    'file_name': start[5:7] + start[8:10] + start[11:13] + start[14:16] + '.D%02d' % (shru_num % 100)}
+
+    for name, value in ascii_fields.items():
+        width = headers[name].shape[-1]
+        field = np.zeros(records, dtype='S' + str(width))
+        field[:] = value
+        headers[name] = field.view('b').reshape(records, width)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def encode_(signal, bit):
+    '''
+    Help function that encodes samples [samples, channels] (24 bit ADC counts) to the interleaved
+    big-endian bytes of a binary file type
+    '''
+
+    if bit == '16bit':
+
+        # floating gain: 14 bit mantissa and a 2 bit gain code g, the value is mantissa/8**g
+        # (in 16 bit counts), the largest g that keeps the mantissa in range is used
+        counts = signal/2**10
+        magnitude = np.maximum(np.abs(counts), 1e-12)
+        g = np.clip(np.floor(np.log(8191/magnitude)/np.log(8)), 0, 3)
+        mantissa = np.clip(np.round(counts*8**g), -8192, 8191)
+
+        return (mantissa.astype(np.int16)*4 + g.astype(np.int16)).astype('>i2').view(np.uint8).reshape(-1)
+
+    counts = np.clip(np.round(signal), -2**23, 2**23 - 1).astype('>i4')
+
+    if bit == 'pseudo24bit':
+        return (counts << 8).astype('>i4').view(np.uint8).reshape(-1)
+
+    return counts.view(np.uint8).reshape(-1, 4)[:, 1:].reshape(-1)
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the tests: small synthetic SHRU deployments
+
+.. module:: test fixtures
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import numpy as np
+import pytest
+
+from pyoad import write_synthetic
+
+
+RECORDS = 8
+NPTS = 1024
+SAMPLING_RATE = 2000
+STARTTIME = np.datetime64('2021-01-01T00:00:00', 'us')
+
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+def write_files(dir_name, num_files, gap=0, records=RECORDS, bit='24bit'):
+    '''
+    Writes num_files consecutive synthetic files, every file after the first starts gap samples 
+    after the end of the previous one. Returns the file names
+    '''
+
+    files = []
+    start = STARTTIME
+    for i in range(num_files):
+        file_name = str(dir_name / ('0101%04d.D01' % i))
+        write_synthetic(file_name, records, npts=NPTS, sampling_rate=SAMPLING_RATE, bit=bit, starttime=str(start), 
+                        seed=i)
+        files.append(file_name)
+        start += np.timedelta64(int(round((records*NPTS + gap)*1e6/SAMPLING_RATE)), 'us')
+
+    return files
+
+# -------------------------------------------------------------------------------------------------
+# -------------------------------------------------------------------------------------------------
+
+
+
+@pytest.fixture
+def deployment(tmp_path):
+    '''
+    Three contiguous files of a deployment
+    '''
+
+    dir_name = tmp_path / 'deployment'
+    dir_name.mkdir()
+
+    return write_files(dir_name, 3)
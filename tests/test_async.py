@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the asyncio reader on a throttled file system
+
+.. module:: async read tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import time
+import asyncio
+
+import numpy as np
+import pytest
+
+from bench_async import ThrottledOpener
+from pyoad import aiter_records, aread_data, read_counts, calibrate, read_header
+
+
+class FirstReadsSlow(ThrottledOpener):
+    '''
+    Throttled opener whose early records are the slowest, so the later reads finish first
+    '''
+
+    def delay(self, offset):
+        return 0.05 if offset < 4*self.reclen else 0.001
+
+
+
+async def collect(files, opener, chunk_size, max_inflight_bytes=64*1024**2, consumer_delay=0, reclen=None):
+    '''
+    Collects the chunks of aiter_records and the bytes read ahead of the consumer at every chunk
+    '''
+
+    chunks, ahead = [], []
+    async for data, metadata in aiter_records(files, chunk_size=chunk_size, output='array', 
+                                              max_inflight_bytes=max_inflight_bytes, io_threads=4, opener=opener):
+        chunks.append((metadata['header'], metadata['records'], data))
+        if reclen is not None:
+            yielded = sum(len(records) for _, records, _ in chunks)*reclen
+            ahead.append(opener.bytes_read - 1024*len(files) - yielded)
+        await asyncio.sleep(consumer_delay)
+
+    return chunks, ahead
+
+
+
+def test_chunks_in_order(deployment):
+    '''
+    The chunks are yielded in file and record order when the later reads finish first
+    '''
+
+    reclen = int(read_header(deployment[0]).loc['reclen'].values[0])
+    opener = FirstReadsSlow(0)
+    opener.reclen = reclen
+
+    chunks, _ = asyncio.run(collect(deployment[:2], opener, 3))
+
+    assert [records for _, records, _ in chunks] == [[0, 1, 2], [3, 4, 5], [6, 7]]*2
+
+    for file_name, i in zip(deployment[:2], (0, 3)):
+        Header, counts = read_counts(file_name, range(8))
+        data = np.concatenate([data for _, _, data in chunks[i:i + 3]])
+        np.testing.assert_array_equal(data, calibrate(counts, Header))
+
+
+
+def test_bytes_in_flight_are_bounded(deployment):
+    '''
+    A slow consumer does not let the reads run further ahead than max_inflight_bytes
+    '''
+
+    reclen = int(read_header(deployment[0]).loc['reclen'].values[0])
+    opener = ThrottledOpener(0.001)
+
+    chunks, ahead = asyncio.run(collect(deployment, opener, 2, max_inflight_bytes=4*reclen, consumer_delay=0.02, 
+                                        reclen=reclen))
+
+    assert len(chunks) == 12
+    assert max(ahead) <= 4*reclen
+    assert max(ahead) > 0        # the reads do run ahead of the consumer
+
+
+
+def test_read_error_propagates_and_closes_files(deployment):
+    '''
+    A failed read is raised in order (after the chunks before it) and no file stays open
+    '''
+
+    reclen = int(read_header(deployment[0]).loc['reclen'].values[0])
+    opener = ThrottledOpener(0.005, fail_at=4*reclen + 10)
+
+    chunks = []
+
+    async def run():
+        async for data, metadata in aiter_records(deployment[0], chunk_size=2, output='array', io_threads=4, 
+                                                  opener=opener):
+            chunks.append(metadata['records'])
+
+    with pytest.raises(OSError, match='throttled read failed'):
+        asyncio.run(run())
+
+    assert chunks == [[0, 1], [2, 3]]
+
+    # reads still running in the I/O threads finish and close their files
+    for _ in range(100):
+        if opener.open_files == 0:
+            break
+        time.sleep(0.01)
+    assert opener.open_files == 0
+
+    with pytest.raises(OSError):
+        asyncio.run(aread_data(deployment[0], range(8), chunk_size=2, opener=ThrottledOpener(0, fail_at=4*reclen)))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the decimation while reading
+
+.. module:: decimation tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import numpy as np
+import pytest
+
+from pyoad import ShruFile
+from pyoad.input.decimate import read_decimated_
+
+
+@pytest.mark.parametrize('factor', [2, 5])
+def test_decimation_independent_of_chunk_size(deployment, factor):
+    '''
+    The filter state runs across the chunks, so the decimated samples do not depend on the chunk size
+    '''
+
+    results = []
+    for chunk_size in (1, 3, 8):
+        with ShruFile(deployment[0]) as shru:
+            segments = read_decimated_(shru, list(range(len(shru))), '24bit', 170, 20, factor, chunk_size=chunk_size)
+        results.append(segments)
+
+    for segments in results:
+        assert len(segments) == len(results[0])
+        starttime = results[0][0][0]
+        data = np.concatenate([block for _, block in results[0]], axis=1)
+        assert segments[0][0] == starttime
+        np.testing.assert_array_equal(np.concatenate([block for _, block in segments], axis=1), data)
+
+    # every input sample is represented once at the reduced rate
+    with ShruFile(deployment[0]) as shru:
+        assert data.shape == (shru.chan_num, -(-len(shru)*shru.npts//factor))
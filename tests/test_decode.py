@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the vectorized record decoders against the reference per sample loops
+
+.. module:: decoder tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import numpy as np
+import pytest
+
+from bench_decode import decode_24bit_loop, decode_16bit_loop, random_record_
+from pyoad.input.help_functions_in import decode_24bit_, decode_16bit_
+
+
+@pytest.mark.parametrize('bit', ['24bit', '16bit'])
+@pytest.mark.parametrize('sensitivity, gain', [(170, 20), ([170, 171, 172, 173], [20, 20, 10, 1])])
+def test_decoder_matches_loop(bit, sensitivity, gain):
+    '''
+    The vectorized decoders agree with the original loops to the float32 rounding
+    '''
+
+    byte_step, decode_loop, decode = {'24bit': (3, decode_24bit_loop, decode_24bit_),
+                                      '16bit': (2, decode_16bit_loop, decode_16bit_)}[bit]
+
+    data_binary = random_record_(4, 2048, byte_step, seed=1)
+    new = decode(data_binary, 4, np.asarray(sensitivity), np.asarray(gain, dtype=float))
+
+    for c in range(4):
+        s = sensitivity[c] if isinstance(sensitivity, list) else sensitivity
+        g = gain[c] if isinstance(gain, list) else gain
+        ref = decode_loop(data_binary, 4, s, g)[c]
+        assert new.shape == (4, 2048)
+        np.testing.assert_allclose(new[c], ref, rtol=1e-6, atol=1e-6*np.abs(ref).max())
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the header index and the time windows read with it
+
+.. module:: index tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import glob
+
+import numpy as np
+
+from pyoad import scan_headers, read_time_window, write_synthetic
+from pyoad.cli import main
+from conftest import RECORDS, NPTS
+
+
+def gap_files(tmp_path):
+    '''
+    Two files of 4.096 s that start at 00:00:00 and 00:00:05 (a 0.904 s gap)
+    '''
+
+    for name, starttime in (('a.D01', '2021-01-01T00:00:00'), ('b.D01', '2021-01-01T00:00:05')):
+        write_synthetic(str(tmp_path / name), RECORDS, npts=NPTS, starttime=starttime)
+
+    return str(tmp_path / '*.D01')
+
+
+
+def test_time_window_across_gap(tmp_path):
+    '''
+    A window that spans a gap between files returns unmasked traces on both sides of the gap
+    '''
+
+    from obspy import UTCDateTime
+
+    index = scan_headers(gap_files(tmp_path))
+    Waveforms = read_time_window(index, '2021-01-01T00:00:01', '2021-01-01T00:00:07')
+
+    assert len(Waveforms) == 8
+    assert not any(np.ma.isMaskedArray(tr.data) for tr in Waveforms)
+
+    for tr in Waveforms.select(station='CHN01'):
+        assert tr.stats.starttime in (UTCDateTime('2021-01-01T00:00:01'), UTCDateTime('2021-01-01T00:00:05'))
+        assert tr.stats.endtime in (UTCDateTime('2021-01-01T00:00:04.0955'), UTCDateTime('2021-01-01T00:00:07'))
+
+
+
+def test_extract_time_window_across_gap(tmp_path):
+    '''
+    pyoad extract writes a window that spans a gap to mseed
+    '''
+
+    from obspy import read
+
+    main(['extract', gap_files(tmp_path), '--starttime', '2021-01-01T00:00:01', '--endtime', '2021-01-01T00:00:07', 
+          '--out', str(tmp_path / 'out'), '--group', 'day'])
+
+    stream = read(str(tmp_path / 'out' / '*' / '*' / '*' / '*'))
+    stream.merge(method=-1)
+
+    assert len(stream) == 8
+    assert sum(tr.stats.npts for tr in stream) == 4*(int(3.096*2000) + 2*2000 + 1)
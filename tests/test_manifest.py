@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the convert manifest (skipped and resumed files)
+
+.. module:: manifest tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import glob
+
+import numpy as np
+import pytest
+
+from pyoad import convert, load_manifest, Metrics
+
+
+def read_archive(dir_name):
+    '''
+    Reads every mseed file of an archive into one merged and sorted Stream
+    '''
+
+    from obspy import Stream, read
+
+    stream = Stream()
+    for file_name in glob.glob(os.path.join(dir_name, '*', '*', '*', '*')):
+        stream += read(file_name)
+    stream.merge(method=-1)
+    stream.sort()
+
+    return stream
+
+
+
+@pytest.mark.parametrize('decimate', [None, 4])
+def test_manifest_resumes_grown_file(deployment, tmp_path, decimate):
+    '''
+    A rerun converts only the new records of a grown file and the archive equals a one pass convert
+    '''
+
+    full = deployment[0]
+    growing = str(tmp_path / os.path.basename(full))
+    manifest = str(tmp_path / 'manifest.sqlite')
+
+    with open(full, 'rb') as f:
+        data = f.read()
+    reclen = len(data)//8
+
+    # the first 5 records are offloaded
+    with open(growing, 'wb') as f:
+        f.write(data[:5*reclen])
+
+    stats = convert([growing], out=str(tmp_path / 'archive'), manifest=manifest, chunk_size=2, decimate=decimate, 
+                    metrics=Metrics())
+    assert stats['records'] == 5
+    assert load_manifest(manifest)['records_done'].tolist() == [5]
+
+    # the rest of the file follows
+    with open(growing, 'wb') as f:
+        f.write(data)
+
+    stats = convert([growing], out=str(tmp_path / 'archive'), manifest=manifest, chunk_size=2, decimate=decimate, 
+                    metrics=Metrics())
+    assert stats['records'] == 3
+
+    entry = load_manifest(manifest).iloc[0]
+    assert entry['records_done'] == entry['num_records'] == 8
+
+    # an unchanged file is skipped
+    stats = convert([growing], out=str(tmp_path / 'archive'), manifest=manifest, decimate=decimate, metrics=Metrics())
+    assert stats['records'] == 0 and stats['skipped'] == 1
+
+    convert([full], out=str(tmp_path / 'reference'), chunk_size=2, decimate=decimate, metrics=Metrics())
+    archive, reference = read_archive(str(tmp_path / 'archive')), read_archive(str(tmp_path / 'reference'))
+
+    assert len(archive) == len(reference) == 4
+    for tr, ref in zip(archive, reference):
+        assert tr.stats.starttime == ref.stats.starttime
+        assert tr.stats.npts == ref.stats.npts
+        if decimate is None:
+            np.testing.assert_array_equal(tr.data, ref.data)
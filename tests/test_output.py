@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the mseed output
+
+.. module:: output tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import os
+import csv
+
+import numpy as np
+import pytest
+
+from pyoad import convert, read_data, save2mseed, read_counts, calibrate, Metrics
+from conftest import write_files
+
+
+def read_calibrated(dir_name):
+    '''
+    Reads a counts archive and applies the calib of the calib.csv table, returns {id: Pa data}
+    '''
+
+    from obspy import Stream, UTCDateTime, read
+
+    with open(os.path.join(dir_name, 'calib.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    stream = Stream()
+    for row in rows:
+        for tr in read(os.path.join(dir_name, row['file'])).select(id=row['id']):
+            tr.trim(UTCDateTime(row['starttime']), UTCDateTime(row['endtime']))
+            tr.data = tr.data*float(row['calib'])
+            stream += tr
+
+    # every file of the tree is mseed (the table is outside the waveform tree)
+    assert len(read(os.path.join(dir_name, '*', '*', '*', '*'))) == len(stream)
+
+    stream.merge(method=-1)
+
+    return {tr.stats.station: tr.data for tr in stream}
+
+
+
+def reference_pa(files, bit='24bit'):
+    '''
+    Calibrated (not demeaned) samples of the files per channel
+    '''
+
+    data = []
+    for file_name in files:
+        Header, counts = read_counts(file_name, range(8), bit)
+        data.append(np.concatenate(list(calibrate(counts, Header, bit)), axis=-1))
+
+    data = np.concatenate(data, axis=-1)
+
+    return {'CHN0'+str(c+1): data[c] for c in range(data.shape[0])}
+
+
+
+@pytest.mark.parametrize('writer', ['convert', 'save2mseed'])
+@pytest.mark.parametrize('bit', ['24bit', '16bit'])
+def test_counts_round_trip(tmp_path, writer, bit):
+    '''
+    Counts read back from mseed and scaled by the calib of the table equal the Pa samples
+    (to float32 rounding, also for the floating gain words of 16bit files)
+    '''
+
+    (tmp_path / 'deployment').mkdir()
+    deployment = write_files(tmp_path / 'deployment', 3, bit=bit)
+    out = str(tmp_path / 'archive')
+
+    if writer == 'convert':
+        convert(deployment, out=out, bit=bit, units='counts', chunk_size=3, metrics=Metrics())
+    else:
+        written = set()
+        for file_name in deployment:
+            Header, Waveforms = read_data(file_name, range(8), bit, units='counts', metrics=Metrics())
+            save2mseed(Waveforms, out, group='day', append=written, metrics=Metrics())
+
+    data = read_calibrated(out)
+    reference = reference_pa(deployment, bit)
+
+    assert sorted(data) == sorted(reference)
+    for station in reference:
+        np.testing.assert_allclose(data[station], reference[station], rtol=1e-6, 
+                                   atol=1e-6*np.abs(reference[station]).max())
+
+
+
+def test_pa_rewrite_drops_calib_rows(deployment, tmp_path):
+    '''
+    Files overwritten with Pa data lose their calib rows
+    '''
+
+    out = str(tmp_path / 'archive')
+    convert(deployment[:1], out=out, units='counts', metrics=Metrics())
+    convert(deployment[:1], out=out, metrics=Metrics())
+
+    with open(os.path.join(out, 'calib.csv'), newline='') as f:
+        assert list(csv.DictReader(f)) == []
+
+
+
+@pytest.mark.parametrize('writer', ['convert', 'save2mseed'])
+def test_bytes_written_of_appended_files(deployment, tmp_path, writer):
+    '''
+    Appending to day files counts only the added bytes, so bytes_written is the size of the archive
+    '''
+
+    import glob
+
+    out = str(tmp_path / 'archive')
+    metrics = Metrics()
+
+    if writer == 'convert':
+        convert(deployment, out=out, chunk_size=3, metrics=metrics)
+    else:
+        written = set()
+        for file_name in deployment:
+            Header, Waveforms = read_data(file_name, range(8), metrics=Metrics())
+            save2mseed(Waveforms, out, group='day', append=written, metrics=metrics)
+
+    files = glob.glob(os.path.join(out, '*', '*', '*', '*'))
+    assert len(files) == 4
+    assert metrics.summary()['bytes_written'] == sum(os.path.getsize(fname) for fname in files)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the streaming spectrogram against scipy.signal.spectrogram
+
+.. module:: spectrogram tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import numpy as np
+import pytest
+
+from pyoad import spectrogram, read_counts, calibrate, Metrics
+from conftest import SAMPLING_RATE, STARTTIME
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_spectrogram_matches_scipy(deployment, workers):
+    '''
+    The frames run across the record and file boundaries, so the spectrogram of the files equals 
+    scipy.signal.spectrogram of the calibrated samples of the whole deployment
+    '''
+
+    from scipy.signal import spectrogram as scipy_spectrogram
+
+    nperseg = 1000
+    spectra = spectrogram(deployment, nperseg=nperseg, overlap=0.5, chunk_size=3, workers=workers, metrics=Metrics())
+
+    data = []
+    for file_name in deployment:
+        Header, counts = read_counts(file_name, range(8))
+        data.append(np.concatenate(list(calibrate(counts, Header)), axis=-1))
+    data = np.concatenate(data, axis=-1).astype(np.float64)
+
+    frequency, time, psd = scipy_spectrogram(data, SAMPLING_RATE, window='hann', nperseg=nperseg, 
+                                             noverlap=nperseg//2)
+
+    np.testing.assert_allclose(spectra['frequency'].values, frequency)
+    assert spectra['psd'].shape == (4, len(time), len(frequency))
+
+    # the time of a frame is its start, scipy gives the centre
+    start = (spectra['time'].values - STARTTIME)/np.timedelta64(1, 's')
+    np.testing.assert_allclose(start, time - nperseg/2/SAMPLING_RATE, atol=1e-6)
+
+    # float32 samples and FFT
+    reference = psd.transpose(0, 2, 1)
+    np.testing.assert_allclose(spectra['psd'].values, reference, rtol=1e-3, atol=1e-5*reference.max())
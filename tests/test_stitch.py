@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the continuous streams stitched from consecutive files
+
+.. module:: stitch tests
+
+:author:
+    Gil Averbuch (gil.averbuch@whoi.edu)
+
+:copyright:
+    Gil Averbuch
+
+:license:
+    This code is distributed under the terms of the
+    GNU General Public License, Version 3
+    (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+import numpy as np
+import pytest
+
+from pyoad import read_continuous, write_synthetic
+from conftest import write_files, NPTS, RECORDS
+
+
+def test_contiguous_files(deployment):
+    '''
+    Contiguous files are one trace per channel without gaps
+    '''
+
+    Header, Waveforms, gaps = read_continuous(deployment)
+
+    assert gaps.empty
+    assert len(Waveforms) == 4
+    assert all(tr.stats.npts == 3*RECORDS*NPTS for tr in Waveforms)
+
+
+
+def test_gap_is_reported(tmp_path):
+    '''
+    A gap between files is reported with its size and splits the traces, the xarray output fills it
+    '''
+
+    files = write_files(tmp_path, 2, gap=1000)
+    Header, Waveforms, gaps = read_continuous(files)
+
+    assert gaps[['record', 'type', 'samples']].values.tolist() == [[0, 'gap', 1000]]
+    assert gaps['file_name'].tolist() == [files[1]]
+    assert len(Waveforms) == 8
+    assert Waveforms[1].stats.starttime - Waveforms[0].stats.endtime == pytest.approx((1000 + 1)/2000)
+
+    Header, DataArray, gaps = read_continuous(files, output='xarray')
+    assert DataArray.shape == (4, 2*RECORDS*NPTS + 1000)
+    assert np.isnan(DataArray.values[:, RECORDS*NPTS:RECORDS*NPTS + 1000]).all()
+    assert not np.isnan(DataArray.values[:, RECORDS*NPTS + 1000:]).any()
+
+
+
+def test_clock_jump_is_not_allocated(tmp_path):
+    '''
+    A gap longer than max_gap is not filled in the xarray output, the time coordinate jumps over it
+    '''
+
+    write_synthetic(str(tmp_path / 'a.D01'), RECORDS, npts=NPTS, starttime='2021-01-01T00:00:00')
+    write_synthetic(str(tmp_path / 'b.D01'), RECORDS, npts=NPTS, starttime='2031-01-01T00:00:00', seed=1)
+    files = [str(tmp_path / 'a.D01'), str(tmp_path / 'b.D01')]
+
+    with pytest.warns(UserWarning, match='max_gap'):
+        Header, DataArray, gaps = read_continuous(files, output='xarray')
+
+    assert DataArray.shape == (4, 2*RECORDS*NPTS)
+    assert DataArray.time.values[RECORDS*NPTS] == np.datetime64('2031-01-01T00:00:00')
+    assert gaps['type'].tolist() == ['gap']
+
+
+
+def test_other_shru_is_rejected(tmp_path):
+    '''
+    Files of another SHRU are not stitched
+    '''
+
+    write_synthetic(str(tmp_path / 'a.D01'), RECORDS, npts=NPTS, starttime='2021-01-01T00:00:00')
+    write_synthetic(str(tmp_path / 'b.D01'), RECORDS, npts=NPTS, starttime='2021-01-01T00:00:10', shru_num=2)
+
+    with pytest.raises(ValueError, match='shru_num'):
+        read_continuous([str(tmp_path / 'a.D01'), str(tmp_path / 'b.D01')])